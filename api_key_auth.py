@@ -1,12 +1,13 @@
-from fastapi import HTTPException, status, Request
+from fastapi import HTTPException, status
+from starlette.requests import HTTPConnection
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-def ensure_valid_api_key(request: Request):
-    """Simple API key validation using request headers"""
+def ensure_valid_api_key(request: HTTPConnection):
+    """Simple API key validation using request headers (of an HTTP request or a WebSocket handshake)"""
     api_key = request.headers.get("x-api-key") or request.headers.get("authorization", "").replace("Bearer ", "")
     
     if not api_key:
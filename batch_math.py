@@ -0,0 +1,203 @@
+"""
+Batch arithmetic for the batch_math tool.
+
+``add_numbers`` adds one pair of numbers per JSON-RPC call. ``batch_math``
+takes whole arrays and runs one operation over all of them:
+
+- element-wise ``add``, ``sub``, ``mul`` and ``div`` of ``a`` and ``b``
+  (``b`` may also be a single number, applied to every element);
+- reductions ``sum``, ``mean``, ``min`` and ``max`` of ``a``, or of the
+  element-wise result when ``reduce`` is given (``mul`` + ``sum`` is a
+  dot product).
+
+Operands are JSON arrays of numbers or base64 strings of little-endian
+float64 values. Base64 is about a third smaller than JSON text for
+full-precision floats and decodes without parsing every number. Arrays
+are returned in the encoding of the input unless ``encoding`` says
+otherwise. Non-finite values (from NaN/inf inputs) are returned as null
+in JSON arrays.
+
+NumPy does the arithmetic when it is installed; otherwise a pure Python
+fallback gives the same results, more slowly.
+"""
+
+import array
+import base64
+import binascii
+import math
+import operator
+import os
+import sys
+from typing import Any, Dict, List, Tuple, Union
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+ELEMENTWISE_OPERATIONS = ("add", "sub", "mul", "div")
+REDUCTIONS = ("sum", "mean", "min", "max")
+OPERATIONS = ELEMENTWISE_OPERATIONS + REDUCTIONS
+ENCODINGS = ("json", "base64")
+
+# Upper bound on the elements of one operand
+MAX_ELEMENTS = int(os.getenv("BATCH_MATH_MAX_ELEMENTS", "1000000"))
+
+_PYTHON_OPERATORS = {"add": operator.add, "sub": operator.sub, "mul": operator.mul, "div": operator.truediv}
+
+
+class BatchMathError(ValueError):
+    """Raised for operands or operations batch_math can't handle."""
+
+
+def encode_float64(values) -> str:
+    """Base64 of the values as little-endian float64."""
+    if NUMPY_AVAILABLE:
+        return base64.b64encode(np.ascontiguousarray(values, dtype="<f8").tobytes()).decode("ascii")
+    buffer = array.array("d", values)
+    if sys.byteorder == "big":
+        buffer.byteswap()
+    return base64.b64encode(buffer.tobytes()).decode("ascii")
+
+
+def decode_float64(data: str, name: str = "value"):
+    """Values of a base64 string of little-endian float64 (a NumPy array, or a list without NumPy)."""
+    if len(data) > (MAX_ELEMENTS * 8 + 2) // 3 * 4:
+        raise BatchMathError(f"{name} has more than {MAX_ELEMENTS} values")
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise BatchMathError(f"{name} is not valid base64") from None
+    if len(raw) % 8:
+        raise BatchMathError(f"{name} must decode to a multiple of 8 bytes (float64 values)")
+    if NUMPY_AVAILABLE:
+        return np.frombuffer(raw, dtype="<f8")
+    buffer = array.array("d", raw)
+    if sys.byteorder == "big":
+        buffer.byteswap()
+    return buffer.tolist()
+
+
+def _decode_operand(value: Any, name: str, allow_scalar: bool = False) -> Tuple[Any, bool]:
+    """Return (values, was_base64); values is a float for a scalar operand."""
+    if isinstance(value, str):
+        return decode_float64(value, name), True
+    if allow_scalar and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), False
+    if not isinstance(value, list):
+        raise BatchMathError(f"{name} must be an array of numbers or a base64 float64 string")
+    if len(value) > MAX_ELEMENTS:
+        raise BatchMathError(f"{name} has more than {MAX_ELEMENTS} values")
+    if NUMPY_AVAILABLE:
+        try:
+            values = np.asarray(value)
+        except (ValueError, TypeError):
+            # Ragged or nested arrays; name the offending element
+            _check_numbers(value, name)
+            raise BatchMathError(f"{name} must be an array of numbers") from None
+        # NumPy turns booleans into numbers, alone or mixed with ints and floats;
+        # reject them (and name the element) like the fallback does
+        if values.ndim != 1 or (values.size and values.dtype.kind not in "iuf") or bool in set(map(type, value)):
+            _check_numbers(value, name)
+            raise BatchMathError(f"{name} must be an array of numbers")
+        return values.astype(np.float64, copy=False), False
+    _check_numbers(value, name)
+    return [float(item) for item in value], False
+
+
+def _check_numbers(values: List[Any], name: str):
+    for i, item in enumerate(values):
+        if not isinstance(item, (int, float)) or isinstance(item, bool):
+            raise BatchMathError(f"{name}[{i}] must be a number")
+
+
+def _elementwise(op: str, a, b):
+    if isinstance(b, float):
+        if op == "div" and b == 0:
+            raise BatchMathError("Division by zero: b is 0")
+    elif len(a) != len(b):
+        raise BatchMathError(f"a and b must have the same length ({len(a)} != {len(b)})")
+
+    if NUMPY_AVAILABLE:
+        if op == "div" and not isinstance(b, float):
+            zeros = np.flatnonzero(b == 0)
+            if zeros.size:
+                raise BatchMathError(f"Division by zero: b[{int(zeros[0])}] is 0")
+        return {"add": np.add, "sub": np.subtract, "mul": np.multiply, "div": np.divide}[op](a, b)
+
+    apply = _PYTHON_OPERATORS[op]
+    if isinstance(b, float):
+        return [apply(x, b) for x in a]
+    if op == "div":
+        for i, y in enumerate(b):
+            if y == 0:
+                raise BatchMathError(f"Division by zero: b[{i}] is 0")
+    return [apply(x, y) for x, y in zip(a, b)]
+
+
+def _reduce(reduction: str, values) -> float:
+    if len(values) == 0:
+        if reduction == "sum":
+            return 0.0
+        raise BatchMathError(f"{reduction} needs at least one value")
+    if NUMPY_AVAILABLE:
+        return float({"sum": np.sum, "mean": np.mean, "min": np.min, "max": np.max}[reduction](values))
+    if reduction == "sum":
+        return math.fsum(values)
+    if reduction == "mean":
+        return math.fsum(values) / len(values)
+    return min(values) if reduction == "min" else max(values)
+
+
+def _finite_or_none(value: float):
+    return value if math.isfinite(value) else None
+
+
+def _json_values(values) -> List[Union[float, None]]:
+    if NUMPY_AVAILABLE:
+        if np.isfinite(values).all():
+            return values.tolist()
+        values = values.tolist()
+    return [_finite_or_none(value) for value in values]
+
+
+def run_batch_math(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a batch_math call and return its result document."""
+    op = arguments.get("op")
+    if op not in OPERATIONS:
+        raise BatchMathError(f"op must be one of: {', '.join(OPERATIONS)}")
+    reduction = arguments.get("reduce")
+    if reduction is not None and (reduction not in REDUCTIONS or op not in ELEMENTWISE_OPERATIONS):
+        raise BatchMathError(f"reduce must be one of {', '.join(REDUCTIONS)} and needs an element-wise op")
+    encoding = arguments.get("encoding")
+    if encoding is not None and encoding not in ENCODINGS:
+        raise BatchMathError(f"encoding must be one of: {', '.join(ENCODINGS)}")
+    if "a" not in arguments:
+        raise BatchMathError("a is required")
+
+    a, base64_input = _decode_operand(arguments["a"], "a")
+    result = {"op": op, "count": len(a)}
+
+    if op in REDUCTIONS:
+        result["result"] = _finite_or_none(_reduce(op, a))
+        return result
+
+    if "b" not in arguments:
+        raise BatchMathError(f"b is required for {op}")
+    b, b_base64 = _decode_operand(arguments["b"], "b", allow_scalar=True)
+    values = _elementwise(op, a, b)
+
+    if reduction is not None:
+        result["reduce"] = reduction
+        result["result"] = _finite_or_none(_reduce(reduction, values))
+        return result
+
+    encoding = encoding or ("base64" if base64_input or b_base64 else "json")
+    result["encoding"] = encoding
+    if encoding == "base64":
+        result["dtype"] = "float64"
+        result["result"] = encode_float64(values)
+    else:
+        result["result"] = _json_values(values)
+    return result
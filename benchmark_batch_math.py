@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark batch_math against individual add_numbers calls.
+
+For each size N, adds N random pairs through the MCP server four ways:
+
+- N sequential ``add_numbers`` calls (one round trip each);
+- N concurrent ``add_numbers`` calls over the same connection;
+- one ``batch_math`` call with JSON arrays;
+- one ``batch_math`` call with base64 float64 buffers.
+
+The batch results are checked against the individual sums. Pairs are
+random so add_numbers results aren't served from the tool cache.
+
+    python benchmark_batch_math.py
+    python benchmark_batch_math.py --sizes 100,1000,10000,100000
+    python benchmark_batch_math.py --url https://<app>/mcp --api-key <key>
+
+Without ``--url`` a stdio server (simple_mcp_server.py) is started.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from batch_math import NUMPY_AVAILABLE, decode_float64, encode_float64
+from mcp_client import HttpTransport, MCPClient, StdioTransport
+
+# Individual calls above this size take too long to be worth timing
+MAX_INDIVIDUAL_CALLS = 10000
+
+
+async def timed(coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def add_sequentially(client, pairs):
+    return [await client.call_tool_text("add_numbers", {"a": a, "b": b}) for a, b in pairs]
+
+
+async def add_concurrently(client, pairs):
+    return await asyncio.gather(*(client.call_tool_text("add_numbers", {"a": a, "b": b}) for a, b in pairs))
+
+
+async def batch_add(client, a, b, base64_input):
+    if base64_input:
+        arguments = {"op": "add", "a": encode_float64(a), "b": encode_float64(b)}
+    else:
+        arguments = {"op": "add", "a": a, "b": b}
+    result = json.loads(await client.call_tool_text("batch_math", arguments))
+    values = result["result"]
+    return decode_float64(values) if result["encoding"] == "base64" else values
+
+
+def report(label, elapsed_ms, size, baseline_ms=None):
+    speedup = f"  {baseline_ms / elapsed_ms:8.1f}x" if baseline_ms else ""
+    print(f"   {label:<28} {elapsed_ms:10.1f} ms {elapsed_ms * 1000 / size:10.2f} µs/pair{speedup}")
+
+
+async def run_benchmark(sizes, url=None, api_key=None):
+    transport = HttpTransport(url, api_key=api_key) if url else StdioTransport()
+    async with MCPClient(transport, client_name="benchmark-batch-math") as client:
+        print(f"🔧 Server: {client.server_info.get('name', 'unknown')} ({url or 'stdio'}), "
+              f"local NumPy: {'yes' if NUMPY_AVAILABLE else 'no'}")
+        # Warm up the connection and the server's batch_math import
+        await client.call_tool_text("batch_math", {"op": "add", "a": [1.0], "b": [2.0]})
+
+        for size in sizes:
+            a = [random.uniform(-1e6, 1e6) for _ in range(size)]
+            b = [random.uniform(-1e6, 1e6) for _ in range(size)]
+            expected = [x + y for x, y in zip(a, b)]
+            print(f"\n📊 {size} pairs")
+
+            baseline_ms = None
+            if size <= MAX_INDIVIDUAL_CALLS:
+                _, baseline_ms = await timed(add_sequentially(client, list(zip(a, b))))
+                report("add_numbers, sequential", baseline_ms, size)
+                _, elapsed_ms = await timed(add_concurrently(client, list(zip(a, b))))
+                report("add_numbers, concurrent", elapsed_ms, size, baseline_ms)
+            else:
+                print(f"   (individual add_numbers calls skipped above {MAX_INDIVIDUAL_CALLS} pairs)")
+
+            for label, base64_input in (("batch_math, JSON arrays", False), ("batch_math, base64 float64", True)):
+                values, elapsed_ms = await timed(batch_add(client, a, b, base64_input))
+                report(label, elapsed_ms, size, baseline_ms)
+                if list(values) != expected:
+                    print(f"   ❌ {label} returned different sums")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch_math against individual add_numbers calls")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma-separated numbers of pairs")
+    parser.add_argument("--url", help="HTTP MCP endpoint (default: start a stdio server)")
+    parser.add_argument("--api-key", help="API key for --url")
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark([int(size) for size in args.sizes.split(",")], args.url, args.api_key))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark stdio server startup.
+
+Spawns simple_mcp_server.py repeatedly and measures the time until the
+initialize response arrives (time to first response) and until a first
+add_numbers call is answered. It also reports the ``-X importtime`` cost
+of importing the server module, with the slowest top-level imports, so a
+heavy dependency creeping back into the startup path shows up:
+
+    python benchmark_startup.py
+    python benchmark_startup.py --runs 20 --max-first-response-ms 300
+    python benchmark_startup.py --zygote
+
+``--zygote`` also starts the server in zygote mode (zygote.py) and times
+new sessions opened on its Unix socket.
+
+With ``--max-first-response-ms`` or ``--max-import-ms`` the script exits
+with status 1 when the median exceeds the limit, so it can run in CI.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(SERVER_DIR, "simple_mcp_server.py")
+
+INITIALIZE = {
+    "jsonrpc": "2.0", "id": 1, "method": "initialize",
+    "params": {"protocolVersion": "2024-11-05", "capabilities": {},
+               "clientInfo": {"name": "benchmark-startup", "version": "1.0.0"}}
+}
+ADD_NUMBERS = {
+    "jsonrpc": "2.0", "id": 2, "method": "tools/call",
+    "params": {"name": "add_numbers", "arguments": {"a": 1, "b": 2}}
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def time_session():
+    """Spawn the server; return (ms to initialize response, ms to first tool response)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        cwd=SERVER_DIR,
+    )
+    try:
+        process.stdin.write((json.dumps(INITIALIZE) + "\n").encode("utf-8"))
+        process.stdin.flush()
+        json.loads(process.stdout.readline())
+        first_response = (time.perf_counter() - started) * 1000
+
+        process.stdin.write((json.dumps(ADD_NUMBERS) + "\n").encode("utf-8"))
+        process.stdin.flush()
+        json.loads(process.stdout.readline())
+        first_tool = (time.perf_counter() - started) * 1000
+    finally:
+        process.stdin.close()
+        process.wait()
+    return first_response, first_tool
+
+
+def time_zygote_sessions(runs):
+    """Start a zygote server; return ms from connect to initialize response for each new session."""
+    socket_path = os.path.join(tempfile.mkdtemp(), "mcp.sock")
+    zygote = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--zygote", socket_path],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=SERVER_DIR,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(socket_path):
+            if zygote.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Zygote server did not start")
+            time.sleep(0.01)
+
+        samples = []
+        for _ in range(runs + 1):
+            started = time.perf_counter()
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.connect(socket_path)
+                stream = connection.makefile("rwb")
+                stream.write((json.dumps(INITIALIZE) + "\n").encode("utf-8"))
+                stream.flush()
+                json.loads(stream.readline())
+                samples.append((time.perf_counter() - started) * 1000)
+                connection.shutdown(socket.SHUT_WR)
+                stream.read()  # Wait for the session to exit
+        return samples[1:]  # The first session warms the parent's pages
+    finally:
+        zygote.terminate()
+        zygote.wait()
+
+
+def measure_imports():
+    """Return (total ms to import the server module, [(ms, module)] for its slowest direct imports)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import simple_mcp_server"],
+        capture_output=True, text=True, cwd=SERVER_DIR,
+    )
+    total = 0.0
+    top_level = []
+    children = []
+    # Modules are listed after the imports they trigger, indented by depth
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        milliseconds = int(cumulative) / 1000
+        if depth == 1:
+            children.append((milliseconds, name.strip()))
+        elif depth == 0:
+            if name.strip() == "simple_mcp_server":
+                total, top_level = milliseconds, children
+            children = []
+    return total, sorted(top_level, reverse=True)
+
+
+def run_benchmark(runs=10, max_first_response_ms=None, max_import_ms=None, zygote=False):
+    print(f"🚀 Spawning {os.path.basename(SERVER_SCRIPT)} {runs} times...")
+    time_session()  # Warm the OS file cache and __pycache__
+    first_responses, first_tools = [], []
+    for _ in range(runs):
+        first_response, first_tool = time_session()
+        first_responses.append(first_response)
+        first_tools.append(first_tool)
+
+    print(f"   initialize response: median {statistics.median(first_responses):7.1f} ms, p95 {percentile(first_responses, 0.95):7.1f} ms")
+    print(f"   first add_numbers:   median {statistics.median(first_tools):7.1f} ms, p95 {percentile(first_tools, 0.95):7.1f} ms")
+
+    if zygote:
+        sessions = time_zygote_sessions(runs)
+        print(f"   zygote session:      median {statistics.median(sessions):7.1f} ms, p95 {percentile(sessions, 0.95):7.1f} ms")
+
+    import_samples = []
+    top_level = []
+    for _ in range(min(runs, 5)):
+        total, top_level = measure_imports()
+        import_samples.append(total)
+    import_ms = statistics.median(import_samples)
+    print(f"\n📦 import simple_mcp_server: {import_ms:.1f} ms (median of {len(import_samples)})")
+    for milliseconds, name in top_level[:8]:
+        print(f"   {milliseconds:7.1f} ms  {name}")
+
+    failed = False
+    if max_first_response_ms is not None and statistics.median(first_responses) > max_first_response_ms:
+        print(f"\n❌ Time to first response exceeds {max_first_response_ms:g} ms")
+        failed = True
+    if max_import_ms is not None and import_ms > max_import_ms:
+        print(f"\n❌ Import time exceeds {max_import_ms:g} ms")
+        failed = True
+    if not failed and (max_first_response_ms is not None or max_import_ms is not None):
+        print("\n✅ Startup is within limits")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark stdio MCP server startup")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-first-response-ms", type=float, help="Fail if the median time to first response is higher")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if the median import time is higher")
+    parser.add_argument("--zygote", action="store_true", help="Also time sessions forked by a zygote server")
+    args = parser.parse_args()
+    sys.exit(0 if run_benchmark(args.runs, args.max_first_response_ms, args.max_import_ms, args.zygote) else 1)
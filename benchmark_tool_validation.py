@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-call overhead of tool argument validation.
+
+Times the precompiled validators from tool_validation.py on valid and
+invalid arguments for the server's tools, and compares them with a
+generic jsonschema validator when that package is installed:
+
+    python benchmark_tool_validation.py
+    python benchmark_tool_validation.py --iterations 200000
+"""
+
+import argparse
+import time
+
+from simple_mcp_server import SimpleMCPServer
+from tool_validation import ToolArgumentError, compile_tool_validators
+
+try:
+    import jsonschema
+    JSONSCHEMA_AVAILABLE = True
+except ImportError:
+    JSONSCHEMA_AVAILABLE = False
+
+CASES = [
+    ("add_numbers", {"a": 1, "b": 2.5}),
+    ("add_numbers", {"a": "1", "b": 2}),
+    ("save_twin_info", {"firstName": "Jane", "lastName": "Doe", "email": "jane@example.com",
+                        "telephoneNumber": "+1 555 0100", "countryId": "US"}),
+    ("save_twin_info", {"firstName": "Jane", "lastName": "", "email": "jane@example.com",
+                        "telephoneNumber": "+1 555 0100", "countryId": "US"}),
+    ("query_twins", {"fields": ["id", "Profile.email"],
+                     "filters": [{"field": "CountryID", "op": "eq", "value": "US"},
+                                 {"field": "Profile.lastName", "op": "startswith", "value": "D"}],
+                     "limit": 100}),
+]
+
+
+def time_per_call(validate, arguments, iterations):
+    """Return microseconds per validation call."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            validate(arguments)
+        except Exception:
+            pass
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run_benchmark(iterations=100000):
+    tools = SimpleMCPServer().tools
+
+    started = time.perf_counter()
+    validators = compile_tool_validators(tools)
+    print(f"🔧 Compiled {len(validators)} validators in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    if JSONSCHEMA_AVAILABLE:
+        generic = {name: jsonschema.Draft7Validator(tool["inputSchema"]) for name, tool in tools.items()}
+    else:
+        print("💡 Install jsonschema to compare with a generic validator: pip install jsonschema")
+
+    print(f"\n{'tool':<16}{'valid':<8}{'compiled µs':>14}{'jsonschema µs':>16}")
+    for tool_name, arguments in CASES:
+        validator = validators[tool_name]
+        try:
+            validator(arguments, "")
+            valid = "yes"
+        except ToolArgumentError:
+            valid = "no"
+
+        compiled_us = time_per_call(lambda args: validator(args, ""), arguments, iterations)
+        if JSONSCHEMA_AVAILABLE:
+            generic_us = f"{time_per_call(generic[tool_name].validate, arguments, iterations // 10):.2f}"
+        else:
+            generic_us = "-"
+        print(f"{tool_name:<16}{valid:<8}{compiled_us:>14.2f}{generic_us:>16}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark tool argument validation")
+    parser.add_argument("--iterations", type=int, default=100000, help="Calls per case (default: 100000)")
+    args = parser.parse_args()
+
+    run_benchmark(args.iterations)
@@ -0,0 +1,286 @@
+"""
+Process-wide Cosmos DB storage shared by the servers and the scripts.
+
+One CosmosClient per process, built on a pooled keep-alive HTTP session,
+owns the TwinHumanDB database, the TwinHumanContainer container and the
+TwinEmailIndex lookup container. The container metadata and partition
+routing caches are warmed when the storage is first created, so the first
+request after startup doesn't pay for connection setup and metadata
+lookups. ``storage.aio`` exposes the same containers to asyncio code
+without blocking the event loop, and ``storage.writes`` runs writes under
+an adaptive, throttle-aware concurrency controller (cosmos_throttle.py).
+TWIN_PARTITIONING can move Twins to a container partitioned on a
+synthetic CountryID + hash bucket key (twin_partitioning.py), and
+``storage.telemetry`` tracks the traffic per partition key value
+(partition_telemetry.py).
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+from typing import Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+    from azure.core.pipeline.transport import RequestsTransport
+    from azure.cosmos import CosmosClient, PartitionKey
+    from azure.cosmos.exceptions import CosmosResourceExistsError
+    COSMOS_AVAILABLE = True
+except ImportError:
+    COSMOS_AVAILABLE = False
+
+from cosmos_throttle import AdaptiveConcurrencyController
+from partition_telemetry import PartitionTelemetry
+from request_scope import storage_options
+from twin_index import INDEX_CONTAINER_NAME, get_or_create_index_container
+from twin_partitioning import (
+    SYNTHETIC_CONTAINER_NAME, CountryPartitioning, partitioning_mode,
+    synthetic_partitioning_from_env
+)
+
+DATABASE_NAME = "TwinHumanDB"
+CONTAINER_NAME = "TwinHumanContainer"
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+if COSMOS_AVAILABLE:
+    class KeepAliveAdapter(HTTPAdapter):
+        """HTTP adapter with a larger connection pool and TCP keep-alive enabled."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+            super().init_poolmanager(*args, **kwargs)
+
+
+def create_cosmos_client(endpoint: str, key: str, **kwargs):
+    """Create a CosmosClient on a pooled keep-alive session.
+
+    Pool size and timeouts come from COSMOS_POOL_SIZE (default 32) and
+    COSMOS_CONNECTION_TIMEOUT (seconds, default 10). Extra keyword
+    arguments are passed to CosmosClient.
+    """
+    pool_size = int(os.getenv("COSMOS_POOL_SIZE", "32"))
+    session = requests.Session()
+    adapter = KeepAliveAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(session=session, session_owner=False)
+    return CosmosClient(
+        endpoint,
+        key,
+        transport=transport,
+        connection_timeout=int(os.getenv("COSMOS_CONNECTION_TIMEOUT", "10")),
+        **kwargs
+    )
+
+
+class AsyncContainer:
+    """Asyncio facade over a sync container: each call runs in a worker thread.
+
+    Sharing the warmed sync client keeps a single connection pool and
+    metadata cache per process.
+    """
+
+    def __init__(self, container):
+        self.container = container
+
+    async def read_item(self, *args, **kwargs):
+        return await asyncio.to_thread(self.container.read_item, *args, **kwargs)
+
+    async def upsert_item(self, *args, **kwargs):
+        return await asyncio.to_thread(self.container.upsert_item, *args, **kwargs)
+
+    async def replace_item(self, *args, **kwargs):
+        return await asyncio.to_thread(self.container.replace_item, *args, **kwargs)
+
+    async def delete_item(self, *args, **kwargs):
+        return await asyncio.to_thread(self.container.delete_item, *args, **kwargs)
+
+    async def query_items(self, *args, **kwargs):
+        """Run a query to completion and return the results as a list."""
+        return await asyncio.to_thread(lambda: list(self.container.query_items(*args, **kwargs)))
+
+    async def run(self, function, *args, **kwargs):
+        """Run any blocking storage call (e.g. a service method) off the event loop."""
+        return await asyncio.to_thread(function, *args, **kwargs)
+
+
+class CosmosStorage:
+    """The shared client with its database and containers.
+
+    ``container`` is the Twin container reads and writes go to and
+    ``partitioning`` describes its partition key (twin_partitioning.py).
+    During a migration to synthetic partition keys, ``shadow_container``
+    receives a copy of every write.
+    """
+
+    def __init__(self, client, database, container, index_container, partitioning=None,
+                 shadow_container=None, shadow_partitioning=None):
+        self.client = client
+        self.database = database
+        self.container = container
+        self.index_container = index_container
+        self.partitioning = partitioning or CountryPartitioning()
+        self.shadow_container = shadow_container
+        self.shadow_partitioning = shadow_partitioning
+        self.shadow_failures = 0
+        self.telemetry = PartitionTelemetry.from_env()
+        self.aio = AsyncContainer(container)
+        self.writes = AdaptiveConcurrencyController(
+            initial_limit=float(os.getenv("COSMOS_WRITE_CONCURRENCY", "8")),
+            max_limit=float(os.getenv("COSMOS_WRITE_MAX_CONCURRENCY", "64")),
+            deadline_seconds=float(os.getenv("COSMOS_WRITE_DEADLINE_SECONDS", "30")),
+        )
+
+    async def upsert_twin(self, document, deadline=None):
+        """Upsert a Twin document under the adaptive write controller."""
+        return await self.writes.run(self._upsert_twin, document, deadline=deadline)
+
+    def _upsert_twin(self, document):
+        # Runs in a worker thread, which carries the calling tool's deadline
+        document = self.partitioning.prepare(document)
+        partition_key = self.partitioning.partition_key_of(document)
+        try:
+            saved = self.container.upsert_item(
+                body=document, response_hook=self.telemetry.response_hook(partition_key, "write"), **storage_options()
+            )
+        except Exception as e:
+            self.telemetry.record_error(partition_key, "write", e)
+            raise
+
+        if self.shadow_container is not None:
+            # The original container stays authoritative; migrate_partitioning.py --overwrite repairs misses
+            try:
+                self.shadow_container.upsert_item(body=self.shadow_partitioning.prepare(document), **storage_options())
+            except Exception as e:
+                self.shadow_failures += 1
+                print(f"Warning: write to {SYNTHETIC_CONTAINER_NAME} failed: {str(e)}", file=sys.stderr)
+        return saved
+
+    def partition_stats(self, top: int = 10, sort_by: str = "ops"):
+        """Partitioning layout and the hottest partitions, for /metrics."""
+        stats = {"layout": self.partitioning.describe(), "traffic": self.telemetry.stats(top, sort_by)}
+        if self.shadow_container is not None:
+            stats["shadow"] = dict(self.shadow_partitioning.describe(), failures=self.shadow_failures)
+        return stats
+
+    def warm(self):
+        """Populate the SDK's container metadata and partition routing caches."""
+        try:
+            self.container.read()
+            self.index_container.read()
+            if self.shadow_container is not None:
+                self.shadow_container.read()
+            list(self.container.read_feed_ranges())
+        except Exception as e:
+            print(f"Warning: failed to warm Cosmos DB metadata cache: {str(e)}", file=sys.stderr)
+
+
+def _bootstrap(create_if_missing: bool, sdk_throttle_retries: Optional[int]) -> Optional[CosmosStorage]:
+    if not COSMOS_AVAILABLE:
+        print("Warning: Azure Cosmos DB SDK not available. Twin storage functionality disabled.", file=sys.stderr)
+        return None
+
+    # Get Cosmos DB configuration from environment variables
+    cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
+    cosmos_key = os.getenv("COSMOS_KEY")
+
+    if not cosmos_endpoint or not cosmos_key:
+        print("Warning: COSMOS_ENDPOINT and COSMOS_KEY environment variables not set. Twin storage functionality disabled.", file=sys.stderr)
+        return None
+
+    client_options = {}
+    if sdk_throttle_retries is not None:
+        # The SDK treats 0 as "use the default", so 1 is the lowest setting
+        client_options["retry_throttle_total"] = max(1, sdk_throttle_retries)
+    client = create_cosmos_client(cosmos_endpoint, cosmos_key, **client_options)
+
+    if not create_if_missing:
+        database = client.get_database_client(DATABASE_NAME)
+        container = database.get_container_client(CONTAINER_NAME)
+        index_container = database.get_container_client(INDEX_CONTAINER_NAME)
+        return _with_partitioning(client, database, container, index_container, create_if_missing)
+
+    # Create database if it doesn't exist
+    try:
+        database = client.create_database(id=DATABASE_NAME)
+    except CosmosResourceExistsError:
+        database = client.get_database_client(DATABASE_NAME)
+
+    # Create container if it doesn't exist
+    try:
+        # Don't set throughput for serverless accounts
+        container = database.create_container(
+            id=CONTAINER_NAME,
+            partition_key=PartitionKey(path="/CountryID")
+        )
+    except CosmosResourceExistsError:
+        container = database.get_container_client(CONTAINER_NAME)
+
+    index_container = get_or_create_index_container(database)
+    return _with_partitioning(client, database, container, index_container, create_if_missing)
+
+
+def get_or_create_synthetic_container(database, create_if_missing: bool = True):
+    """Return the container partitioned on the synthetic key, creating it if it doesn't exist."""
+    if not create_if_missing:
+        return database.get_container_client(SYNTHETIC_CONTAINER_NAME)
+    try:
+        return database.create_container(
+            id=SYNTHETIC_CONTAINER_NAME,
+            partition_key=PartitionKey(path=synthetic_partitioning_from_env().path)
+        )
+    except CosmosResourceExistsError:
+        return database.get_container_client(SYNTHETIC_CONTAINER_NAME)
+
+
+def _with_partitioning(client, database, container, index_container, create_if_missing: bool) -> CosmosStorage:
+    """Build the storage for the TWIN_PARTITIONING layout (see twin_partitioning.py)."""
+    mode = partitioning_mode()
+    if mode == "country":
+        return CosmosStorage(client, database, container, index_container)
+
+    synthetic_container = get_or_create_synthetic_container(database, create_if_missing)
+    if mode == "dual":
+        return CosmosStorage(client, database, container, index_container,
+                             shadow_container=synthetic_container,
+                             shadow_partitioning=synthetic_partitioning_from_env())
+    return CosmosStorage(client, database, synthetic_container, index_container,
+                         partitioning=synthetic_partitioning_from_env())
+
+
+def get_cosmos_storage(
+    create_if_missing: bool = True,
+    warm: bool = True,
+    sdk_throttle_retries: Optional[int] = None,
+) -> Optional[CosmosStorage]:
+    """Return the process-wide storage, creating and warming it on first use.
+
+    The servers pass a low ``sdk_throttle_retries`` so 429s reach the write
+    controller instead of being retried inside the SDK; scripts keep the SDK
+    default. Returns None when the SDK or the COSMOS_ENDPOINT / COSMOS_KEY
+    settings are missing, or when the account can't be reached.
+    """
+    global _storage
+    if _storage is not None:
+        return _storage
+
+    with _storage_lock:
+        if _storage is None:
+            try:
+                storage = _bootstrap(create_if_missing, sdk_throttle_retries)
+            except Exception as e:
+                print(f"Failed to initialize Cosmos DB: {str(e)}", file=sys.stderr)
+                return None
+            if storage is not None and warm:
+                storage.warm()
+            _storage = storage
+    return _storage
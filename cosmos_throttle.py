@@ -0,0 +1,187 @@
+"""
+Adaptive concurrency and 429-aware retry for Cosmos DB operations.
+
+When the account throttles (HTTP 429), retrying immediately from every
+worker turns a short burst into a retry storm. The controller here caps
+the number of concurrent operations with an AIMD policy (additive increase
+on success, multiplicative decrease on throttle), honors the retry-after
+hint Cosmos DB returns, adds jittered exponential backoff and gives up
+once a total deadline would be exceeded. Under sustained load throughput
+settles near the provisioned RU instead of collapsing.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from request_scope import RequestCancelledError, current_deadline
+
+
+class StorageThrottledError(Exception):
+    """Raised when an operation is still throttled at its deadline."""
+
+    def __init__(self, message: str, retry_after_ms: int = 0):
+        super().__init__(message)
+        self.retry_after_ms = retry_after_ms
+
+
+def is_throttle(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after_seconds(error: Exception) -> float:
+    """Return the server's retry-after hint in seconds (0 if there is none)."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("x-ms-retry-after-ms", 0)) / 1000.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class AdaptiveConcurrencyController:
+    """AIMD-limited concurrency with retry-after aware, jittered retries.
+
+    The limit grows by about ``increase`` per window of ``limit``
+    successful operations and is multiplied by ``decrease_factor`` on a
+    throttle (at most once per ``decrease_interval`` so one burst of 429s
+    doesn't collapse it to the minimum).
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        decrease_interval: float = 0.5,
+        base_backoff: float = 0.05,
+        max_backoff: float = 5.0,
+        deadline_seconds: float = 30.0,
+        window_seconds: float = 60.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.deadline_seconds = deadline_seconds
+        self.window_seconds = window_seconds
+        self.in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._last_decrease = 0.0
+        self._events: deque = deque(maxlen=10000)  # (timestamp, outcome) for rolling rates
+        self.totals = {"successes": 0, "throttles": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0}
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _acquire(self, deadline: float):
+        """Wait for a concurrency slot, but not past ``deadline``."""
+        condition = self._get_condition()
+
+        async def take_slot():
+            async with condition:
+                while self.in_flight >= max(1, int(self.limit)):
+                    await condition.wait()
+                self.in_flight += 1
+
+        try:
+            await asyncio.wait_for(take_slot(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            # Queued behind a shrunken limit until the deadline; the operation never reached Cosmos DB
+            self._record("deadline_exceeded")
+            raise RequestCancelledError("Request deadline exceeded") from None
+
+    async def _release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def _record(self, outcome: str):
+        self.totals[outcome] += 1
+        self._events.append((time.monotonic(), outcome))
+
+    def _on_success(self):
+        self._record("successes")
+        self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def _on_throttle(self):
+        self._record("throttles")
+        now = time.monotonic()
+        if now - self._last_decrease >= self.decrease_interval:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = now
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, but never sooner than the server asked for
+        jittered = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        return max(retry_after_seconds(error), jittered)
+
+    async def run(self, operation: Callable[..., Any], *args, deadline: Optional[float] = None, **kwargs) -> Any:
+        """Run a blocking storage operation in a worker thread under the controller.
+
+        ``deadline`` is an absolute ``time.monotonic()`` value; it defaults to
+        ``deadline_seconds`` from now, or the calling tool's deadline if that
+        is sooner.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_seconds
+        request_deadline = current_deadline()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline)
+
+        attempt = 0
+        while True:
+            await self._acquire(deadline)
+            try:
+                result = await asyncio.to_thread(operation, *args, **kwargs)
+            except Exception as e:
+                if not is_throttle(e):
+                    self._record("failures")
+                    raise
+                self._on_throttle()
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay > deadline:
+                    self._record("deadline_exceeded")
+                    raise StorageThrottledError(
+                        "Cosmos DB is throttling requests; retry later",
+                        retry_after_ms=int(delay * 1000)
+                    ) from e
+            else:
+                self._on_success()
+                return result
+            finally:
+                await self._release()
+
+            self._record("retries")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current limit, totals and per-second rates over the rolling window."""
+        cutoff = time.monotonic() - self.window_seconds
+        while self._events and self._events[0][0] < cutoff:
+            self._events.popleft()
+        window = {"successes": 0, "throttles": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0}
+        for _, outcome in self._events:
+            window[outcome] += 1
+        attempts = window["successes"] + window["throttles"] + window["failures"]
+        return {
+            "concurrencyLimit": round(self.limit, 2),
+            "inFlight": self.in_flight,
+            "totals": dict(self.totals),
+            "windowSeconds": self.window_seconds,
+            "successPerSecond": round(window["successes"] / self.window_seconds, 3),
+            "throttlePerSecond": round(window["throttles"] / self.window_seconds, 3),
+            "throttleRatio": round(window["throttles"] / attempts, 3) if attempts else 0.0,
+        }
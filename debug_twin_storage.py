@@ -12,6 +12,7 @@ from datetime import datetime
 sys.path.append(os.path.dirname(__file__))
 
 from simple_mcp_server import SimpleMCPServer
+from cosmos_storage import create_cosmos_client, get_cosmos_storage
 
 # Load environment variables
 try:
@@ -23,8 +24,8 @@ except ImportError:
 
 # Import Cosmos DB directly for verification
 try:
-    from azure.cosmos import CosmosClient, PartitionKey
-    from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
+    from azure.cosmos import PartitionKey
+    from azure.cosmos.exceptions import CosmosResourceExistsError
     COSMOS_AVAILABLE = True
     print("✅ Azure Cosmos DB SDK available")
 except ImportError:
@@ -53,8 +54,8 @@ async def test_direct_cosmos_connection():
             print("❌ Missing Cosmos DB configuration")
             return False
         
-        # Connect directly
-        client = CosmosClient(cosmos_endpoint, cosmos_key)
+        # Connect directly (same pooled transport the servers use)
+        client = create_cosmos_client(cosmos_endpoint, cosmos_key)
         print("✅ Cosmos DB client created")
         
         # Get or create database
@@ -139,6 +140,8 @@ async def test_mcp_server_with_debug():
     print("=" * 50)
     
     server = SimpleMCPServer()
+    # The server connects to Cosmos DB on the first storage tool call; connect now to inspect it
+    await server.ensure_storage()
     
     print(f"🔍 Server state:")
     print(f"   - cosmos_client: {server.cosmos_client is not None}")
@@ -200,17 +203,18 @@ async def test_mcp_server_with_debug():
                     # Try alternative approaches
                     print("\n🔍 Trying alternative verification...")
                     try:
-                        # Query for the document instead of direct read
-                        query = f"SELECT * FROM c WHERE c.id = '{test_twin['email']}'"
-                        items = list(server.container.query_items(query=query, enable_cross_partition_query=True))
-                        if items:
-                            print(f"✅ Found document via query!")
-                            print(f"📄 Found document: {json.dumps(items[0], indent=2)}")
+                        # Resolve the partition through the email index instead of a cross-partition query
+                        country_id = server.twin_index.lookup(test_twin['email'])
+                        print(f"🔍 Email index resolved CountryID: {country_id}")
+                        found = server.twin_index.read_twin(server.container, test_twin['email'], country_id)
+                        if found:
+                            print(f"✅ Found document via email index!")
+                            print(f"📄 Found document: {json.dumps(found, indent=2)}")
                             return True
                         else:
-                            print("❌ Document not found via query either")
+                            print("❌ Document not found via email index either")
                     except Exception as e2:
-                        print(f"❌ Query also failed: {e2}")
+                        print(f"❌ Index lookup also failed: {e2}")
                     
                     return False
             
@@ -236,11 +240,11 @@ async def list_existing_records():
             print("❌ Missing Cosmos DB configuration")
             return
         
-        client = CosmosClient(cosmos_endpoint, cosmos_key)
+        # Shared Cosmos DB client (see cosmos_storage.py)
+        storage = get_cosmos_storage(create_if_missing=False)
         
         try:
-            database = client.get_database_client("TwinHumanDB")
-            container = database.get_container_client("TwinHumanContainer")
+            container = storage.container
             
             # Query all items
             query = "SELECT * FROM c"
@@ -252,11 +256,13 @@ async def list_existing_records():
                 print("🔍 Container is empty - no records found")
             else:
                 for i, item in enumerate(items, 1):
+                    # Legacy documents keep the profile fields at the top level (see migrate_twins.py)
+                    profile = item.get('Profile') or item
                     print(f"\n📄 Record {i}:")
                     print(f"   ID: {item.get('id', 'N/A')}")
-                    print(f"   Name: {item.get('firstName', 'N/A')} {item.get('lastName', 'N/A')}")
-                    print(f"   Email: {item.get('email', 'N/A')}")
-                    print(f"   Country: {item.get('countryId', 'N/A')}")
+                    print(f"   Name: {profile.get('firstName', 'N/A')} {profile.get('lastName', 'N/A')}")
+                    print(f"   Email: {profile.get('email', 'N/A')}")
+                    print(f"   Country: {item.get('CountryID', 'N/A')}")
                     print(f"   Created: {item.get('createdAt', 'N/A')}")
                     
         except Exception as e:
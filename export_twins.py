@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Export the Twin container to compressed NDJSON or Parquet files.
+
+The container is split by feed ranges (or by CountryID partition key
+values) and the shards are read in parallel with bounded concurrency.
+Each shard streams page by page to its own output files, so memory stays
+bounded by the page size. Progress is checkpointed after every write, so
+an interrupted export resumes from where it stopped without duplicating
+rows:
+
+    python export_twins.py --output exports/2025-07-16
+    python export_twins.py --output exports/2025-07-16 --format parquet --concurrency 8
+
+Parquet output requires pyarrow.
+"""
+
+import os
+import gzip
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from dotenv import load_dotenv
+
+from cosmos_storage import get_cosmos_storage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+CHECKPOINT_FILE = "export_checkpoint.json"
+
+# Cosmos DB system properties that are meaningless outside the account
+SYSTEM_PROPERTIES = ("_rid", "_self", "_etag", "_attachments")
+
+PARQUET_COLUMNS = [
+    "id", "CountryID", "firstName", "lastName", "email",
+    "telephoneNumber", "createdAt", "lastModified", "format", "document",
+]
+
+
+def clean_document(item):
+    """Drop Cosmos DB system properties (keeps _ts)."""
+    return {k: v for k, v in item.items() if k not in SYSTEM_PROPERTIES}
+
+
+def flatten_twin(item):
+    """Flatten a Twin (Profile or old flat format) into the Parquet column layout."""
+    profile = item.get("Profile") or item
+    return {
+        "id": item.get("id"),
+        "CountryID": item.get("CountryID"),
+        "firstName": profile.get("firstName"),
+        "lastName": profile.get("lastName"),
+        "email": profile.get("email"),
+        "telephoneNumber": profile.get("telephoneNumber"),
+        "createdAt": item.get("createdAt"),
+        "lastModified": item.get("lastModified"),
+        "format": "new" if "Profile" in item else "old",
+        "document": json.dumps(item),
+    }
+
+
+class ExportProgress:
+    """Thread-safe row and request unit counters shared by all shard workers."""
+
+    def __init__(self):
+        self.rows = 0
+        self.request_charge = 0.0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows += count
+
+    def response_hook(self, headers, _result):
+        # Headers come from the shared client connection, so under concurrency the
+        # charge is attributed to whichever page finished last (totals stay close).
+        charge = float(headers.get("x-ms-request-charge", 0) or 0)
+        with self._lock:
+            self.request_charge += charge
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f"{self.rows} rows in {elapsed:.1f}s "
+                f"({self.rows / elapsed:.0f} rows/sec, {self.request_charge:.1f} RU, "
+                f"{self.request_charge / elapsed:.1f} RU/sec)")
+
+
+class ExportCheckpoint:
+    """Per-shard continuation tokens and file positions, persisted atomically."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def update_shard(self, name, **values):
+        with self._lock:
+            self.state["shards"][name].update(values)
+            self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, self.path)
+
+
+def plan_shards(container, split, partitioning):
+    """Split the container into independently readable shards."""
+    if split == "feed-range":
+        return {f"range-{i:03d}": {"feedRange": feed_range}
+                for i, feed_range in enumerate(container.read_feed_ranges())}
+
+    # One shard per logical partition: a CountryID, or a CountryID bucket with synthetic keys
+    key_property = partitioning.path.lstrip("/")
+    partition_keys = list(container.query_items(
+        query=f"SELECT DISTINCT VALUE c.{key_property} FROM c",
+        enable_cross_partition_query=True
+    ))
+    prefix = "partition" if partitioning.synthetic else "country"
+    return {f"{prefix}-{partition_key}": {"partitionKey": partition_key} for partition_key in partition_keys}
+
+
+def query_shard(container, scope, page_size, progress):
+    """Return a paged query over a single shard."""
+    kwargs = {"max_item_count": page_size, "response_hook": progress.response_hook}
+    if "feedRange" in scope:
+        kwargs["feed_range"] = scope["feedRange"]
+    else:
+        kwargs["partition_key"] = scope["partitionKey"]
+    return container.query_items(query="SELECT * FROM c", **kwargs)
+
+
+def export_shard_ndjson(container, name, checkpoint, output_dir, page_size, progress):
+    """Stream one shard into a gzip NDJSON file, one gzip member per page."""
+    shard = checkpoint.state["shards"][name]
+    path = os.path.join(output_dir, f"twins-{name}.ndjson.gz")
+    pages = query_shard(container, shard["scope"], page_size, progress).by_page(shard.get("continuation"))
+
+    with open(path, "ab") as f:
+        # Drop anything written after the last checkpoint by an interrupted run
+        f.truncate(shard.get("bytes", 0))
+        f.seek(shard.get("bytes", 0))
+        for page in pages:
+            lines = [json.dumps(clean_document(item)) for item in page]
+            if lines:
+                f.write(gzip.compress(("\n".join(lines) + "\n").encode("utf-8")))
+                f.flush()
+            progress.add_rows(len(lines))
+            checkpoint.update_shard(
+                name,
+                continuation=pages.continuation_token,
+                bytes=f.tell(),
+                rows=shard.get("rows", 0) + len(lines),
+            )
+
+    checkpoint.update_shard(name, done=True)
+
+
+def export_shard_parquet(container, name, checkpoint, output_dir, page_size, progress, rows_per_file):
+    """Stream one shard into numbered Parquet files of up to rows_per_file rows."""
+    shard = checkpoint.state["shards"][name]
+    pages = query_shard(container, shard["scope"], page_size, progress).by_page(shard.get("continuation"))
+    schema = pa.schema([(column, pa.string()) for column in PARQUET_COLUMNS])
+    buffered = []
+
+    def flush(continuation):
+        file_number = shard.get("files", 0)
+        path = os.path.join(output_dir, f"twins-{name}-{file_number:05d}.parquet")
+        table = pa.Table.from_pylist(buffered, schema=schema)
+        pq.write_table(table, path, compression="zstd")
+        progress.add_rows(len(buffered))
+        checkpoint.update_shard(
+            name,
+            continuation=continuation,
+            files=file_number + 1,
+            rows=shard.get("rows", 0) + len(buffered),
+        )
+        buffered.clear()
+
+    for page in pages:
+        buffered.extend(flatten_twin(item) for item in page)
+        if len(buffered) >= rows_per_file:
+            flush(pages.continuation_token)
+
+    if buffered:
+        flush(pages.continuation_token)
+    checkpoint.update_shard(name, done=True)
+
+
+def export_twins(output_dir, export_format="ndjson", split="feed-range", concurrency=4,
+                 page_size=1000, rows_per_file=50000):
+    """Export all Twin records, resuming from the checkpoint in output_dir if present"""
+
+    # Load environment variables
+    load_dotenv()
+
+    endpoint = os.getenv("COSMOS_ENDPOINT")
+    key = os.getenv("COSMOS_KEY")
+
+    if not endpoint or not key:
+        print("❌ Missing COSMOS_ENDPOINT or COSMOS_KEY environment variables")
+        return
+
+    if export_format == "parquet" and not PYARROW_AVAILABLE:
+        print("❌ Parquet export requires pyarrow. Install with: pip install pyarrow")
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Shared Cosmos DB client (see cosmos_storage.py)
+    storage = get_cosmos_storage(create_if_missing=False)
+    if storage is None:
+        print("❌ Could not connect to Cosmos DB")
+        return
+    container = storage.container
+
+    checkpoint = ExportCheckpoint(os.path.join(output_dir, CHECKPOINT_FILE))
+    if checkpoint.state:
+        if checkpoint.state.get("format") != export_format:
+            print(f"❌ {output_dir} holds a {checkpoint.state.get('format')} export; use a new output directory")
+            return
+        pending = [name for name, shard in checkpoint.state["shards"].items() if not shard.get("done")]
+        print(f"🔄 Resuming export: {len(pending)} of {len(checkpoint.state['shards'])} shards remaining")
+    else:
+        shards = plan_shards(container, split, storage.partitioning)
+        checkpoint.state = {
+            "format": export_format,
+            "split": split,
+            "shards": {name: {"scope": scope} for name, scope in shards.items()},
+        }
+        checkpoint.save()
+        pending = list(shards)
+        print(f"📦 Exporting {len(pending)} shards ({split}) with concurrency {concurrency}")
+
+    progress = ExportProgress()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if export_format == "parquet":
+            futures = [executor.submit(export_shard_parquet, container, name, checkpoint, output_dir,
+                                       page_size, progress, rows_per_file) for name in pending]
+        else:
+            futures = [executor.submit(export_shard_ndjson, container, name, checkpoint, output_dir,
+                                       page_size, progress) for name in pending]
+
+        not_done = futures
+        while not_done:
+            done, not_done = wait(not_done, timeout=5, return_when=FIRST_EXCEPTION)
+            print(f"⏳ {progress.report()}")
+            for future in done:
+                if future.exception():
+                    for other in not_done:
+                        other.cancel()
+                    print(f"❌ Export failed (rerun to resume): {future.exception()}")
+                    return
+
+    print(f"✅ Export complete: {progress.report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Twin container to NDJSON or Parquet")
+    parser.add_argument("--output", required=True, help="Output directory (also holds the resume checkpoint)")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson", help="Output format (default: ndjson)")
+    parser.add_argument("--split", choices=["feed-range", "partition-key"], default="feed-range", help="How to split the container into shards (default: feed-range)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Shards read in parallel (default: 4)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Documents per query page (default: 1000)")
+    parser.add_argument("--rows-per-file", type=int, default=50000, help="Rows per Parquet file (default: 50000)")
+    args = parser.parse_args()
+
+    export_twins(args.output, args.format, args.split, args.concurrency, args.page_size, args.rows_per_file)
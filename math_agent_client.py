@@ -5,12 +5,17 @@ and provides timestamps using the MCP server.
 
 import os
 import asyncio
-import json
 from dotenv import load_dotenv
 
+from mcp_client import SharedMCPClient
+from tool_plan import run_tool_plan
+
 # Load environment variables
 load_dotenv()
 
+# MCP server connection shared by the Math Agent's tool functions
+mcp_connection = SharedMCPClient(client_name="math-agent")
+
 # Check if AutoGen is available
 try:
     from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
@@ -70,140 +75,27 @@ Always be precise, helpful, and include timestamps for all calculations!
 # 🎯 MCP SERVER INTEGRATION FOR MATH AGENT
 # ============================================================================
 
-async def mcp_add_numbers_for_math_agent(a: float, b: float) -> str:
-    """Connect to MCP server to perform addition."""
-    print(f"🔢 Math Agent calling MCP server: {a} + {b}")
-    
-    try:
-        # Start the MCP server process
-        process = await asyncio.create_subprocess_exec(
-            "python", "simple_mcp_server.py",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Initialize the server
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "math-agent", "version": "1.0.0"}
-            }
-        }
-        
-        process.stdin.write((json.dumps(init_request) + "\n").encode())
-        await process.stdin.drain()
-        await process.stdout.readline()  # Read init response
-        
-        # Call the add_numbers tool
-        tool_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/call",
-            "params": {
-                "name": "add_numbers",
-                "arguments": {"a": a, "b": b}
-            }
-        }
-        
-        process.stdin.write((json.dumps(tool_request) + "\n").encode())
-        await process.stdin.drain()
-        
-        # Read response
-        response_line = await process.stdout.readline()
-        response = json.loads(response_line.decode().strip())
-        
-        # Clean up
-        process.terminate()
-        await process.wait()
-        
-        result = response['result']['content'][0]['text']
-        print(f"📊 MCP Server calculated: {result}")
-        return result
-        
-    except Exception as e:
-        return f"Error calling MCP server for math: {e}"
-
-
-async def mcp_get_timestamp_for_math_agent() -> str:
-    """Connect to MCP server to get current timestamp."""
-    print("🕒 Math Agent getting timestamp from MCP server...")
-    
-    try:
-        # Start the MCP server process
-        process = await asyncio.create_subprocess_exec(
-            "python", "simple_mcp_server.py",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Initialize the server
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "math-agent", "version": "1.0.0"}
-            }
-        }
-        
-        process.stdin.write((json.dumps(init_request) + "\n").encode())
-        await process.stdin.drain()
-        await process.stdout.readline()  # Read init response
-        
-        # Call the getdatetime tool
-        tool_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/call",
-            "params": {
-                "name": "getdatetime",
-                "arguments": {"format": "readable"}
-            }
-        }
-        
-        process.stdin.write((json.dumps(tool_request) + "\n").encode())
-        await process.stdin.drain()
-        
-        # Read response
-        response_line = await process.stdout.readline()
-        response = json.loads(response_line.decode().strip())
-        
-        # Clean up
-        process.terminate()
-        await process.wait()
-        
-        result = response['result']['content'][0]['text']
-        print(f"📅 MCP Server timestamp: {result}")
-        return result
-        
-    except Exception as e:
-        return f"Error calling MCP server for timestamp: {e}"
-
-
 class MathAgentManager:
     """Manages MCP server interactions specifically for the Math Agent."""
     
-    def __init__(self):
-        self.math_function = mcp_add_numbers_for_math_agent
-        self.timestamp_function = mcp_get_timestamp_for_math_agent
-    
     async def perform_calculation_with_timestamp(self, a: float, b: float) -> str:
         """Perform a math calculation and provide timestamp."""
         print(f"🧮 Math Agent performing calculation: {a} + {b}")
         
-        # Get the math result
-        math_result = await self.math_function(a, b)
-        
-        # Get the timestamp
-        timestamp = await self.timestamp_function()
+        # The sum and the timestamp are independent, so they run concurrently
+        try:
+            client = await mcp_connection.get()
+        except Exception as e:
+            return f"Error calling MCP server: {e}"
+        outcomes = await run_tool_plan(client, {
+            "sum": {"tool": "add_numbers", "arguments": {"a": a, "b": b}},
+            "timestamp": {"tool": "getdatetime", "arguments": {"format": "readable"}},
+        })
+        for name, outcome in outcomes.items():
+            print(f"⏱️  {name}: {outcome.get('seconds', 0) * 1000:.1f} ms{' (' + outcome['error'] + ')' if 'error' in outcome else ''}")
+        
+        math_result = outcomes["sum"].get("output") or f"Error calling MCP server for math: {outcomes['sum']['error']}"
+        timestamp = outcomes["timestamp"].get("output") or f"Error calling MCP server for timestamp: {outcomes['timestamp']['error']}"
         
         # Combine results
         final_result = f"{math_result}, calculated on {timestamp.replace('Current date and time: ', '')}"
@@ -231,6 +123,7 @@ async def main() -> None:
         # Run demo without AutoGen
         math_manager = MathAgentManager()
         await math_manager.demonstrate_math_agent()
+        await mcp_connection.close()
         return
     
     # Check for Azure OpenAI configuration
@@ -299,6 +192,8 @@ Try asking me to calculate something like "What's 25 + 17?" and I'll give you th
         print("Make sure you have:")
         print("1. Set Azure OpenAI configuration in your .env file")
         print("2. Installed AutoGen packages: pip install autogen-agentchat autogen-ext")
+    finally:
+        await mcp_connection.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,565 @@
+"""
+Async MCP client that multiplexes concurrent calls over one connection.
+
+The client owns a single transport (the stdio server started as a
+subprocess, or another transport with the same interface), gives every
+request a unique id and runs one reader task that routes each response to
+the future waiting for that id. Any number of calls can be in flight at
+once, e.g. with ``asyncio.gather``:
+
+    async with MCPClient(StdioTransport()) as client:
+        total, now = await asyncio.gather(
+            client.call_tool_text("add_numbers", {"a": 25, "b": 17}),
+            client.call_tool_text("getdatetime", {"format": "iso"}),
+        )
+
+Calls that time out or are cancelled send ``notifications/cancelled`` so
+the server stops working on them.
+
+``HttpTransport`` talks to start_server.py's /mcp endpoint instead, over a
+pooled keep-alive connection (HTTP/2 when the h2 package is installed).
+It keeps the ``Mcp-Session-Id`` the server returns from initialize, starts
+a new session when the server answers 404 (expired or restarted) and ends
+the session on close.
+``UnixSocketTransport`` opens a session on a pre-forking zygote server
+(zygote.py). ``WebSocketTransport`` keeps one authenticated WebSocket to
+start_server.py's /ws endpoint, over which the server can also send
+notifications (``on_notification``). ``transport_from_env()`` picks HTTP
+or WebSocket (by URL scheme) when MCP_SERVER_URL is set and the zygote
+when MCP_ZYGOTE_SOCKET is set.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    from websockets.asyncio.client import connect as websocket_connect
+    from websockets.exceptions import ConnectionClosed
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+PROTOCOL_VERSION = "2024-11-05"
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simple_mcp_server.py")
+
+SESSION_HEADER = "Mcp-Session-Id"
+
+# Largest single message accepted from the server
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+# Methods that are safe to send again if the connection fails mid-request
+IDEMPOTENT_METHODS = {"initialize", "ping", "tools/list"}
+
+# HTTP statuses worth retrying (gateway errors while a replica restarts)
+RETRY_STATUSES = {502, 503, 504}
+
+
+class MCPError(Exception):
+    """A JSON-RPC error returned by the server."""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(f"{message} (code {code})")
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class StdioTransport:
+    """Runs an MCP server as a subprocess and talks JSON lines over its stdin/stdout."""
+
+    def __init__(self, command: Sequence[str] = (sys.executable, SERVER_SCRIPT), show_server_logs: bool = False):
+        self.command = list(command)
+        self.show_server_logs = show_server_logs
+        self.process = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            # Server logs go to stderr; an unread pipe would eventually block the server
+            stderr=None if self.show_server_logs else asyncio.subprocess.DEVNULL,
+            limit=MAX_MESSAGE_BYTES,
+        )
+
+    async def send(self, message: Dict[str, Any]):
+        self.process.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+        await self.process.stdin.drain()
+
+    async def receive(self) -> Optional[Dict[str, Any]]:
+        """Return the next message, or None once the server has exited."""
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                return None
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                # Not protocol output (e.g. a stray print); skip it
+                continue
+
+    async def close(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.stdin.close()
+                await asyncio.wait_for(self.process.wait(), timeout=2)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.process.terminate()
+                await self.process.wait()
+        self.process = None
+
+
+class UnixSocketTransport:
+    """Connects to a zygote server's Unix socket (``simple_mcp_server.py --zygote PATH``).
+
+    Each connection gets its own forked server process, so it behaves like
+    StdioTransport without paying for interpreter startup and imports.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def start(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=MAX_MESSAGE_BYTES)
+
+    async def send(self, message: Dict[str, Any]):
+        self.writer.write((json.dumps(message) + "\n").encode("utf-8"))
+        await self.writer.drain()
+
+    async def receive(self) -> Optional[Dict[str, Any]]:
+        """Return the next message, or None once the session has ended."""
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return None
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            # End of input lets the session answer what it has read and exit
+            self.writer.write_eof()
+            self.writer.close()
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        self.writer = None
+
+
+class HttpTransport:
+    """Posts JSON-RPC messages to an HTTP /mcp endpoint over a pooled keep-alive client.
+
+    Every request runs as its own POST, so concurrent calls share the
+    connection pool (and one HTTP/2 connection when enabled). The
+    ``x-api-key`` header is attached to every request. Idempotent methods
+    (IDEMPOTENT_METHODS, plus tools/call for tools in ``idempotent_tools``)
+    are retried with backoff on connection errors and 502/503/504.
+
+    The ``Mcp-Session-Id`` returned from initialize is sent with every later
+    request. If the server no longer knows the session (404), the
+    initialize handshake is replayed and the request is sent once more.
+    """
+
+    def __init__(self, url: str, api_key: Optional[str] = None, http2: bool = False,
+                 max_connections: int = 20, timeout: float = 60.0, retries: int = 2):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("HttpTransport requires httpx. Install with: pip install httpx")
+        if http2 and not HTTP2_AVAILABLE:
+            print("⚠️  HTTP/2 requested but h2 is not installed; using HTTP/1.1 (pip install 'httpx[http2]')", file=sys.stderr)
+            http2 = False
+        self.url = url
+        self.api_key = api_key
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.idempotent_tools = set()
+        self.client = None
+        self.session_id: Optional[str] = None
+        self._initialize: Optional[Dict[str, Any]] = None
+        self._session_lock: Optional[asyncio.Lock] = None
+        self._responses: Optional[asyncio.Queue] = None
+
+    async def start(self):
+        headers = {"x-api-key": self.api_key} if self.api_key else {}
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            http2=self.http2,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+        self._responses = asyncio.Queue()
+        self._session_lock = asyncio.Lock()
+
+    def _session_headers(self) -> Dict[str, str]:
+        return {SESSION_HEADER: self.session_id} if self.session_id else {}
+
+    def _keep_session(self, message: Dict[str, Any], response):
+        if message.get("method") == "initialize":
+            self._initialize = message
+            self.session_id = response.headers.get(SESSION_HEADER)
+
+    async def _renew_session(self, expired: str):
+        """Replay the initialize handshake after the server dropped session ``expired``."""
+        async with self._session_lock:
+            # Another request may already have renewed it
+            if self.session_id != expired:
+                return
+            self.session_id = None
+            response = await self.client.post(self.url, json=self._initialize)
+            response.raise_for_status()
+            self.session_id = response.headers.get(SESSION_HEADER)
+            await self.client.post(self.url, json={"jsonrpc": "2.0", "method": "notifications/initialized"},
+                                   headers=self._session_headers())
+            print("🔄 MCP session expired; started a new one", file=sys.stderr)
+
+    def _is_idempotent(self, message: Dict[str, Any]) -> bool:
+        method = message.get("method")
+        if method in IDEMPOTENT_METHODS:
+            return True
+        return method == "tools/call" and (message.get("params") or {}).get("name") in self.idempotent_tools
+
+    async def send(self, message: Dict[str, Any]):
+        response = await self._post(message)
+        if response.status_code == 404 and self.session_id and self._initialize is not None:
+            await self._renew_session(response.request.headers.get(SESSION_HEADER))
+            response = await self._post(message)
+
+        response.raise_for_status()
+        self._keep_session(message, response)
+        # Notifications are answered with 202 and no body
+        if response.status_code != 202 and response.content:
+            await self._responses.put(response.json())
+
+    async def _post(self, message: Dict[str, Any]):
+        attempts = 1 + (self.retries if self._is_idempotent(message) else 0)
+        for attempt in range(attempts):
+            try:
+                response = await self.client.post(self.url, json=message, headers=self._session_headers())
+            except httpx.TransportError:
+                if attempt + 1 >= attempts:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                    break
+            await asyncio.sleep(random.uniform(0, 0.2 * (2 ** attempt)))
+        return response
+
+    async def receive(self) -> Optional[Dict[str, Any]]:
+        return await self._responses.get()
+
+    async def stream(self, message: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Post a request that may be answered with NDJSON; yields each line, ending with the JSON-RPC response."""
+        for attempt in range(2):
+            headers = {"Accept": "application/x-ndjson, application/json", **self._session_headers()}
+            async with self.client.stream("POST", self.url, json=message, headers=headers) as response:
+                if response.status_code == 404 and attempt == 0 and self.session_id and self._initialize is not None:
+                    expired = self.session_id
+                else:
+                    response.raise_for_status()
+                    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+                        async for line in response.aiter_lines():
+                            if line:
+                                yield json.loads(line)
+                    else:
+                        yield json.loads(await response.aread())
+                    return
+            await self._renew_session(expired)
+
+    async def close(self):
+        if self.client is not None:
+            if self.session_id:
+                # End the session so the server can free it (and cancel anything still running)
+                try:
+                    await self.client.delete(self.url, headers=self._session_headers())
+                except httpx.HTTPError:
+                    pass
+                self.session_id = None
+            await self.client.aclose()
+            self.client = None
+        if self._responses is not None:
+            self._responses.put_nowait(None)
+
+
+class WebSocketTransport:
+    """Keeps one WebSocket to start_server.py's /ws endpoint.
+
+    The API key is sent once, with the handshake. Any number of requests
+    can be in flight on the socket; the server answers them as they finish.
+    """
+
+    def __init__(self, url: str, api_key: Optional[str] = None):
+        if not WEBSOCKETS_AVAILABLE:
+            raise RuntimeError("WebSocketTransport requires websockets. Install with: pip install websockets")
+        self.url = url
+        self.api_key = api_key
+        self.connection = None
+
+    async def start(self):
+        headers = {"x-api-key": self.api_key} if self.api_key else {}
+        self.connection = await websocket_connect(self.url, additional_headers=headers, max_size=MAX_MESSAGE_BYTES)
+
+    async def send(self, message: Dict[str, Any]):
+        await self.connection.send(json.dumps(message))
+
+    async def receive(self) -> Optional[Dict[str, Any]]:
+        """Return the next message, or None once the socket is closed."""
+        while True:
+            try:
+                frame = await self.connection.recv()
+            except ConnectionClosed:
+                return None
+            try:
+                return json.loads(frame)
+            except json.JSONDecodeError:
+                continue
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+
+def transport_from_env():
+    """HttpTransport (or WebSocketTransport for ws:// and wss:// URLs) to MCP_SERVER_URL
+    (with MCP_API_KEY) if set, a zygote session on MCP_ZYGOTE_SOCKET if set,
+    otherwise the local stdio server."""
+    url = os.getenv("MCP_SERVER_URL")
+    if url and url.startswith(("ws://", "wss://")):
+        return WebSocketTransport(url, api_key=os.getenv("MCP_API_KEY"))
+    if url:
+        return HttpTransport(url, api_key=os.getenv("MCP_API_KEY"), http2=os.getenv("MCP_HTTP2", "false").lower() == "true")
+    socket_path = os.getenv("MCP_ZYGOTE_SOCKET")
+    if socket_path:
+        return UnixSocketTransport(socket_path)
+    return StdioTransport()
+
+
+class MCPClient:
+    """JSON-RPC client with id correlation, so calls can run concurrently over one transport."""
+
+    def __init__(self, transport, client_name: str = "mcp-client", client_version: str = "1.0.0",
+                 on_notification: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.transport = transport
+        # Called with notifications the server sends on its own (e.g. notifications/message)
+        self.on_notification = on_notification
+        self.client_name = client_name
+        self.client_version = client_version
+        self.server_info: Dict[str, Any] = {}
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "MCPClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Start the transport and the reader task, then run the MCP initialize handshake."""
+        await self.transport.start()
+        self._reader = asyncio.create_task(self._read_loop())
+        try:
+            result = await self.request("initialize", {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": self.client_name, "version": self.client_version}
+            })
+            await self.notify("notifications/initialized")
+        except BaseException:
+            await self.close()
+            raise
+        self.server_info = result.get("serverInfo", {})
+
+    async def _read_loop(self):
+        try:
+            while True:
+                message = await self.transport.receive()
+                if message is None:
+                    break
+                if "method" in message:
+                    await self._handle_server_message(message)
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    # Unknown id: a call that was already cancelled or timed out
+                    continue
+                if "error" in message:
+                    error = message["error"]
+                    future.set_exception(MCPError(error.get("code", -32603), error.get("message", ""), error.get("data")))
+                else:
+                    future.set_result(message.get("result"))
+        except Exception as e:
+            self._fail_pending(ConnectionError(f"MCP connection failed: {e}"))
+            return
+        self._fail_pending(ConnectionError("MCP server closed the connection"))
+
+    async def _handle_server_message(self, message: Dict[str, Any]):
+        """Answer a request from the server (only ping is supported) or pass on a notification."""
+        if "id" not in message:
+            if self.on_notification is not None:
+                self.on_notification(message)
+            return
+        if message["method"] == "ping":
+            response = {"jsonrpc": "2.0", "id": message["id"], "result": {}}
+        else:
+            response = {"jsonrpc": "2.0", "id": message["id"],
+                        "error": {"code": -32601, "message": f"Unknown method: {message['method']}"}}
+        await self.transport.send(response)
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        """Send a request and wait for its result (raises MCPError on an error response)."""
+        if self._reader is None or self._reader.done():
+            raise ConnectionError("MCP client is not connected")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        async def exchange():
+            await self.transport.send(message)
+            return await future
+        
+        try:
+            # The timeout covers sending too: HttpTransport.send lasts the whole POST round trip
+            return await asyncio.wait_for(exchange(), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if self._pending.pop(request_id, None) is not None:
+                # Let the server stop working on it
+                try:
+                    await self.notify("notifications/cancelled", {"requestId": request_id})
+                except Exception:
+                    pass
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        """Send a notification (no response expected)."""
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self.transport.send(message)
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        result = await self.request("tools/list")
+        tools = result.get("tools", [])
+        if isinstance(self.transport, HttpTransport):
+            # Tools that declare themselves idempotent can be retried safely
+            self.transport.idempotent_tools = {
+                tool["name"] for tool in tools if (tool.get("annotations") or {}).get("idempotentHint")
+            }
+        return tools
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                        timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Call a tool and return its result. A timeout is also sent to the server as its deadline."""
+        params = {"name": name, "arguments": arguments or {}}
+        if timeout is not None:
+            params["_meta"] = {"timeoutMs": int(timeout * 1000)}
+        return await self.request("tools/call", params, timeout=timeout)
+
+    async def call_tool_text(self, name: str, arguments: Optional[Dict[str, Any]] = None,
+                             timeout: Optional[float] = None) -> str:
+        """Call a tool and return its text content."""
+        result = await self.call_tool(name, arguments, timeout)
+        return "\n".join(item.get("text", "") for item in result.get("content", []) if item.get("type") == "text")
+
+    async def stream_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the rows of a listing tool (query_twins, recent_twins, export_twins) over HTTP.
+
+        Large results arrive as NDJSON and are yielded while the server is
+        still reading them; small ones come as one response whose "twins"
+        are yielded. Raises MCPError if the call fails, even part-way through.
+
+        Streaming needs HttpTransport (NDJSON responses); with any other
+        transport a TypeError is raised. Use call_tool there instead.
+        """
+        if not isinstance(self.transport, HttpTransport):
+            raise TypeError("stream_tool requires HttpTransport")
+        message = {"jsonrpc": "2.0", "id": next(self._ids), "method": "tools/call",
+                   "params": {"name": name, "arguments": arguments or {}}}
+        async for line in self.transport.stream(message):
+            if line.get("jsonrpc") != "2.0":
+                yield line
+            elif "error" in line:
+                error = line["error"]
+                raise MCPError(error.get("code", -32603), error.get("message", ""), error.get("data"))
+            else:
+                text = "".join(item.get("text", "") for item in line["result"].get("content", []))
+                for row in json.loads(text).get("twins", []):
+                    yield row
+
+    async def close(self):
+        """Stop the reader, fail any calls still waiting and close the transport."""
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        self._fail_pending(ConnectionError("MCP client closed"))
+        await self.transport.close()
+
+
+class SharedMCPClient:
+    """Connects one MCPClient on first use and hands the same client to every caller."""
+
+    def __init__(self, transport_factory=transport_from_env, client_name: str = "mcp-client"):
+        self.transport_factory = transport_factory
+        self.client_name = client_name
+        self._client: Optional[MCPClient] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self) -> MCPClient:
+        if self._client is not None:
+            return self._client
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._client is None:
+                client = MCPClient(self.transport_factory(), client_name=self.client_name)
+                await client.connect()
+                self._client = client
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
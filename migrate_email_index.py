@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Backfill the TwinEmailIndex container from the Twin container.
+
+The servers keep the email -> CountryID index (twin_index.py) current for
+the Twins they write, but Twins written before the index existed have to
+be copied into it once. This script pages through a projection of the
+Twin container (id and CountryID only) and upserts each page into the
+index with up to ``--concurrency`` writes in flight. It checkpoints after
+every page and stays within a request unit budget.
+
+    python migrate_email_index.py --dry-run
+    python migrate_email_index.py --ru-per-second 400 --concurrency 8
+
+Upserts are idempotent, so rerunning (or running while the servers write)
+is safe.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from cosmos_storage import get_cosmos_storage
+from migrate_twins import RequestUnitBudget, load_checkpoint, new_checkpoint, save_checkpoint
+from twin_index import INDEX_CONTAINER_NAME
+
+
+def upsert_page(index_container, executor, entries):
+    """Upsert one page of index entries concurrently; returns (request charge, failed ids)."""
+    charges = []
+
+    def upsert(entry):
+        index_container.upsert_item(
+            body={"id": entry["id"], "CountryID": entry["CountryID"]},
+            response_hook=lambda headers, _result: charges.append(float(headers.get("x-ms-request-charge", 0) or 0))
+        )
+
+    futures = {entry["id"]: executor.submit(upsert, entry) for entry in entries}
+    failed = []
+    for twin_id, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            print(f"❌ Failed to index {twin_id}: {e}")
+            failed.append(twin_id)
+    return sum(charges), failed
+
+
+def migrate_email_index(ru_per_second=200.0, batch_size=100, concurrency=8,
+                        checkpoint_path="email_index_checkpoint.json", dry_run=False):
+    """Copy the id and CountryID of every Twin into the email index."""
+
+    # Load environment variables
+    load_dotenv()
+
+    if not os.getenv("COSMOS_ENDPOINT") or not os.getenv("COSMOS_KEY"):
+        print("❌ Missing COSMOS_ENDPOINT or COSMOS_KEY environment variables")
+        return
+
+    print(f"🔧 Backfilling {INDEX_CONTAINER_NAME}")
+    print(f"   Budget: {ru_per_second} RU/sec, batch size: {batch_size}, concurrency: {concurrency}"
+          f"{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+
+    # Shared Cosmos DB client (see cosmos_storage.py)
+    storage = get_cosmos_storage(create_if_missing=False)
+    if storage is None:
+        print("❌ Could not connect to Cosmos DB")
+        return
+
+    checkpoint = new_checkpoint() if dry_run else load_checkpoint(checkpoint_path)
+    if checkpoint.get("done"):
+        print(f"✅ Backfill already complete according to {checkpoint_path}")
+        return
+    if checkpoint.get("continuation"):
+        print(f"🔄 Resuming: {checkpoint['migrated']} indexed so far")
+
+    budget = RequestUnitBudget(ru_per_second)
+    started = time.monotonic()
+
+    pages = storage.container.query_items(
+        query="SELECT c.id, c.CountryID FROM c",
+        enable_cross_partition_query=True,
+        max_item_count=batch_size,
+        response_hook=budget.response_hook
+    ).by_page(checkpoint.get("continuation"))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for page in pages:
+            page = list(page)
+            entries = [entry for entry in page if entry.get("CountryID") is not None]
+            # Twins without a CountryID can't be point-read anyway
+            checkpoint["skipped"] += len(page) - len(entries)
+            if dry_run:
+                checkpoint["migrated"] += len(entries)
+                continue
+
+            charge, failed = upsert_page(storage.index_container, executor, entries)
+            # Pace on the page's total charge; the writes themselves ran concurrently
+            budget.spend(charge)
+            checkpoint["migrated"] += len(entries) - len(failed)
+            checkpoint["failed"] += len(failed)
+            checkpoint["continuation"] = pages.continuation_token
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = max(time.monotonic() - started, 1e-6)
+            print(f"⏳ {checkpoint['migrated']} indexed, {checkpoint['skipped']} without CountryID, "
+                  f"{checkpoint['failed']} failed ({budget.spent / elapsed:.1f} RU/sec)")
+
+    if not dry_run:
+        checkpoint["done"] = checkpoint["failed"] == 0
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    print(f"\n✅ Backfill finished: {checkpoint['migrated']} {'to index' if dry_run else 'indexed'}, "
+          f"{checkpoint['failed']} failed, {budget.spent:.1f} RU")
+    if checkpoint["failed"]:
+        print("💡 Delete the checkpoint and rerun to retry the failed Twins")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the Twin email index from the Twin container")
+    parser.add_argument("--ru-per-second", type=float, default=200.0, help="Request unit budget (default: 200)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Twins per page (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Index writes in flight (default: 8)")
+    parser.add_argument("--checkpoint", default="email_index_checkpoint.json", help="Checkpoint file for restarts")
+    parser.add_argument("--dry-run", action="store_true", help="Count the Twins to index without writing")
+    args = parser.parse_args()
+
+    migrate_email_index(args.ru_per_second, args.batch_size, args.concurrency, args.checkpoint, args.dry_run)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Copy Twins into the container partitioned on synthetic keys.
+
+Moving from the /CountryID layout to synthetic CountryID + hash bucket
+partition keys (twin_partitioning.py) takes three steps:
+
+1. Run the servers with TWIN_PARTITIONING=dual. Reads still use
+   TwinHumanContainer, and every write is also sent to the synthetic container.
+2. Run this script to copy the existing Twins. It checkpoints after every
+   page and stays within a request unit budget. By default it only creates
+   missing documents, so Twins already written by step 1 are not replaced
+   by older copies. At the end it compares the per-country counts of both
+   containers.
+3. Switch the servers to TWIN_PARTITIONING=synthetic.
+
+    python migrate_partitioning.py --dry-run
+    python migrate_partitioning.py --ru-per-second 400
+    python migrate_partitioning.py --verify
+
+If dual writes to the synthetic container failed (``partitions.shadow.failures``
+in GET /metrics), rerun with ``--overwrite`` before step 3.
+"""
+
+import argparse
+import os
+import time
+
+from azure.cosmos.exceptions import CosmosResourceExistsError
+from dotenv import load_dotenv
+
+from cosmos_storage import CONTAINER_NAME, get_cosmos_storage, get_or_create_synthetic_container
+from migrate_twins import SYSTEM_PROPERTIES, RequestUnitBudget, load_checkpoint, new_checkpoint, save_checkpoint
+from twin_partitioning import SYNTHETIC_CONTAINER_NAME, synthetic_partitioning_from_env
+
+COUNT_QUERY = "SELECT c.CountryID, COUNT(1) AS twins FROM c GROUP BY c.CountryID"
+
+
+def country_counts(container):
+    return {row["CountryID"]: row["twins"] for row in container.query_items(query=COUNT_QUERY, enable_cross_partition_query=True)}
+
+
+def verify(source, target):
+    """Compare the Twin counts per CountryID of both containers; returns True if they match."""
+    source_counts, target_counts = country_counts(source), country_counts(target)
+    mismatches = {
+        country: (source_counts.get(country, 0), target_counts.get(country, 0))
+        for country in set(source_counts) | set(target_counts)
+        if source_counts.get(country, 0) != target_counts.get(country, 0)
+    }
+    print(f"\n🔍 {CONTAINER_NAME}: {sum(source_counts.values())} Twins, "
+          f"{SYNTHETIC_CONTAINER_NAME}: {sum(target_counts.values())} Twins")
+    for country, (source_count, target_count) in sorted(mismatches.items(), key=lambda item: str(item[0])):
+        print(f"   ⚠️  {country}: {source_count} vs {target_count}")
+    if not mismatches:
+        print("   ✅ Counts match for every country")
+    return not mismatches
+
+
+def migrate_partitioning(ru_per_second=200.0, batch_size=100, checkpoint_path="partitioning_checkpoint.json",
+                         dry_run=False, overwrite=False, verify_only=False):
+    """Copy every Twin into the synthetic-key container."""
+
+    # Load environment variables
+    load_dotenv()
+
+    if not os.getenv("COSMOS_ENDPOINT") or not os.getenv("COSMOS_KEY"):
+        print("❌ Missing COSMOS_ENDPOINT or COSMOS_KEY environment variables")
+        return
+
+    partitioning = synthetic_partitioning_from_env()
+    print(f"🔧 Copying Twins from {CONTAINER_NAME} to {SYNTHETIC_CONTAINER_NAME} ({partitioning.buckets} buckets per country)")
+    print(f"   Budget: {ru_per_second} RU/sec, batch size: {batch_size}"
+          f"{', overwriting' if overwrite else ''}{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+
+    # Shared Cosmos DB client (see cosmos_storage.py)
+    storage = get_cosmos_storage(create_if_missing=False)
+    if storage is None:
+        print("❌ Could not connect to Cosmos DB")
+        return
+    # Read the original container explicitly, whatever TWIN_PARTITIONING the servers use
+    source = storage.database.get_container_client(CONTAINER_NAME)
+    target = get_or_create_synthetic_container(storage.database, create_if_missing=not dry_run)
+
+    if verify_only:
+        verify(source, target)
+        return
+
+    checkpoint = new_checkpoint() if dry_run else load_checkpoint(checkpoint_path)
+    if checkpoint.get("done"):
+        print(f"✅ Copy already complete according to {checkpoint_path}")
+        verify(source, target)
+        return
+    if checkpoint.get("continuation"):
+        print(f"🔄 Resuming: {checkpoint['migrated']} copied so far")
+
+    budget = RequestUnitBudget(ru_per_second)
+    started = time.monotonic()
+
+    pages = source.query_items(
+        query="SELECT * FROM c",
+        enable_cross_partition_query=True,
+        max_item_count=batch_size,
+        response_hook=budget.response_hook
+    ).by_page(checkpoint.get("continuation"))
+
+    for page in pages:
+        for item in page:
+            document = partitioning.prepare({k: v for k, v in item.items() if k not in SYSTEM_PROPERTIES})
+            if dry_run:
+                if checkpoint["migrated"] < 3:
+                    print(f"📄 {item['id']} -> partition {document['PartitionKey']}")
+                checkpoint["migrated"] += 1
+                continue
+            try:
+                if overwrite:
+                    target.upsert_item(body=document, response_hook=budget.response_hook)
+                else:
+                    target.create_item(body=document, response_hook=budget.response_hook)
+                checkpoint["migrated"] += 1
+            except CosmosResourceExistsError:
+                # Already written by dual writes, which are newer than this copy
+                checkpoint["skipped"] += 1
+            except Exception as e:
+                print(f"❌ Failed to copy {item.get('id')}: {e}")
+                checkpoint["failed"] += 1
+
+        if not dry_run:
+            checkpoint["continuation"] = pages.continuation_token
+            save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"⏳ {checkpoint['migrated']} copied, {checkpoint['skipped']} already present, "
+              f"{checkpoint['failed']} failed ({budget.spent / elapsed:.1f} RU/sec)")
+
+    if not dry_run:
+        checkpoint["done"] = checkpoint["failed"] == 0
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    print(f"\n✅ Copy finished: {checkpoint['migrated']} copied, {checkpoint['skipped']} already present, "
+          f"{checkpoint['failed']} failed, {budget.spent:.1f} RU")
+    if dry_run:
+        return
+    if verify(source, target) and not checkpoint["failed"]:
+        print("💡 Set TWIN_PARTITIONING=synthetic and restart the servers to switch over")
+    else:
+        print("💡 Delete the checkpoint and rerun (with --overwrite after failed dual writes) before switching")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy Twins into the container partitioned on synthetic keys")
+    parser.add_argument("--ru-per-second", type=float, default=200.0, help="Request unit budget (default: 200)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents per batch (default: 100)")
+    parser.add_argument("--checkpoint", default="partitioning_checkpoint.json", help="Checkpoint file for restarts")
+    parser.add_argument("--dry-run", action="store_true", help="Show the new partition keys without writing")
+    parser.add_argument("--overwrite", action="store_true", help="Replace documents that already exist in the target")
+    parser.add_argument("--verify", action="store_true", help="Only compare per-country counts of both containers")
+    args = parser.parse_args()
+
+    migrate_partitioning(args.ru_per_second, args.batch_size, args.checkpoint, args.dry_run, args.overwrite, args.verify)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Migrate legacy flat Twin documents to the nested Profile structure.
+
+Old documents keep firstName, lastName, email and telephoneNumber at the
+top level; current documents nest them under "Profile". This tool streams
+only the legacy documents, rewrites them in batches, checkpoints its
+position after every batch so it can be restarted, and spends at most a
+configurable number of request units per second so live traffic isn't
+throttled:
+
+    python migrate_twins.py --dry-run
+    python migrate_twins.py --ru-per-second 200 --batch-size 100
+
+Each rewrite is conditional on the document's etag, so a Twin updated by
+the servers while the migration runs is skipped rather than overwritten.
+"""
+
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosAccessConditionFailedError, CosmosResourceNotFoundError
+
+from cosmos_storage import get_cosmos_storage
+
+PROFILE_FIELDS = ("firstName", "lastName", "email", "telephoneNumber")
+
+# Cosmos DB system properties that must not be sent back on replace
+SYSTEM_PROPERTIES = ("_rid", "_self", "_etag", "_attachments", "_ts")
+
+LEGACY_QUERY = "SELECT * FROM c WHERE NOT IS_DEFINED(c.Profile)"
+
+
+def to_profile_document(item):
+    """Convert a legacy flat Twin document to the Profile structure."""
+    document = {k: v for k, v in item.items() if k not in SYSTEM_PROPERTIES and k not in PROFILE_FIELDS}
+    document["Profile"] = {field: item.get(field) for field in PROFILE_FIELDS}
+    # Older documents also carried a lowercase countryId next to the partition key
+    document.pop("countryId", None)
+    document["lastModified"] = item.get("lastModified") or datetime.now().isoformat()
+    document["migratedAt"] = datetime.now().isoformat()
+    return document
+
+
+class RequestUnitBudget:
+    """Token bucket that paces work to an average request unit rate."""
+
+    def __init__(self, ru_per_second, burst_seconds=1.0):
+        self.rate = float(ru_per_second)
+        self.capacity = self.rate * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.spent = 0.0
+
+    def response_hook(self, headers, _result):
+        self.spend(float(headers.get("x-ms-request-charge", 0) or 0))
+
+    def spend(self, charge):
+        """Record a request charge, sleeping while the bucket is in debt."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= charge
+        self.spent += charge
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+
+def new_checkpoint():
+    return {"continuation": None, "migrated": 0, "skipped": 0, "failed": 0, "done": False}
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return new_checkpoint()
+
+
+def save_checkpoint(path, checkpoint):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def migrate_twins(ru_per_second=200.0, batch_size=100, checkpoint_path="migration_checkpoint.json", dry_run=False):
+    """Rewrite legacy flat Twin documents into the Profile structure"""
+
+    # Load environment variables
+    load_dotenv()
+
+    endpoint = os.getenv("COSMOS_ENDPOINT")
+    key = os.getenv("COSMOS_KEY")
+
+    if not endpoint or not key:
+        print("❌ Missing COSMOS_ENDPOINT or COSMOS_KEY environment variables")
+        return
+
+    print("🔧 Migrating legacy Twin documents to the Profile structure")
+    print(f"   Budget: {ru_per_second} RU/sec, batch size: {batch_size}{' (dry run)' if dry_run else ''}")
+    print("=" * 60)
+
+    # Shared Cosmos DB client (see cosmos_storage.py)
+    storage = get_cosmos_storage(create_if_missing=False)
+    if storage is None:
+        print("❌ Could not connect to Cosmos DB")
+        return
+    container = storage.container
+
+    checkpoint = new_checkpoint() if dry_run else load_checkpoint(checkpoint_path)
+    if checkpoint.get("done"):
+        print(f"✅ Migration already complete according to {checkpoint_path}")
+        return
+    if checkpoint.get("continuation"):
+        print(f"🔄 Resuming: {checkpoint['migrated']} migrated so far")
+
+    budget = RequestUnitBudget(ru_per_second)
+    started = time.monotonic()
+
+    pages = container.query_items(
+        query=LEGACY_QUERY,
+        enable_cross_partition_query=True,
+        max_item_count=batch_size,
+        response_hook=budget.response_hook
+    ).by_page(checkpoint.get("continuation"))
+
+    for page in pages:
+        for item in page:
+            document = to_profile_document(item)
+            if dry_run:
+                if checkpoint["migrated"] < 3:
+                    print(f"📄 {item['id']} would become: {json.dumps(document, indent=2)}")
+                checkpoint["migrated"] += 1
+                continue
+            try:
+                container.replace_item(
+                    item=item["id"],
+                    body=document,
+                    etag=item.get("_etag"),
+                    match_condition=MatchConditions.IfNotModified,
+                    response_hook=budget.response_hook
+                )
+                checkpoint["migrated"] += 1
+            except (CosmosAccessConditionFailedError, CosmosResourceNotFoundError):
+                # Modified or deleted by live traffic since it was read
+                checkpoint["skipped"] += 1
+            except Exception as e:
+                print(f"❌ Failed to migrate {item.get('id')}: {e}")
+                checkpoint["failed"] += 1
+
+        if not dry_run:
+            checkpoint["continuation"] = pages.continuation_token
+            save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"⏳ {checkpoint['migrated']} migrated, {checkpoint['skipped']} skipped, "
+              f"{checkpoint['failed']} failed ({budget.spent / elapsed:.1f} RU/sec)")
+
+    if not dry_run:
+        checkpoint["done"] = checkpoint["failed"] == 0
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    print(f"\n✅ Migration pass finished: {checkpoint['migrated']} migrated, "
+          f"{checkpoint['skipped']} skipped, {checkpoint['failed']} failed, {budget.spent:.1f} RU")
+    if checkpoint["failed"] or checkpoint["skipped"]:
+        print("💡 Delete the checkpoint and rerun to retry skipped or failed documents")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate legacy flat Twin documents to the Profile structure")
+    parser.add_argument("--ru-per-second", type=float, default=200.0, help="Request unit budget (default: 200)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents per batch (default: 100)")
+    parser.add_argument("--checkpoint", default="migration_checkpoint.json", help="Checkpoint file for restarts")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+    args = parser.parse_args()
+
+    migrate_twins(args.ru_per_second, args.batch_size, args.checkpoint, args.dry_run)
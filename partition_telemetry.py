@@ -0,0 +1,212 @@
+"""
+Per-partition throughput telemetry for the Twin container.
+
+The storage layer records every Cosmos DB request against the partition
+key value it targeted (a CountryID, or a synthetic ``US#07`` key, see
+twin_partitioning.py): point reads, writes and query pages, with their
+request charge and the 429s behind them. 429s retried inside the SDK
+are taken from the ``x-ms-throttle-retry-count`` response header.
+
+Counts are kept in one-second buckets over a rolling window, with running
+totals so recording stays O(1). Cross-partition queries are counted
+separately; they don't belong to a partition.
+
+When one partition's share of the requests in the window exceeds
+PARTITION_ALERT_SHARE (and the window holds at least
+PARTITION_ALERT_MIN_OPS requests), a ``partition.hot`` alert event is
+emitted, at most once per PARTITION_ALERT_COOLDOWN_SECONDS per partition.
+
+Settings:
+- PARTITION_WINDOW_SECONDS: length of the rolling window (default 60)
+- PARTITION_ALERT_SHARE: share of requests that marks a partition hot (default 0.5)
+- PARTITION_ALERT_MIN_OPS: requests in the window before alerts are considered (default 100)
+- PARTITION_ALERT_COOLDOWN_SECONDS: minimum time between alerts for one partition (default 300)
+"""
+
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional
+
+OPERATIONS = ("read", "write", "query")
+
+SORT_FIELDS = {"ops": "ops", "requestCharge": "ru", "throttled": "throttled"}
+
+
+def _throttle_retries(headers) -> int:
+    try:
+        return int(headers.get("x-ms-throttle-retry-count", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+class PartitionTelemetry:
+    """Rolling per-partition counts of requests, request units and 429s."""
+
+    def __init__(self, window_seconds: int = 60, alert_share: float = 0.5, alert_min_ops: int = 100,
+                 alert_cooldown_seconds: float = 300, on_alert: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.alert_share = alert_share
+        self.alert_min_ops = alert_min_ops
+        self.alert_cooldown_seconds = alert_cooldown_seconds
+        self.on_alert = on_alert or print_alert
+        self._clock = clock
+        self._seconds = deque()  # (second, {partition key: Counter})
+        self._totals: Dict[Any, Counter] = {}
+        self._ops = 0  # Requests in the window that targeted a partition
+        self._last_alert: Dict[Any, float] = {}
+        self.alerts = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PartitionTelemetry":
+        return cls(
+            window_seconds=int(os.getenv("PARTITION_WINDOW_SECONDS", "60")),
+            alert_share=float(os.getenv("PARTITION_ALERT_SHARE", "0.5")),
+            alert_min_ops=int(os.getenv("PARTITION_ALERT_MIN_OPS", "100")),
+            alert_cooldown_seconds=float(os.getenv("PARTITION_ALERT_COOLDOWN_SECONDS", "300")),
+        )
+
+    def _advance(self) -> Dict[Any, Counter]:
+        """Drop the seconds that left the window and return the current second's counters."""
+        second = int(self._clock())
+        while self._seconds and self._seconds[0][0] <= second - self.window_seconds:
+            _, expired = self._seconds.popleft()
+            for key, counts in expired.items():
+                totals = self._totals[key]
+                totals.subtract(counts)
+                if key is not None:
+                    self._ops -= counts["ops"]
+                if totals["ops"] <= 0:
+                    del self._totals[key]
+        if not self._seconds or self._seconds[-1][0] != second:
+            self._seconds.append((second, {}))
+        return self._seconds[-1][1]
+
+    def record(self, partition_key: Optional[str], operation: str, request_charge: float = 0.0, throttled: int = 0):
+        """Record one request; ``partition_key`` None means a cross-partition query."""
+        counts = Counter({"ops": 1, operation: 1})
+        if request_charge:
+            counts["ru"] = request_charge
+        if throttled:
+            counts["throttled"] = throttled
+
+        alert = None
+        with self._lock:
+            current = self._advance()
+            current.setdefault(partition_key, Counter()).update(counts)
+            totals = self._totals.setdefault(partition_key, Counter())
+            totals.update(counts)
+            if partition_key is not None:
+                self._ops += 1
+                alert = self._check_alert(partition_key, totals)
+        if alert is not None:
+            try:
+                self.on_alert(alert)
+            except Exception as e:
+                print(f"Warning: partition alert handler failed: {str(e)}", file=sys.stderr)
+
+    def _check_alert(self, partition_key: str, totals: Counter) -> Optional[Dict[str, Any]]:
+        if self._ops < self.alert_min_ops:
+            return None
+        share = totals["ops"] / self._ops
+        if share <= self.alert_share:
+            return None
+        now = self._clock()
+        last = self._last_alert.get(partition_key)
+        if last is not None and now - last < self.alert_cooldown_seconds:
+            return None
+        self._last_alert[partition_key] = now
+        alert = {
+            "event": "partition.hot",
+            "partitionKey": partition_key,
+            "share": round(share, 3),
+            "threshold": self.alert_share,
+            "ops": totals["ops"],
+            "windowOps": self._ops,
+            "windowSeconds": self.window_seconds,
+            "requestCharge": round(totals["ru"], 2),
+            "throttled": totals["throttled"],
+            "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        self.alerts.append(alert)
+        return alert
+
+    def response_hook(self, partition_key: Optional[str], operation: str, chained: Optional[Callable] = None) -> Callable:
+        """A Cosmos DB response_hook that records each response, then calls ``chained``."""
+        def hook(headers, result):
+            self.record(
+                partition_key, operation,
+                request_charge=float(headers.get("x-ms-request-charge", 0) or 0),
+                throttled=_throttle_retries(headers),
+            )
+            if chained is not None:
+                chained(headers, result)
+        return hook
+
+    def record_error(self, partition_key: Optional[str], operation: str, error: BaseException):
+        """Record a failed request if it was throttled (other failures don't count as traffic)."""
+        if is_throttle_error(error):
+            self.record(partition_key, operation, throttled=1)
+
+    def top(self, k: int = 10, sort_by: str = "ops") -> List[Dict[str, Any]]:
+        """The k hottest partitions in the window by requests, request charge or 429s."""
+        field = SORT_FIELDS.get(sort_by)
+        if field is None:
+            raise ValueError(f"sort_by must be one of: {', '.join(SORT_FIELDS)}")
+        with self._lock:
+            self._advance()
+            window_ops = self._ops
+            hottest = heapq.nlargest(
+                k,
+                ((key, Counter(counts)) for key, counts in self._totals.items() if key is not None),
+                key=lambda item: item[1][field],
+            )
+        return [
+            {
+                "partitionKey": key,
+                "ops": counts["ops"],
+                "reads": counts["read"],
+                "writes": counts["write"],
+                "queries": counts["query"],
+                "opsPerSecond": round(counts["ops"] / self.window_seconds, 2),
+                "requestCharge": round(counts["ru"], 2),
+                "throttled": counts["throttled"],
+                "share": round(counts["ops"] / window_ops, 3) if window_ops else 0.0,
+            }
+            for key, counts in hottest
+        ]
+
+    def stats(self, top: int = 10, sort_by: str = "ops") -> Dict[str, Any]:
+        hottest = self.top(top, sort_by)
+        with self._lock:
+            partitions = [counts for key, counts in self._totals.items() if key is not None]
+            cross = Counter(self._totals.get(None, Counter()))
+            window_ops = self._ops
+            alerts = list(self.alerts)
+        request_charge = sum(counts["ru"] for counts in partitions)
+        return {
+            "windowSeconds": self.window_seconds,
+            "partitions": len(partitions),
+            "opsPerSecond": round(window_ops / self.window_seconds, 2),
+            "requestChargePerSecond": round(request_charge / self.window_seconds, 2),
+            "throttled": sum(counts["throttled"] for counts in partitions),
+            "crossPartition": {"ops": cross["ops"], "requestCharge": round(cross["ru"], 2), "throttled": cross["throttled"]},
+            "alertShare": self.alert_share,
+            "top": hottest,
+            "alerts": alerts,
+        }
+
+
+def print_alert(alert: Dict[str, Any]):
+    """Default alert handler: one JSON line on stderr."""
+    print(f"Warning: hot partition {json.dumps(alert)}", file=sys.stderr)
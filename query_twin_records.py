@@ -4,11 +4,21 @@ Query Cosmos DB to verify document structure and show all Twin records
 """
 
 import os
+import argparse
 from dotenv import load_dotenv
-from azure.cosmos import CosmosClient
 import json
 from datetime import datetime
 
+from cosmos_storage import get_cosmos_storage
+from twin_stats import HISTOGRAM_BUCKETS, TwinStatsService
+from twin_query import TwinQueryService
+
+# Only the fields printed below (both document formats); system properties stay server-side
+LISTING_FIELDS = [
+    "id", "CountryID", "Profile", "firstName", "lastName", "email",
+    "telephoneNumber", "createdAt", "lastModified", "testType",
+]
+
 def query_twin_records():
     """Query and display all Twin records with their structure"""
     
@@ -26,16 +36,15 @@ def query_twin_records():
     print("=" * 60)
     
     try:
-        # Initialize Cosmos DB client
-        client = CosmosClient(endpoint, key)
-        database = client.get_database_client("TwinHumanDB")
-        container = database.get_container_client("TwinHumanContainer")
+        # Shared Cosmos DB client (see cosmos_storage.py)
+        storage = get_cosmos_storage(create_if_missing=False)
+        if storage is None:
+            print("❌ Could not connect to Cosmos DB")
+            return
+        container = storage.container
         
-        # Query all items
-        items = list(container.query_items(
-            query="SELECT * FROM c",
-            enable_cross_partition_query=True
-        ))
+        # Query all items, projected to the listed fields
+        items = list(TwinQueryService(container).iter_query(fields=LISTING_FIELDS))
         
         print(f"📊 Found {len(items)} total records")
         print("\n" + "=" * 60)
@@ -73,10 +82,57 @@ def query_twin_records():
         if items:
             latest = max(items, key=lambda x: x.get('createdAt', ''))
             print(f"\n🕐 Most Recent Record (Full JSON):")
-            print(json.dumps({k: v for k, v in latest.items() if not k.startswith('_')}, indent=2))
+            print(json.dumps(latest, indent=2))
             
     except Exception as e:
         print(f"❌ Error querying records: {e}")
 
+def show_twin_stats(bucket="day"):
+    """Show Twin statistics aggregated inside Cosmos DB (no full-container read)"""
+    
+    # Load environment variables
+    load_dotenv()
+    
+    endpoint = os.getenv("COSMOS_ENDPOINT")
+    key = os.getenv("COSMOS_KEY")
+    
+    if not endpoint or not key:
+        print("❌ Missing COSMOS_ENDPOINT or COSMOS_KEY environment variables")
+        return
+    
+    print("📊 Twin Statistics (server-side aggregates)")
+    print("=" * 60)
+    
+    try:
+        storage = get_cosmos_storage(create_if_missing=False)
+        if storage is None:
+            print("❌ Could not connect to Cosmos DB")
+            return
+        
+        stats = TwinStatsService(storage.container).collect(bucket)
+        
+        print(f"📊 Total records: {stats['total']}")
+        print(f"   📋 Profile Structure (NEW FORMAT): {stats['byFormat']['new']}")
+        print(f"   📋 Flat Structure (OLD FORMAT): {stats['byFormat']['old']}")
+        
+        print("\n🌍 Records per CountryID:")
+        for country_id, count in sorted(stats["byCountry"].items(), key=lambda x: -x[1]):
+            print(f"   {country_id}: {count}")
+        
+        print(f"\n🕐 Created per {bucket}:")
+        for bucket_key, count in stats["createdAtHistogram"]["counts"].items():
+            print(f"   {bucket_key}: {count}")
+            
+    except Exception as e:
+        print(f"❌ Error querying statistics: {e}")
+
 if __name__ == "__main__":
-    query_twin_records()
+    parser = argparse.ArgumentParser(description="Query Twin records in Cosmos DB")
+    parser.add_argument("--stats", action="store_true", help="Show aggregate statistics instead of listing every record")
+    parser.add_argument("--bucket", choices=list(HISTOGRAM_BUCKETS), default="day", help="createdAt histogram bucket for --stats (default: day)")
+    args = parser.parse_args()
+    
+    if args.stats:
+        show_twin_stats(args.bucket)
+    else:
+        query_twin_records()
@@ -0,0 +1,222 @@
+"""
+Structured, sampled request logging that never blocks the event loop.
+
+Each log record is one JSON object per line. Handlers only put records on
+a bounded in-memory queue; a listener thread formats them and writes them
+to stdout. When the queue is full (stdout is slower than the request
+rate), new records are dropped and counted instead of stalling requests.
+
+Request records are sampled per method and per tool, and the values of
+sensitive fields (Twin PII, API keys) are redacted before they are
+queued. Errors are always logged.
+
+Settings:
+- LOG_LEVEL: minimum level (default INFO)
+- LOG_QUEUE_SIZE: records buffered before dropping (default 10000)
+- LOG_SAMPLE_RATES: comma-separated ``key=rate`` pairs, where the key is a
+  method (``tools/list``), a tool (``tools/call:save_twin_info``) or
+  ``*`` for everything else, e.g. ``*=1,tools/call=0.1,tools/call:save_twin_info=1``
+- LOG_REDACT_FIELDS: comma-separated field names whose values are redacted
+  (case-insensitive, at any depth). Filter predicates such as
+  ``{"field": "Profile.email", "value": ...}`` (query_twins, export_twins)
+  have their value redacted when any part of the field path is sensitive.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+DEFAULT_REDACT_FIELDS = (
+    "email", "firstName", "lastName", "telephoneNumber", "Profile",
+    "x-api-key", "apiKey", "api_key", "password", "token",
+)
+
+REDACTED = "[redacted]"
+
+# Longer string values are cut so one request can't flood the log
+MAX_VALUE_LENGTH = 200
+
+# Standard LogRecord attributes that are not structured fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON line with its structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Structured fields are already JSON-safe; skip QueueHandler's message merging
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room in a full queue instead of failing."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def parse_sample_rates(spec: Optional[str]) -> Dict[str, float]:
+    """Parse ``key=rate`` pairs; rates are clamped to [0, 1]."""
+    rates = {}
+    for part in (spec or "").split(","):
+        key, _, rate = part.strip().partition("=")
+        if not key or not rate:
+            continue
+        try:
+            rates[key.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"Warning: ignoring invalid LOG_SAMPLE_RATES entry '{part.strip()}'", file=sys.stderr)
+    return rates
+
+
+def _is_sensitive_path(path: Any, fields) -> bool:
+    """Whether any part of a dotted field path such as ``Profile.email`` is a sensitive field."""
+    return isinstance(path, str) and any(part.lower() in fields for part in path.split("."))
+
+
+def redact(value: Any, fields, depth: int = 0) -> Any:
+    """Copy of a JSON value with the values of sensitive fields replaced."""
+    if depth > 8:
+        return "..."
+    if isinstance(value, dict):
+        # A filter predicate names the field it matches; its value is that field's data
+        sensitive_predicate = "value" in value and _is_sensitive_path(value.get("field"), fields)
+        return {
+            key: REDACTED if isinstance(key, str) and (key.lower() in fields or (sensitive_predicate and key == "value"))
+            else redact(item, fields, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, fields, depth + 1) for item in value[:20]]
+    if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+        return value[:MAX_VALUE_LENGTH] + "..."
+    return value
+
+
+class RequestLogger:
+    """Queue-backed structured logger for MCP requests."""
+
+    def __init__(self, name: str = "mcp.requests", level: str = "INFO", queue_size: int = 10000,
+                 sample_rates: Optional[Dict[str, float]] = None, redact_fields=DEFAULT_REDACT_FIELDS,
+                 stream=None):
+        self.sample_rates = sample_rates or {}
+        self.redact_fields = {field.lower() for field in redact_fields}
+        self.sampled_out = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self._queue)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        self.listener = DrainingQueueListener(self._queue, output)
+        self._started = False
+        self._lock = threading.Lock()
+
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level.upper())
+        self.logger.propagate = False
+        self.logger.handlers = [self.handler]
+
+    @classmethod
+    def from_env(cls, name: str = "mcp.requests") -> "RequestLogger":
+        redact_fields = os.getenv("LOG_REDACT_FIELDS")
+        return cls(
+            name,
+            level=os.getenv("LOG_LEVEL", "INFO"),
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES")),
+            redact_fields=redact_fields.split(",") if redact_fields else DEFAULT_REDACT_FIELDS,
+        )
+
+    def start(self):
+        """Start the listener thread that writes queued records."""
+        with self._lock:
+            if not self._started:
+                self.listener.start()
+                self._started = True
+
+    def stop(self):
+        """Write the records still queued and stop the listener thread."""
+        with self._lock:
+            if self._started:
+                self.listener.stop()
+                self._started = False
+
+    def sample_rate(self, method: Optional[str], tool_name: Optional[str] = None) -> float:
+        if tool_name is not None:
+            rate = self.sample_rates.get(f"{method}:{tool_name}")
+            if rate is not None:
+                return rate
+        rate = self.sample_rates.get(method or "")
+        if rate is not None:
+            return rate
+        return self.sample_rates.get("*", 1.0)
+
+    def log_request(self, message: Dict[str, Any], **fields):
+        """Log a received JSON-RPC message (sampled; arguments redacted)."""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        method = message.get("method")
+        params = message.get("params") if isinstance(message.get("params"), dict) else {}
+        tool_name = params.get("name") if method == "tools/call" else None
+        rate = self.sample_rate(method, tool_name)
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+
+        entry = {"method": method, "requestId": message.get("id")}
+        if tool_name is not None:
+            entry["tool"] = tool_name
+            entry["arguments"] = redact(params.get("arguments"), self.redact_fields)
+        if rate < 1.0:
+            entry["sampleRate"] = rate
+        entry.update(fields)
+        self.logger.info("mcp.request", extra=entry)
+
+    def log_error(self, event: str, error: BaseException, **fields):
+        """Log an error (never sampled)."""
+        self.logger.error(event, extra=dict(redact(fields, self.redact_fields), error=str(error), errorType=type(error).__name__))
+
+    def log_event(self, event: str, level: int = logging.WARNING, **fields):
+        """Log an operational event, such as an alert (never sampled)."""
+        self.logger.log(level, event, extra=fields)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "queueSize": self._queue.maxsize,
+            "dropped": self.handler.dropped,
+            "sampledOut": self.sampled_out,
+        }
@@ -0,0 +1,157 @@
+"""
+Deadlines and cancellation for tool calls.
+
+Each tools/call runs inside a RequestScope holding its deadline and a
+cancelled flag. The scope lives in a context variable, so it follows the
+call into ``asyncio.to_thread`` workers. Storage code uses it in two ways:
+``storage_options()`` turns the remaining time into the Cosmos SDK's
+``timeout`` argument, and ``check_current_scope()`` stops paging loops
+once the caller has given up. A cancelled or timed-out call then stops
+using RU and worker threads instead of running to completion.
+
+A call's timeout is the tool's ``timeoutSeconds`` (TOOL_TIMEOUT_SECONDS
+by default), shortened by the client's ``params._meta.timeoutMs`` if that
+is smaller.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, Optional
+
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+
+# JSON-RPC error codes
+TOOL_TIMEOUT_ERROR = -32003
+REQUEST_CANCELLED_ERROR = -32800
+
+
+class RequestCancelledError(Exception):
+    """Raised in storage code when the request it serves was cancelled."""
+
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool call runs past its deadline."""
+
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"Tool '{tool_name}' timed out after {timeout:g}s")
+        self.tool_name = tool_name
+        self.timeout = timeout
+
+
+class RequestScope:
+    """Deadline (a ``time.monotonic()`` value) and cancelled flag of one request."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise RequestCancelledError("Request was cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise RequestCancelledError("Request deadline exceeded")
+
+
+_current_scope: ContextVar[Optional[RequestScope]] = ContextVar("request_scope", default=None)
+
+
+def current_scope() -> Optional[RequestScope]:
+    return _current_scope.get()
+
+
+def current_deadline() -> Optional[float]:
+    scope = _current_scope.get()
+    return scope.deadline if scope else None
+
+
+def check_current_scope():
+    """Raise RequestCancelledError if the current request was cancelled or is past its deadline."""
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.check()
+
+
+def storage_options() -> Dict[str, Any]:
+    """Keyword arguments that bound a Cosmos SDK call by the current request's deadline."""
+    scope = _current_scope.get()
+    if scope is None or scope.deadline is None:
+        return {}
+    scope.check()
+    return {"timeout": max(scope.remaining(), 0.05)}
+
+
+def tool_timeout(tool: Optional[Dict[str, Any]], params: Any) -> float:
+    """Timeout in seconds for a call: the tool's limit, shortened by the client's _meta.timeoutMs."""
+    timeout = float((tool or {}).get("timeoutSeconds", DEFAULT_TOOL_TIMEOUT))
+    # params may be anything the client sent, e.g. null
+    meta = (params.get("_meta") if isinstance(params, dict) else None) or {}
+    client_timeout = meta.get("timeoutMs") if isinstance(meta, dict) else None
+    if isinstance(client_timeout, (int, float)) and not isinstance(client_timeout, bool) and client_timeout > 0:
+        timeout = min(timeout, client_timeout / 1000.0)
+    return timeout
+
+
+@contextmanager
+def deadline_scope(timeout: float) -> Iterator[RequestScope]:
+    """Make a new RequestScope current inside the block.
+
+    For work that outlives a single awaitable, such as a streamed response:
+    iterators opened inside the block keep the scope (see
+    result_stream.iterate_in_thread), and the caller enforces the deadline.
+    """
+    scope = RequestScope(time.monotonic() + timeout)
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+async def run_with_deadline(awaitable: Awaitable, tool_name: str, timeout: float) -> Any:
+    """Await a tool call inside a new RequestScope.
+
+    Raises ToolTimeoutError when the deadline passes. On timeout or
+    cancellation the scope is marked cancelled, so worker threads still
+    running storage calls for it stop at their next check.
+    """
+    scope = RequestScope(time.monotonic() + timeout)
+    token = _current_scope.set(scope)
+    try:
+        # wait_for runs the call in a task created here, so it inherits the scope
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        scope.cancel()
+        raise ToolTimeoutError(tool_name, timeout) from None
+    except asyncio.CancelledError:
+        scope.cancel()
+        raise
+    finally:
+        _current_scope.reset(token)
+
+
+def timeout_error_response(request_id: Any, error: ToolTimeoutError) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {
+            "code": TOOL_TIMEOUT_ERROR,
+            "message": str(error),
+            "data": {"timeoutMs": int(error.timeout * 1000)}
+        }
+    }
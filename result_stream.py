@@ -0,0 +1,250 @@
+"""
+Streamed, compressed NDJSON responses for large tool results.
+
+Listing tools produce their rows as an async iterator of batches (one
+Cosmos DB page at a time, read in a worker thread) instead of one list.
+When the client sends ``Accept: application/x-ndjson`` the server reads
+batches until the result passes STREAM_THRESHOLD_BYTES:
+
+- results that stay below the threshold are answered with the usual
+  JSON-RPC response;
+- larger results are streamed as NDJSON, one row per line, while later
+  pages are still being read. The last line is the JSON-RPC response,
+  whose text content summarizes the result (count, request charge).
+  A failure part-way through ends the stream with a JSON-RPC error line.
+
+Memory per request is bounded by one batch instead of the whole result.
+Responses are compressed with zstd (if the zstandard package is
+installed) or gzip, as negotiated through ``Accept-Encoding``; ordinary
+JSON responses above COMPRESS_MIN_BYTES are compressed the same way.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+from request_scope import RequestScope, ToolTimeoutError, timeout_error_response
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Results up to this size are sent as a single JSON-RPC response
+STREAM_THRESHOLD_BYTES = int(os.getenv("STREAM_THRESHOLD_BYTES", str(64 * 1024)))
+
+# Rows read from storage per batch (one Cosmos DB page)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "200"))
+
+# Smaller JSON responses aren't worth compressing
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "4096"))
+
+
+def _accepted(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept or Accept-Encoding header into {value: q}."""
+    accepted = {}
+    for part in (header or "").split(","):
+        value, _, parameters = part.strip().partition(";")
+        if not value:
+            continue
+        q = 1.0
+        for parameter in parameters.split(";"):
+            name, _, number = parameter.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        accepted[value.strip().lower()] = q
+    return accepted
+
+
+def accepts_ndjson(accept: Optional[str]) -> bool:
+    return _accepted(accept).get(NDJSON_MEDIA_TYPE, 0) > 0
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Return "zstd", "gzip" or None (uncompressed) for an Accept-Encoding header."""
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get("*", 0)
+    if ZSTD_AVAILABLE and accepted.get("zstd", 0) > 0:
+        return "zstd"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class StreamCompressor:
+    """Incremental gzip/zstd compressor whose output can be sent chunk by chunk."""
+
+    def __init__(self, encoding: Optional[str]):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "gzip":
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        else:
+            self._compressor = None
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, so the client can decode it right away."""
+        if self._compressor is None:
+            return data
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._compressor is None:
+            return b""
+        return self._compressor.flush()
+
+
+def compress(data: bytes, encoding: Optional[str]) -> bytes:
+    compressor = StreamCompressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def json_response(body: str, accept_encoding: Optional[str]) -> Response:
+    """A JSON response, compressed when it is large and the client accepts it."""
+    data = body.encode("utf-8")
+    encoding = negotiate_encoding(accept_encoding) if len(data) >= COMPRESS_MIN_BYTES else None
+    if encoding is None:
+        return Response(content=data, media_type="application/json")
+    return Response(
+        content=compress(data, encoding),
+        media_type="application/json",
+        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+    )
+
+
+def iterate_in_thread(open_iterator: Callable[[], Iterator[Any]], batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[List[Any]]:
+    """Read a blocking iterator in worker threads, one batch at a time.
+
+    The iterator runs in the context current when this is called, so
+    storage calls made while streaming still see the request's deadline.
+    """
+    context = contextvars.copy_context()
+    iterator = None
+
+    def next_batch():
+        nonlocal iterator
+        if iterator is None:
+            iterator = open_iterator()
+        return list(itertools.islice(iterator, batch_size))
+
+    async def batches():
+        while True:
+            batch = await asyncio.to_thread(context.run, next_batch)
+            if not batch:
+                return
+            yield batch
+
+    return batches()
+
+
+async def batches_of(items: List[Any], batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[List[Any]]:
+    """Batches of an in-memory list."""
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+class ItemStream:
+    """Rows of a tool result plus a summary of the whole result.
+
+    ``summary(count)`` is called once all rows were read and returns the
+    fields reported next to them (e.g. the request charge).
+    """
+
+    def __init__(self, batches: AsyncIterator[List[Any]], summary: Callable[[int], Dict[str, Any]], key: str = "twins"):
+        self.batches = batches
+        self.summary = summary
+        self.key = key
+
+
+def _result(request_id: Any, text: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": text}]}}
+
+
+def _error(request_id: Any, tool_name: str, error: Exception) -> Dict[str, Any]:
+    if isinstance(error, ToolTimeoutError):
+        return timeout_error_response(request_id, error)
+    if isinstance(error, ValueError):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32602, "message": str(error)}}
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": -32603, "message": f"Failed to run {tool_name}: {str(error)}"}
+    }
+
+
+async def _next_batch(batches: AsyncIterator[List[Any]], scope: RequestScope, tool_name: str, timeout: float) -> Optional[List[Any]]:
+    """Next batch, or None at the end; raises ToolTimeoutError past the scope's deadline."""
+    try:
+        return await asyncio.wait_for(batches.__anext__(), max(scope.remaining(), 0))
+    except StopAsyncIteration:
+        return None
+    except asyncio.TimeoutError:
+        scope.cancel()
+        raise ToolTimeoutError(tool_name, timeout) from None
+    except asyncio.CancelledError:
+        scope.cancel()
+        raise
+
+
+async def respond_with_items(request_id: Any, tool_name: str, stream: ItemStream, scope: RequestScope,
+                             timeout: float, accept_encoding: Optional[str],
+                             threshold: int = STREAM_THRESHOLD_BYTES):
+    """Answer a tools/call with the stream's rows: one JSON-RPC response if they are small, NDJSON otherwise."""
+    rows: List[Any] = []
+    lines: List[bytes] = []
+    size = 0
+    try:
+        while size <= threshold:
+            batch = await _next_batch(stream.batches, scope, tool_name, timeout)
+            if batch is None:
+                text = json.dumps(dict(stream.summary(len(rows)), **{stream.key: rows}), indent=2)
+                return json_response(json.dumps(_result(request_id, text)), accept_encoding)
+            rows.extend(batch)
+            for row in batch:
+                line = (json.dumps(row) + "\n").encode("utf-8")
+                lines.append(line)
+                size += len(line)
+    except Exception as e:
+        return json_response(json.dumps(_error(request_id, tool_name, e)), accept_encoding)
+
+    encoding = negotiate_encoding(accept_encoding)
+    count = len(rows)
+    del rows
+
+    async def body():
+        nonlocal count
+        compressor = StreamCompressor(encoding)
+        yield compressor.compress(b"".join(lines))
+        lines.clear()
+        try:
+            while True:
+                batch = await _next_batch(stream.batches, scope, tool_name, timeout)
+                if batch is None:
+                    break
+                count += len(batch)
+                yield compressor.compress("".join(json.dumps(row) + "\n" for row in batch).encode("utf-8"))
+            final = _result(request_id, json.dumps(dict(stream.summary(count), count=count)))
+        except Exception as e:
+            final = _error(request_id, tool_name, e)
+        yield compressor.compress((json.dumps(final) + "\n").encode("utf-8")) + compressor.finish()
+
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,150 @@
+"""
+MCP sessions for the stateless HTTP endpoint.
+
+``POST /mcp`` answers every request on its own, so nothing a client
+negotiates in ``initialize`` survives to its next request. With sessions,
+``initialize`` creates a Session and returns its id in the
+``Mcp-Session-Id`` response header. Requests that send the header back
+are attributed to that session:
+
+- the client's info, protocol version and capabilities are parsed once and
+  kept on the session, together with per-session counters;
+- ``notifications/cancelled`` only cancels calls made in the same session,
+  even when several clients share an API key;
+- ``session.state`` holds anything else worth setting up once per session
+  instead of once per request.
+
+A session belongs to the API key that created it; the same id sent with
+another key is treated as unknown. Unknown, expired and deleted ids get
+HTTP 404, which tells the client to initialize again. Clients that never
+send the header keep working statelessly unless MCP_SESSIONS_REQUIRED is set.
+
+The store is bounded. Sessions idle for longer than MCP_SESSION_IDLE_SECONDS
+expire, and beyond MCP_SESSION_MAX sessions the least recently used one is
+evicted. Sessions live in this process's memory; with several replicas,
+clients need sticky routing (or they re-initialize after a 404).
+"""
+
+import heapq
+import hmac
+import os
+import secrets
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+SESSION_HEADER = "Mcp-Session-Id"
+
+MAX_SESSIONS = int(os.getenv("MCP_SESSION_MAX", "10000"))
+SESSION_IDLE_SECONDS = float(os.getenv("MCP_SESSION_IDLE_SECONDS", "1800"))
+SESSIONS_REQUIRED = os.getenv("MCP_SESSIONS_REQUIRED", "false").lower() == "true"
+
+
+class Session:
+    """State and counters of one client session."""
+
+    def __init__(self, session_id: str, api_key: str, params: Optional[Dict[str, Any]] = None):
+        params = params if isinstance(params, dict) else {}
+        self.id = session_id
+        self.api_key = api_key
+        # Whatever the client sent; only objects are kept
+        self.client_info = params.get("clientInfo") if isinstance(params.get("clientInfo"), dict) else {}
+        self.protocol_version = params.get("protocolVersion")
+        self.capabilities = params.get("capabilities") if isinstance(params.get("capabilities"), dict) else {}
+        self.created_at = time.time()
+        self.last_seen = time.monotonic()
+        self.counters = Counter()
+        self.tool_calls = Counter()
+        # Per-session caches and other setup that should outlive a request
+        self.state: Dict[str, Any] = {}
+
+    def record(self, message: Dict[str, Any], failed: bool = False):
+        """Count a request made in this session."""
+        self.counters["requests"] += 1
+        if message.get("method") == "tools/call":
+            self.counters["toolCalls"] += 1
+            self.tool_calls[(message.get("params") or {}).get("name")] += 1
+        if failed:
+            self.counters["errors"] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            # Enough to tell sessions apart without handing out usable ids
+            "session": self.id[:8],
+            "client": self.client_info.get("name"),
+            "protocolVersion": self.protocol_version,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.created_at)),
+            "idleSeconds": round(time.monotonic() - self.last_seen, 1),
+            "requests": self.counters["requests"],
+            "toolCalls": self.counters["toolCalls"],
+            "errors": self.counters["errors"],
+            "tools": dict(self.tool_calls.most_common(5)),
+        }
+
+
+class SessionStore:
+    """Sessions by id, least recently used first, with idle expiry and a size bound."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.counters = Counter()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self):
+        # Least recently used sessions come first, so stop at the first live one
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_seen > cutoff:
+                return
+            del self._sessions[session.id]
+            self.counters["expired"] += 1
+
+    def create(self, api_key: str, params: Optional[Dict[str, Any]] = None) -> Session:
+        """Start a session for an initialize request."""
+        self._expire()
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.counters["evicted"] += 1
+        session = Session(secrets.token_urlsafe(24), api_key, params)
+        self._sessions[session.id] = session
+        self.counters["created"] += 1
+        return session
+
+    def get(self, session_id: str, api_key: str) -> Optional[Session]:
+        """The live session with this id created with this API key, or None."""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None or not hmac.compare_digest(session.api_key.encode(), api_key.encode()):
+            self.counters["unknown"] += 1
+            return None
+        session.last_seen = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str, api_key: str) -> Optional[Session]:
+        """End a session; returns it, or None if it doesn't exist (for this API key)."""
+        session = self.get(session_id, api_key)
+        if session is not None:
+            del self._sessions[session_id]
+            self.counters["deleted"] += 1
+        return session
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        self._expire()
+        busiest: List[Session] = heapq.nlargest(top, self._sessions.values(), key=lambda s: s.counters["requests"])
+        return {
+            "active": len(self._sessions),
+            "maxSessions": self.max_sessions,
+            "idleSeconds": self.idle_seconds,
+            "created": self.counters["created"],
+            "expired": self.counters["expired"],
+            "evicted": self.counters["evicted"],
+            "deleted": self.counters["deleted"],
+            "unknown": self.counters["unknown"],
+            "busiest": [session.describe() for session in busiest],
+        }
@@ -5,10 +5,11 @@ This demonstrates how to integrate MCP tools with AutoGen agents.
 
 import os
 import asyncio
-import json
 from typing import Sequence
 from dotenv import load_dotenv
 
+from mcp_client import SharedMCPClient
+
 # Note: These imports will work once autogen packages are installed
 # For now, this serves as a template for when the packages are available
 
@@ -29,6 +30,9 @@ except ImportError as e:
 # Load environment variables
 load_dotenv()
 
+# MCP server connection shared by all tool functions
+mcp_connection = SharedMCPClient(client_name="autogen-client")
+
 
 def get_azure_openai_client():
     """Create and return an Azure OpenAI client."""
@@ -80,16 +84,14 @@ class MCPServerManager:
         """Demonstrate all MCP functions."""
         print("🧪 Testing MCP server integration directly...")
         
-        # Test hello function
-        test_result1 = await self.hello_function("AutoGen User")
+        # All three calls share one server connection and run concurrently
+        test_result1, test_result2, test_result3 = await asyncio.gather(
+            self.hello_function("AutoGen User"),
+            self.math_function(25, 17),
+            self.datetime_function("readable"),
+        )
         print(f"📝 Hello MCP call result: {test_result1}")
-        
-        # Test math function
-        test_result2 = await self.math_function(25, 17)
         print(f"🔢 Math MCP call result: {test_result2}")
-        
-        # Test datetime function
-        test_result3 = await self.datetime_function("readable")
         print(f"📅 Datetime MCP call result: {test_result3}")
         print("")
         
@@ -106,60 +108,16 @@ async def mcp_hello_tool_function(name: str = "World") -> str:
     This function converts MCP server calls into AutoGen-callable tools.
     
     When an AutoGen agent calls this function, it will:
-    1. Connect to the MCP server
+    1. Reuse the shared MCP server connection (started on first use)
     2. Call the server's hello_world function
     3. Return the result to the agent
     """
     print(f"🔗 AutoGen agent is calling MCP server with name: {name}")
     
     try:
-        # Start the MCP server process
-        process = await asyncio.create_subprocess_exec(
-            "python", "simple_mcp_server.py",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Initialize the server
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "autogen-client", "version": "1.0.0"}
-            }
-        }
-        
-        process.stdin.write((json.dumps(init_request) + "\n").encode())
-        await process.stdin.drain()
-        await process.stdout.readline()  # Read init response
-        
-        # Call the hello_world tool on MCP server
-        tool_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/call",
-            "params": {
-                "name": "hello_world",
-                "arguments": {"name": name}
-            }
-        }
-        
-        process.stdin.write((json.dumps(tool_request) + "\n").encode())
-        await process.stdin.drain()
-        
-        # Read response from MCP server
-        response_line = await process.stdout.readline()
-        response = json.loads(response_line.decode().strip())
-        
-        # Clean up
-        process.terminate()
-        await process.wait()
-        
-        result = response['result']['content'][0]['text']
+        # One shared server connection; concurrent calls are matched to responses by id
+        client = await mcp_connection.get()
+        result = await client.call_tool_text("hello_world", {"name": name})
         print(f"📡 MCP Server returned: {result}")
         return result
         
@@ -173,60 +131,16 @@ async def mcp_add_numbers_tool_function(a: float, b: float) -> str:
     This function connects AutoGen agents to the MCP server's add_numbers tool.
     
     When an AutoGen agent calls this function, it will:
-    1. Connect to the MCP server
+    1. Reuse the shared MCP server connection (started on first use)
     2. Call the server's add_numbers function
     3. Return the math result to the agent
     """
     print(f"🔢 AutoGen agent is calling MCP server to add: {a} + {b}")
     
     try:
-        # Start the MCP server process
-        process = await asyncio.create_subprocess_exec(
-            "python", "simple_mcp_server.py",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Initialize the server
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "autogen-client", "version": "1.0.0"}
-            }
-        }
-        
-        process.stdin.write((json.dumps(init_request) + "\n").encode())
-        await process.stdin.drain()
-        await process.stdout.readline()  # Read init response
-        
-        # Call the add_numbers tool on MCP server
-        tool_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/call",
-            "params": {
-                "name": "add_numbers",
-                "arguments": {"a": a, "b": b}
-            }
-        }
-        
-        process.stdin.write((json.dumps(tool_request) + "\n").encode())
-        await process.stdin.drain()
-        
-        # Read response from MCP server
-        response_line = await process.stdout.readline()
-        response = json.loads(response_line.decode().strip())
-        
-        # Clean up
-        process.terminate()
-        await process.wait()
-        
-        result = response['result']['content'][0]['text']
+        # One shared server connection; concurrent calls are matched to responses by id
+        client = await mcp_connection.get()
+        result = await client.call_tool_text("add_numbers", {"a": a, "b": b})
         print(f"🧮 MCP Server calculated: {result}")
         return result
         
@@ -240,60 +154,16 @@ async def mcp_getdatetime_tool_function(format_type: str = "readable") -> str:
     This function connects AutoGen agents to the MCP server's getdatetime tool.
     
     When an AutoGen agent calls this function, it will:
-    1. Connect to the MCP server
+    1. Reuse the shared MCP server connection (started on first use)
     2. Call the server's getdatetime function
     3. Return the datetime result to the agent
     """
     print(f"📅 AutoGen agent is calling MCP server to get datetime with format: {format_type}")
     
     try:
-        # Start the MCP server process
-        process = await asyncio.create_subprocess_exec(
-            "python", "simple_mcp_server.py",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Initialize the server
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "autogen-client", "version": "1.0.0"}
-            }
-        }
-        
-        process.stdin.write((json.dumps(init_request) + "\n").encode())
-        await process.stdin.drain()
-        await process.stdout.readline()  # Read init response
-        
-        # Call the getdatetime tool on MCP server
-        tool_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/call",
-            "params": {
-                "name": "getdatetime",
-                "arguments": {"format": format_type}
-            }
-        }
-        
-        process.stdin.write((json.dumps(tool_request) + "\n").encode())
-        await process.stdin.drain()
-        
-        # Read response from MCP server
-        response_line = await process.stdout.readline()
-        response = json.loads(response_line.decode().strip())
-        
-        # Clean up
-        process.terminate()
-        await process.wait()
-        
-        result = response['result']['content'][0]['text']
+        # One shared server connection; concurrent calls are matched to responses by id
+        client = await mcp_connection.get()
+        result = await client.call_tool_text("getdatetime", {"format": format_type})
         print(f"🕒 MCP Server returned: {result}")
         return result
         
@@ -372,6 +242,8 @@ The MCP integration is demonstrated above. Try having a conversation with me!"""
         print("Make sure you have:")
         print("1. Set Azure OpenAI configuration in your .env file")
         print("2. Installed AutoGen packages: pip install autogen-agentchat autogen-ext")
+    finally:
+        await mcp_connection.close()
 
 
 if __name__ == "__main__":
@@ -7,26 +7,46 @@ following the Model Context Protocol specification.
 
 import json
 import sys
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import asyncio
+import contextvars
 from datetime import datetime
 import os
-try:
-    from azure.cosmos import CosmosClient, PartitionKey
-    from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
-    COSMOS_AVAILABLE = True
-except ImportError:
-    COSMOS_AVAILABLE = False
+import time
+
+# The Azure SDK (cosmos_storage, twin_index) is imported on the first storage
+# tool call, so sessions that never touch storage don't pay for it
+from cosmos_throttle import StorageThrottledError
+from twin_stats import HISTOGRAM_BUCKETS
+from twin_query import OPERATORS, TwinQueryError
+from twin_write_spool import CircuitOpenError
+from tool_cache import ToolResultCache, public_tool_definition, serialize_response, tool_cache_ttl
+from tool_validation import ToolArgumentError, compile_tool_validators
+from stdio_transport import open_stdio_streams
+from request_scope import ToolTimeoutError, run_with_deadline, timeout_error_response, tool_timeout
+
+# Tools that need Cosmos DB; the first call to one of them connects to storage
+STORAGE_TOOLS = {"save_twin_info", "get_twin_info", "twin_stats", "query_twins"}
 
 
 class SimpleMCPServer:
     """A simple MCP server that provides a hello world tool."""
     
     def __init__(self):
+        self.storage = None
         self.cosmos_client = None
         self.database = None
         self.container = None
-        self._initialize_cosmos_db()
+        self.twin_index = None
+        self.twin_stats = None
+        self.twin_query = None
+        self.twin_writer = None
+        self.tool_cache = ToolResultCache(int(os.getenv("TOOL_CACHE_SIZE", "1024")))
+        # Request id -> task for calls that can still be cancelled
+        self._in_flight = {}
+        # Cosmos DB is connected on the first storage tool call (see ensure_storage)
+        self._storage_ready = None
+        self._replay_loop = None
         
         self.tools = {
             "hello_world": {
@@ -41,7 +61,10 @@ class SimpleMCPServer:
                             "default": "World"
                         }
                     }
-                }
+                },
+                # Pure tools: results are cached for identical arguments (see tool_cache.py)
+                "annotations": {"readOnlyHint": True, "idempotentHint": True},
+                "cache": {"ttlSeconds": 3600}
             },
             "add_numbers": {
                 "name": "add_numbers",
@@ -59,7 +82,44 @@ class SimpleMCPServer:
                         }
                     },
                     "required": ["a", "b"]
-                }
+                },
+                "annotations": {"readOnlyHint": True, "idempotentHint": True},
+                "cache": {"ttlSeconds": 3600}
+            },
+            "batch_math": {
+                "name": "batch_math",
+                "description": "Element-wise add/sub/mul/div of two arrays, or sum/mean/min/max of an array, in one call. Arrays are JSON numbers or base64 little-endian float64",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "op": {
+                            "type": "string",
+                            "enum": ["add", "sub", "mul", "div", "sum", "mean", "min", "max"],
+                            "description": "Operation to run"
+                        },
+                        # Elements are checked by batch_math.py, not per item by the validator
+                        "a": {
+                            "type": ["array", "string"],
+                            "description": "Numbers, or a base64 string of little-endian float64 values"
+                        },
+                        "b": {
+                            "type": ["array", "string", "number"],
+                            "description": "Second operand of add, sub, mul, div; a number applies to every element"
+                        },
+                        "reduce": {
+                            "type": "string",
+                            "enum": ["sum", "mean", "min", "max"],
+                            "description": "Reduce the element-wise result, e.g. mul + sum for a dot product"
+                        },
+                        "encoding": {
+                            "type": "string",
+                            "enum": ["json", "base64"],
+                            "description": "Encoding of array results (default: base64 if an operand was base64)"
+                        }
+                    },
+                    "required": ["op", "a"]
+                },
+                "annotations": {"readOnlyHint": True, "idempotentHint": True}
             },
             "getdatetime": {
                 "name": "getdatetime",
@@ -83,78 +143,194 @@ class SimpleMCPServer:
                     "properties": {
                         "firstName": {
                             "type": "string",
+                            "minLength": 1,
                             "description": "The first name of the Twin"
                         },
                         "lastName": {
                             "type": "string",
+                            "minLength": 1,
                             "description": "The last name of the Twin"
                         },
                         "email": {
                             "type": "string",
+                            "minLength": 1,
                             "description": "The email address of the Twin (used as ID)"
                         },
                         "telephoneNumber": {
                             "type": "string",
+                            "minLength": 1,
                             "description": "The telephone number of the Twin"
                         },
                         "countryId": {
                             "type": "string",
+                            "minLength": 1,
                             "description": "The country ID for partitioning"
                         }
                     },
                     "required": ["firstName", "lastName", "email", "telephoneNumber", "countryId"]
                 }
+            },
+            "get_twin_info": {
+                "name": "get_twin_info",
+                "description": "Get Twin information from Cosmos DB by email",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "email": {
+                            "type": "string",
+                            "minLength": 1,
+                            "description": "The email address of the Twin (its ID)"
+                        },
+                        "countryId": {
+                            "type": "string",
+                            "description": "The country ID, if known (skips the index lookup)"
+                        }
+                    },
+                    "required": ["email"]
+                }
+            },
+            "twin_stats": {
+                "name": "twin_stats",
+                "description": "Get Twin statistics (counts per country, old vs new format, createdAt histogram) computed inside Cosmos DB",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "bucket": {
+                            "type": "string",
+                            "description": "Histogram bucket size for createdAt",
+                            "enum": list(HISTOGRAM_BUCKETS),
+                            "default": "day"
+                        },
+                        "refresh": {
+                            "type": "boolean",
+                            "description": "Bypass the short-lived statistics cache",
+                            "default": False
+                        }
+                    }
+                },
+                # Cross-partition aggregates can take longer than the default
+                "timeoutSeconds": 60
+            },
+            "query_twins": {
+                "name": "query_twins",
+                "description": "Query Twins in Cosmos DB, returning only the requested fields",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "fields": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Fields to return, e.g. ['id', 'Profile.email'] (default: id, CountryID, Profile, createdAt, lastModified)"
+                        },
+                        "filters": {
+                            "type": "array",
+                            "description": "Filter predicates combined with AND; a CountryID 'eq' filter targets a single partition",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "field": {"type": "string"},
+                                    "op": {"type": "string", "enum": list(OPERATORS)},
+                                    "value": {}
+                                },
+                                "required": ["field", "value"]
+                            }
+                        },
+                        "orderBy": {
+                            "type": "string",
+                            "description": "Field to order by"
+                        },
+                        "descending": {
+                            "type": "boolean",
+                            "description": "Order descending",
+                            "default": False
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Maximum number of Twins to return (default 50, max 1000)",
+                            "minimum": 1,
+                            "maximum": 1000,
+                            "default": 50
+                        }
+                    }
+                }
             }
         }
+        
+        # Argument validators compiled once from the input schemas
+        self.validators = compile_tool_validators(self.tools)
     
     def _initialize_cosmos_db(self):
-        """Initialize Cosmos DB client and database/container."""
-        if not COSMOS_AVAILABLE:
-            print("Warning: Azure Cosmos DB SDK not available. Twin storage functionality disabled.", file=sys.stderr)
+        """Initialize Cosmos DB client and database/container (blocking; makes network calls)."""
+        from cosmos_storage import get_cosmos_storage
+        from twin_index import EmailPartitionIndex
+        from twin_stats import TwinStatsService
+        from twin_query import TwinQueryService
+        from twin_write_spool import create_twin_writer
+        
+        # Shared, warmed client (see cosmos_storage.py)
+        # Let 429s reach the adaptive write controller instead of retrying inside the SDK
+        storage = get_cosmos_storage(sdk_throttle_retries=int(os.getenv("COSMOS_SDK_THROTTLE_RETRIES", "1")))
+        if storage is None:
             return
             
         try:
-            # Get Cosmos DB configuration from environment variables
-            cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
-            cosmos_key = os.getenv("COSMOS_KEY")
+            self.storage = storage
+            self.cosmos_client = storage.client
+            self.database = storage.database
+            self.container = storage.container
             
-            if not cosmos_endpoint or not cosmos_key:
-                print("Warning: COSMOS_ENDPOINT and COSMOS_KEY environment variables not set. Twin storage functionality disabled.", file=sys.stderr)
-                return
-                
-            # Initialize the Cosmos client
-            self.cosmos_client = CosmosClient(cosmos_endpoint, cosmos_key)
-            
-            # Create database if it doesn't exist
-            database_name = "TwinHumanDB"
-            try:
-                self.database = self.cosmos_client.create_database(id=database_name)
-            except CosmosResourceExistsError:
-                self.database = self.cosmos_client.get_database_client(database_name)
-            
-            # Create container if it doesn't exist
-            container_name = "TwinHumanContainer"
-            try:
-                # Don't set throughput for serverless accounts
-                self.container = self.database.create_container(
-                    id=container_name,
-                    partition_key=PartitionKey(path="/CountryID")
-                )
-            except CosmosResourceExistsError:
-                self.container = self.database.get_container_client(container_name)
+            # Email -> CountryID index so lookups by email are point reads
+            self.twin_index = EmailPartitionIndex(storage.index_container, partitioning=storage.partitioning, telemetry=storage.telemetry)
+            self.twin_index.load()
+            self.twin_stats = TwinStatsService(self.container, float(os.getenv("TWIN_STATS_TTL_SECONDS", "30")))
+            self.twin_query = TwinQueryService(self.container, storage.partitioning, storage.telemetry)
+            # Circuit breaker with an optional local spool for outages (TWIN_WRITE_SPOOL)
+            self.twin_writer = create_twin_writer(
+                storage,
+                on_saved=lambda doc: self.twin_index.record(doc["id"], doc["CountryID"])
+            )
                 
             print("Successfully initialized Cosmos DB for Twin storage.", file=sys.stderr)
             
         except Exception as e:
             print(f"Failed to initialize Cosmos DB: {str(e)}", file=sys.stderr)
+            self.storage = None
             self.cosmos_client = None
             self.database = None
             self.container = None
+            self.twin_index = None
+            self.twin_stats = None
+            self.twin_query = None
+            self.twin_writer = None
+    
+    async def ensure_storage(self):
+        """Connect to Cosmos DB once, in a worker thread, and start the spool replay loop.
+        
+        Concurrent callers share the same attempt. It is shielded so a call
+        that times out or is cancelled while waiting doesn't abort the
+        connection for the calls after it.
+        """
+        if self._storage_ready is None:
+            self._start_storage()
+        await asyncio.shield(self._storage_ready)
+    
+    def _start_storage(self):
+        # A fresh context, so the replay loop doesn't inherit the first caller's deadline
+        self._storage_ready = asyncio.get_running_loop().create_task(self._connect_storage(), context=contextvars.Context())
+    
+    async def _connect_storage(self):
+        started = time.perf_counter()
+        await asyncio.to_thread(self._initialize_cosmos_db)
+        print(f"Cosmos DB setup took {(time.perf_counter() - started) * 1000:.0f} ms", file=sys.stderr)
+        if self.twin_writer and self.twin_writer.spool:
+            # Drain writes spooled by an earlier run, and keep draining during outages
+            self.twin_writer.schedule_replay()
+            self._replay_loop = asyncio.create_task(self.twin_writer.run_replay_loop(float(os.getenv("TWIN_SPOOL_REPLAY_SECONDS", "10"))))
     
     async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         """Handle incoming MCP requests."""
         method = request.get("method")
-        params = request.get("params", {})
+        params = request.get("params") if isinstance(request.get("params"), dict) else {}
         request_id = request.get("id")
         
         if method == "initialize":
@@ -178,7 +354,7 @@ class SimpleMCPServer:
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "result": {
-                    "tools": list(self.tools.values())
+                    "tools": [public_tool_definition(tool) for tool in self.tools.values()]
                 }
             }
         
@@ -186,6 +362,25 @@ class SimpleMCPServer:
             tool_name = params.get("name")
             arguments = params.get("arguments", {})
             
+            # Reject invalid arguments before the tool does any work
+            validator = self.validators.get(tool_name)
+            if validator:
+                try:
+                    validator(arguments, "")
+                except ToolArgumentError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32602,
+                            "message": f"Invalid arguments for {tool_name}: {str(e)}",
+                            "data": {"path": e.path}
+                        }
+                    }
+            
+            if tool_name in STORAGE_TOOLS:
+                await self.ensure_storage()
+            
             if tool_name == "hello_world":
                 name = arguments.get("name", "World")
                 response_text = f"Hello, {name}! This is a response from the MCP server."
@@ -205,8 +400,8 @@ class SimpleMCPServer:
             
             elif tool_name == "add_numbers":
                 # Extract the numbers to add
-                a = arguments.get("a", 0)
-                b = arguments.get("b", 0)
+                a = arguments["a"]
+                b = arguments["b"]
                 
                 # Perform the addition
                 result = a + b
@@ -225,6 +420,36 @@ class SimpleMCPServer:
                     }
                 }
             
+            elif tool_name == "batch_math":
+                # NumPy is imported on the first batch_math call, not at startup
+                from batch_math import BatchMathError, run_batch_math
+                
+                try:
+                    # Large arrays are decoded and computed off the event loop
+                    result = await asyncio.to_thread(run_batch_math, arguments)
+                except BatchMathError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32602,
+                            "message": str(e)
+                        }
+                    }
+                
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": json.dumps(result)
+                            }
+                        ]
+                    }
+                }
+            
             elif tool_name == "getdatetime":
                 # Get the format preference
                 format_type = arguments.get("format", "readable")
@@ -270,17 +495,6 @@ class SimpleMCPServer:
                     telephoneNumber = arguments.get("telephoneNumber")
                     countryId = arguments.get("countryId")
                     
-                    # Validate required fields
-                    if not all([firstName, lastName, email, telephoneNumber, countryId]):
-                        return {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32602,
-                                "message": "Missing required fields: firstName, lastName, email, telephoneNumber, countryId"
-                            }
-                        }
-                    
                     # Create Twin document with proper structure
                     twin_document = {
                         "id": email,  # Use email as the unique ID
@@ -295,9 +509,13 @@ class SimpleMCPServer:
                         "lastModified": datetime.now().isoformat()
                     }
                     
-                    # Save to Cosmos DB
-                    response = self.container.upsert_item(body=twin_document)
+                    # Save to Cosmos DB (or the local spool while it is unavailable)
+                    status = await self.twin_writer.save(twin_document)
                     
+                    if status == "queued":
+                        text = f"Queued Twin information for {firstName} {lastName} (ID: {email}) in country {countryId}; it will be saved when Cosmos DB is available again"
+                    else:
+                        text = f"Successfully saved Twin information for {firstName} {lastName} (ID: {email}) in country {countryId}"
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -305,12 +523,33 @@ class SimpleMCPServer:
                             "content": [
                                 {
                                     "type": "text",
-                                    "text": f"Successfully saved Twin information for {firstName} {lastName} (ID: {email}) in country {countryId}"
+                                    "text": text
                                 }
-                            ]
+                            ],
+                            "status": status
                         }
                     }
                     
+                except CircuitOpenError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32002,
+                            "message": f"Failed to save Twin information: {str(e)}",
+                            "data": {"retryAfterMs": e.retry_after_ms}
+                        }
+                    }
+                except StorageThrottledError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32001,
+                            "message": f"Failed to save Twin information: {str(e)}",
+                            "data": {"retryAfterMs": e.retry_after_ms}
+                        }
+                    }
                 except Exception as e:
                     return {
                         "jsonrpc": "2.0",
@@ -321,6 +560,159 @@ class SimpleMCPServer:
                         }
                     }
             
+            elif tool_name == "get_twin_info":
+                # Check if Cosmos DB is available
+                if not self.container:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32603,
+                            "message": "Cosmos DB not available. Please check configuration."
+                        }
+                    }
+                
+                email = arguments.get("email")
+                if not email:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32602,
+                            "message": "Missing required field: email"
+                        }
+                    }
+                
+                try:
+                    # Point read, resolving the partition through the email index
+                    twin = await self.storage.aio.run(self.twin_index.read_twin, self.container, email, arguments.get("countryId"))
+                    if twin is None:
+                        response_text = f"No Twin found with email {email}"
+                    else:
+                        response_text = json.dumps({k: v for k, v in twin.items() if not k.startswith('_')}, indent=2)
+                    
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "result": {
+                            "content": [
+                                {
+                                    "type": "text",
+                                    "text": response_text
+                                }
+                            ]
+                        }
+                    }
+                    
+                except Exception as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32603,
+                            "message": f"Failed to get Twin information: {str(e)}"
+                        }
+                    }
+            
+            elif tool_name == "twin_stats":
+                # Check if Cosmos DB is available
+                if not self.twin_stats:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32603,
+                            "message": "Cosmos DB not available. Please check configuration."
+                        }
+                    }
+                
+                try:
+                    stats = await self.storage.aio.run(self.twin_stats.collect, arguments.get("bucket", "day"), bool(arguments.get("refresh", False)))
+                except ValueError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32602,
+                            "message": str(e)
+                        }
+                    }
+                except Exception as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32603,
+                            "message": f"Failed to get Twin statistics: {str(e)}"
+                        }
+                    }
+                
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": json.dumps(stats, indent=2)
+                            }
+                        ]
+                    }
+                }
+            
+            elif tool_name == "query_twins":
+                # Check if Cosmos DB is available
+                if not self.twin_query:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32603,
+                            "message": "Cosmos DB not available. Please check configuration."
+                        }
+                    }
+                
+                try:
+                    twins = await self.storage.aio.run(
+                        self.twin_query.query,
+                        fields=arguments.get("fields"),
+                        filters=arguments.get("filters"),
+                        order_by=arguments.get("orderBy"),
+                        descending=bool(arguments.get("descending", False)),
+                        limit=arguments.get("limit", 50)
+                    )
+                except TwinQueryError as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32602,
+                            "message": str(e)
+                        }
+                    }
+                except Exception as e:
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32603,
+                            "message": f"Failed to query Twins: {str(e)}"
+                        }
+                    }
+                
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": json.dumps(twins, indent=2)
+                            }
+                        ]
+                    }
+                }
+            
             else:
                 return {
                     "jsonrpc": "2.0",
@@ -341,41 +733,161 @@ class SimpleMCPServer:
                 }
             }
     
+    async def handle_message(self, request: Dict[str, Any]) -> Optional[str]:
+        """Handle a request and return the serialized response (None for notifications/cancelled).
+        
+        Tool calls run under a deadline (see request_scope.py), and calls to
+        cacheable tools are answered from the tool result cache when the
+        same arguments were seen before.
+        """
+        if request.get("method") == "notifications/cancelled":
+            self.cancel_request((request.get("params") or {}).get("requestId"))
+            return None
+        if "id" not in request:
+            # Other notifications (e.g. notifications/initialized) need no response
+            return None
+        
+        if request.get("method") != "tools/call":
+            return json.dumps(await self.handle_request(request))
+        
+        params = request.get("params") if isinstance(request.get("params"), dict) else {}
+        tool_name = params.get("name")
+        arguments = params.get("arguments", {})
+        cache_ttl = tool_cache_ttl(self.tools.get(tool_name))
+        if cache_ttl:
+            cached = self.tool_cache.get(tool_name, arguments)
+            if cached is not None:
+                return serialize_response(request.get("id"), cached)
+        
+        try:
+            response = await run_with_deadline(
+                self.handle_request(request), tool_name, tool_timeout(self.tools.get(tool_name), params)
+            )
+        except ToolTimeoutError as e:
+            return json.dumps(timeout_error_response(request.get("id"), e))
+        if cache_ttl and "result" in response:
+            self.tool_cache.put(tool_name, arguments, response["result"], cache_ttl)
+        return json.dumps(response)
+    
+    def cancel_request(self, request_id) -> bool:
+        """Cancel an in-flight request (from notifications/cancelled); no response is sent for it."""
+        task = self._in_flight.get(request_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+    
+    def _forget_request(self, request_id, task):
+        # A client may reuse an id once the earlier call finished
+        if self._in_flight.get(request_id) is task:
+            del self._in_flight[request_id]
+    
     async def run(self):
         """Run the MCP server using stdio."""
+        spool_path = os.getenv("TWIN_WRITE_SPOOL")
+        if spool_path and os.path.exists(spool_path) and os.path.getsize(spool_path) > 0:
+            # Writes spooled by an earlier run: connect in the background to replay them
+            self._start_storage()
+        
+        streams = await open_stdio_streams()
+        if streams is None:
+            await self._run_blocking_stdio()
+        else:
+            await self._run_stdio_streams(*streams)
+    
+    async def _process_request(self, request: Dict[str, Any]) -> Optional[str]:
+        """Handle one parsed request; returns the serialized response, if any."""
+        try:
+            return await self.handle_message(request)
+        except asyncio.CancelledError:
+            # Cancelled by notifications/cancelled: the client expects no response
+            return None
+        except Exception as e:
+            # Send error response; keep the id so a concurrent client can match it to its call
+            error_response = {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": f"Internal error: {str(e)}"
+                }
+            }
+            return json.dumps(error_response)
+    
+    async def _run_stdio_streams(self, reader, writer):
+        """Serve requests concurrently over asyncio pipe streams."""
+        pending = set()
+        limit = asyncio.Semaphore(int(os.getenv("STDIO_MAX_IN_FLIGHT", "64")))
+        
+        async def dispatch(request):
+            try:
+                response = await self._process_request(request)
+                if response is not None:
+                    await writer.send(response)
+            finally:
+                limit.release()
+        
         while True:
             try:
-                # Read from stdin
-                line = await asyncio.get_event_loop().run_in_executor(
-                    None, sys.stdin.readline
-                )
-                
-                if not line:
-                    break
-                
-                # Parse the JSON-RPC request
-                try:
-                    request = json.loads(line.strip())
-                except json.JSONDecodeError:
-                    continue
-                
-                # Handle the request
-                response = await self.handle_request(request)
-                
-                # Send response to stdout
-                print(json.dumps(response), flush=True)
-                
-            except Exception as e:
-                # Send error response
-                error_response = {
-                    "jsonrpc": "2.0",
-                    "id": None,
-                    "error": {
-                        "code": -32603,
-                        "message": f"Internal error: {str(e)}"
-                    }
-                }
-                print(json.dumps(error_response), flush=True)
+                line = await reader.readline()
+            except ValueError:
+                # Message larger than STDIO_READ_LIMIT; the stream can't resync
+                print("Request exceeds STDIO_READ_LIMIT; closing stdio", file=sys.stderr)
+                break
+            if not line:
+                break
+            
+            # Parse the JSON-RPC request
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(request, dict):
+                continue
+            
+            if request.get("method") == "notifications/cancelled":
+                # Handled inline so it can't queue behind the call it cancels
+                await self._process_request(request)
+                continue
+            
+            await limit.acquire()
+            task = asyncio.create_task(dispatch(request))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            request_id = request.get("id")
+            if request_id is not None:
+                self._in_flight[request_id] = task
+                task.add_done_callback(lambda done, request_id=request_id: self._forget_request(request_id, done))
+        
+        # Answer everything already read before exiting
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        await writer.close()
+    
+    async def _run_blocking_stdio(self):
+        """Serve requests one at a time with blocking reads (stdio is a file or terminal)."""
+        while True:
+            # Read from stdin
+            line = await asyncio.get_event_loop().run_in_executor(
+                None, sys.stdin.readline
+            )
+            
+            if not line:
+                break
+            
+            # Parse the JSON-RPC request
+            try:
+                request = json.loads(line.strip())
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(request, dict):
+                continue
+            
+            response = await self._process_request(request)
+            
+            # Send response to stdout
+            if response is not None:
+                print(response, flush=True)
 
 
 async def main():
@@ -385,4 +897,13 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+    parser = argparse.ArgumentParser(description="Simple MCP server over stdio")
+    parser.add_argument("--zygote", metavar="SOCKET_PATH",
+                        help="Preload once and fork a session per connection on this Unix socket (see zygote.py)")
+    args = parser.parse_args()
+    if args.zygote:
+        from zygote import serve_zygote
+        serve_zygote(args.zygote, lambda: asyncio.run(main()))
+    else:
+        asyncio.run(main())
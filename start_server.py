@@ -1,83 +1,166 @@
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Request, Depends, Response, WebSocket, HTTPException
+from fastapi.responses import JSONResponse
 from mcp.server.sse import SseServerTransport
 from starlette.routing import Mount
 from api_key_auth import ensure_valid_api_key
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 import argparse
+import asyncio
+import json
 import os
 from datetime import datetime
+from functools import partial
 
-try:
-    from azure.cosmos import CosmosClient, PartitionKey
-    from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
-    COSMOS_AVAILABLE = True
-except ImportError:
-    COSMOS_AVAILABLE = False
+from batch_math import ELEMENTWISE_OPERATIONS, ENCODINGS, OPERATIONS as BATCH_OPERATIONS, REDUCTIONS, BatchMathError, run_batch_math
+from cosmos_storage import get_cosmos_storage
+from cosmos_throttle import StorageThrottledError
+from twin_index import EmailPartitionIndex
+from twin_stats import HISTOGRAM_BUCKETS, TwinStatsService
+from twin_query import OPERATORS, TwinQueryError, TwinQueryService
+from twin_view import ChangeFeedConsumer, TwinMaterializedView
+from twin_write_spool import CircuitOpenError, create_twin_writer
+from tool_cache import ToolResultCache, public_tool_definition, serialize_response, tool_cache_ttl
+from tool_validation import ToolArgumentError, compile_tool_validators
+from request_scope import (
+    REQUEST_CANCELLED_ERROR, ToolTimeoutError, deadline_scope, run_with_deadline, timeout_error_response, tool_timeout
+)
+from request_logging import RequestLogger
+from partition_telemetry import SORT_FIELDS
+from ws_transport import WebSocketSession, broadcast_log, websocket_stats
+from session_store import SESSION_HEADER, SESSIONS_REQUIRED, SessionStore
+from result_stream import (
+    STREAM_BATCH_SIZE, ItemStream, accepts_ndjson, batches_of, iterate_in_thread, json_response, respond_with_items
+)
 
 # Create app without global API key dependency for health endpoints
 app = FastAPI(docs_url=None, redoc_url=None)
 
 # Initialize Cosmos DB
+storage = None
 cosmos_client = None
 database = None
 container = None
+twin_index = EmailPartitionIndex()
+twin_stats = None
+twin_query = None
+twin_writer = None
 
 def initialize_cosmos_db():
     """Initialize Cosmos DB client and database/container."""
-    global cosmos_client, database, container
+    global storage, cosmos_client, database, container, twin_index, twin_stats, twin_query, twin_writer
     
-    if not COSMOS_AVAILABLE:
-        print("Warning: Azure Cosmos DB SDK not available. Twin storage functionality disabled.")
+    # Shared, warmed client (see cosmos_storage.py)
+    # Let 429s reach the adaptive write controller instead of retrying inside the SDK
+    shared_storage = get_cosmos_storage(sdk_throttle_retries=int(os.getenv("COSMOS_SDK_THROTTLE_RETRIES", "1")))
+    if shared_storage is None:
         return
         
     try:
-        # Get Cosmos DB configuration from environment variables
-        cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
-        cosmos_key = os.getenv("COSMOS_KEY")
-        
-        if not cosmos_endpoint or not cosmos_key:
-            print("Warning: COSMOS_ENDPOINT and COSMOS_KEY environment variables not set. Twin storage functionality disabled.")
-            return
-            
-        # Initialize the Cosmos client
-        cosmos_client = CosmosClient(cosmos_endpoint, cosmos_key)
-        
-        # Create database if it doesn't exist
-        database_name = "TwinHumanDB"
-        try:
-            database = cosmos_client.create_database(id=database_name)
-        except CosmosResourceExistsError:
-            database = cosmos_client.get_database_client(database_name)
+        storage = shared_storage
+        cosmos_client = storage.client
+        database = storage.database
+        container = storage.container
         
-        # Create container if it doesn't exist
-        container_name = "TwinHumanContainer"
-        try:
-            # Don't set throughput for serverless accounts
-            container = database.create_container(
-                id=container_name,
-                partition_key=PartitionKey(path="/CountryID")
-            )
-        except CosmosResourceExistsError:
-            container = database.get_container_client(container_name)
+        # Email -> CountryID index so lookups by email are point reads
+        twin_index = EmailPartitionIndex(storage.index_container, partitioning=storage.partitioning, telemetry=storage.telemetry)
+        twin_index.load()
+        twin_stats = TwinStatsService(container, float(os.getenv("TWIN_STATS_TTL_SECONDS", "30")))
+        twin_query = TwinQueryService(container, storage.partitioning, storage.telemetry)
+        # Circuit breaker with an optional local spool for outages (TWIN_WRITE_SPOOL)
+        twin_writer = create_twin_writer(
+            storage,
+            on_saved=lambda doc: twin_index.record(doc["id"], doc["CountryID"])
+        )
             
         print("Successfully initialized Cosmos DB for Twin storage.")
         
     except Exception as e:
         print(f"Failed to initialize Cosmos DB: {str(e)}")
+        storage = None
         cosmos_client = None
         database = None
         container = None
+        twin_index = EmailPartitionIndex()
+        twin_stats = None
+        twin_query = None
+        twin_writer = None
 
 # Initialize Cosmos DB on startup
 initialize_cosmos_db()
 
+# Structured request log: queued, sampled and redacted (see request_logging.py)
+request_log = RequestLogger.from_env()
+
+# Hot-partition alerts go to the structured log (see partition_telemetry.py)
+if storage:
+    def report_hot_partition(alert):
+        request_log.log_event(**alert)
+        broadcast_log("warning", "partitions", alert)
+
+    storage.telemetry.on_alert = report_hot_partition
+
+# Materialized view of Twins, kept up to date from the change feed
+twin_view = TwinMaterializedView()
+twin_view_task = None
+twin_spool_task = None
+
+
+@app.on_event("startup")
+async def start_request_log():
+    request_log.start()
+
+
+@app.on_event("startup")
+async def start_twin_view():
+    """Start the background change feed consumer that maintains the Twin view."""
+    global twin_view_task
+    if not container or os.getenv("TWIN_VIEW_ENABLED", "true").lower() == "false":
+        return
+    consumer = ChangeFeedConsumer(
+        container,
+        twin_view,
+        checkpoint_path=os.getenv("TWIN_VIEW_CHECKPOINT", "twin_view_checkpoint.json"),
+        poll_interval=float(os.getenv("TWIN_VIEW_POLL_SECONDS", "5")),
+        # Keep the email index current with writes made by other replicas
+        on_change=lambda doc: twin_index.record(doc["id"], doc["CountryID"], persist=False) if doc.get("CountryID") else None,
+    )
+    twin_view_task = asyncio.create_task(consumer.run())
+
+
+@app.on_event("startup")
+async def start_twin_spool_replay():
+    """Replay Twin writes spooled during a storage outage (including by an earlier run)."""
+    global twin_spool_task
+    if not twin_writer or not twin_writer.spool:
+        return
+    twin_writer.schedule_replay()
+    twin_spool_task = asyncio.create_task(
+        twin_writer.run_replay_loop(float(os.getenv("TWIN_SPOOL_REPLAY_SECONDS", "10")))
+    )
+
+
+@app.on_event("shutdown")
+async def stop_twin_view():
+    """Stop the change feed consumer and the spool replay loop."""
+    if twin_view_task:
+        twin_view_task.cancel()
+    if twin_spool_task:
+        twin_spool_task.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_request_log():
+    """Write the log records still queued."""
+    request_log.stop()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # or specify ["http://localhost:3000"] if you want to be strict
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SESSION_HEADER],
 )
 
 sse = SseServerTransport("/sse/")
@@ -93,16 +176,558 @@ async def health():
     """Health check endpoint."""
     return {"status": "healthy", "api_keys_configured": bool(os.getenv("API_KEYS"))}
 
-@app.post("/mcp", tags=["MCP"])
-async def handle_mcp_post(request: Request):
-    """Handle MCP JSON-RPC requests via POST."""
-    # Validate API key
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Runtime metrics for the storage layer."""
     ensure_valid_api_key(request)
+    return {
+        "cosmosWrites": storage.writes.stats() if storage else None,
+        "partitions": storage.partition_stats() if storage else None,
+        "twinWrites": twin_writer.stats() if twin_writer else None,
+        "emailIndex": twin_index.stats,
+        "toolCache": tool_cache.stats(),
+        "requestLog": request_log.stats(),
+        "websocket": websocket_stats(),
+        "sessions": mcp_sessions.stats(),
+        "twinView": {"twins": len(twin_view), "lastSyncedAt": twin_view.last_synced_at},
+    }
+
+# Tool registry. A "cache" entry marks a pure tool whose results may be reused
+# for identical arguments (see tool_cache.py); it is not sent to clients.
+TOOLS = [
+    {
+        "name": "hello_world",
+        "description": "Says hello to the world",
+        "inputSchema": {
+            "type": "object",
+            "properties": {},
+            "required": []
+        },
+        "annotations": {"readOnlyHint": True, "idempotentHint": True},
+        "cache": {"ttlSeconds": 3600}
+    },
+    {
+        "name": "add_numbers", 
+        "description": "Add two numbers together",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "a": {"type": "number", "description": "First number"},
+                "b": {"type": "number", "description": "Second number"}
+            },
+            "required": ["a", "b"]
+        },
+        "annotations": {"readOnlyHint": True, "idempotentHint": True},
+        "cache": {"ttlSeconds": 3600}
+    },
+    {
+        "name": "batch_math",
+        "description": "Element-wise add/sub/mul/div of two arrays, or sum/mean/min/max of an array, in one call. Arrays are JSON numbers or base64 little-endian float64",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "op": {"type": "string", "enum": list(BATCH_OPERATIONS), "description": "Operation to run"},
+                # Elements are checked by batch_math.py, not per item by the validator
+                "a": {"type": ["array", "string"], "description": "Numbers, or a base64 string of little-endian float64 values"},
+                "b": {"type": ["array", "string", "number"], "description": f"Second operand of {', '.join(ELEMENTWISE_OPERATIONS)}; a number applies to every element"},
+                "reduce": {"type": "string", "enum": list(REDUCTIONS), "description": "Reduce the element-wise result, e.g. mul + sum for a dot product"},
+                "encoding": {"type": "string", "enum": list(ENCODINGS), "description": "Encoding of array results (default: base64 if an operand was base64)"}
+            },
+            "required": ["op", "a"]
+        },
+        "annotations": {"readOnlyHint": True, "idempotentHint": True}
+    },
+    {
+        "name": "getdatetime",
+        "description": "Get the current date and time",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "format": {"type": "string", "description": "Format: 'iso' or 'readable'"}
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "save_twin_info",
+        "description": "Save Twin information to Cosmos DB",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "firstName": {"type": "string", "minLength": 1, "description": "The first name of the Twin"},
+                "lastName": {"type": "string", "minLength": 1, "description": "The last name of the Twin"},
+                "email": {"type": "string", "minLength": 1, "description": "The email address of the Twin (used as ID)"},
+                "telephoneNumber": {"type": "string", "minLength": 1, "description": "The telephone number of the Twin"},
+                "countryId": {"type": "string", "minLength": 1, "description": "The country ID for partitioning"}
+            },
+            "required": ["firstName", "lastName", "email", "telephoneNumber", "countryId"]
+        }
+    },
+    {
+        "name": "get_twin_info",
+        "description": "Get Twin information from Cosmos DB by email",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "email": {"type": "string", "minLength": 1, "description": "The email address of the Twin (its ID)"},
+                "countryId": {"type": "string", "minLength": 1, "description": "The country ID, if known (skips the index lookup)"}
+            },
+            "required": ["email"]
+        }
+    },
+    {
+        "name": "twin_counts_by_country",
+        "description": "Get the number of Twins per country from the in-memory Twin view",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "countryId": {"type": "string", "minLength": 1, "description": "Only return the count for this country (optional)"}
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "recent_twins",
+        "description": "Get the most recently modified Twins from the in-memory Twin view",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "limit": {"type": "integer", "description": "Number of Twins to return (default 10, max 100)"}
+            },
+            "required": []
+        },
+        # Rows can be streamed as NDJSON (see result_stream.py)
+        "stream": True
+    },
+    {
+        "name": "twin_stats",
+        "description": "Get Twin statistics (counts per country, old vs new format, createdAt histogram) computed inside Cosmos DB",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "bucket": {"type": "string", "description": "Histogram bucket size for createdAt", "enum": list(HISTOGRAM_BUCKETS)},
+                "refresh": {"type": "boolean", "description": "Bypass the short-lived statistics cache"}
+            },
+            "required": []
+        },
+        # Cross-partition aggregates can take longer than the default
+        "timeoutSeconds": 60
+    },
+    {
+        "name": "query_twins",
+        "description": "Query Twins in Cosmos DB, returning only the requested fields",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "fields": {"type": "array", "items": {"type": "string"}, "description": "Fields to return, e.g. ['id', 'Profile.email']"},
+                "filters": {
+                    "type": "array",
+                    "description": "Filter predicates combined with AND; a CountryID 'eq' filter targets a single partition",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "field": {"type": "string"},
+                            "op": {"type": "string", "enum": list(OPERATORS)},
+                            "value": {}
+                        },
+                        "required": ["field", "value"]
+                    }
+                },
+                "orderBy": {"type": "string", "description": "Field to order by"},
+                "descending": {"type": "boolean", "description": "Order descending"},
+                "limit": {"type": "integer", "minimum": 1, "maximum": 1000, "description": "Maximum number of Twins to return (default 50, max 1000)"}
+            },
+            "required": []
+        },
+        "stream": True
+    },
+    {
+        "name": "export_twins",
+        "description": "Export all Twins matching the filters as streamed NDJSON (requires Accept: application/x-ndjson)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "fields": {"type": "array", "items": {"type": "string"}, "description": "Fields to return, e.g. ['id', 'Profile.email']"},
+                "filters": {
+                    "type": "array",
+                    "description": "Filter predicates combined with AND; a CountryID 'eq' filter targets a single partition",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "field": {"type": "string"},
+                            "op": {"type": "string", "enum": list(OPERATORS)},
+                            "value": {}
+                        },
+                        "required": ["field", "value"]
+                    }
+                }
+            },
+            "required": []
+        },
+        "stream": True,
+        "timeoutSeconds": 600
+    },
+    {
+        "name": "hot_partitions",
+        "description": "Get the busiest Cosmos DB partitions over the rolling window, with requests, request units, 429s and recent hot-partition alerts",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "top": {"type": "integer", "minimum": 1, "maximum": 100, "description": "Number of partitions to return (default 10)"},
+                "sortBy": {"type": "string", "enum": list(SORT_FIELDS), "description": "Rank by requests (ops), request units or 429s"}
+            },
+            "required": []
+        },
+        "annotations": {"readOnlyHint": True}
+    }
+]
+TOOLS_BY_NAME = {tool["name"]: tool for tool in TOOLS}
+
+# Argument validators compiled once from the input schemas
+TOOL_VALIDATORS = compile_tool_validators(TOOLS)
+
+tool_cache = ToolResultCache(int(os.getenv("TOOL_CACHE_SIZE", "1024")))
+
+# (caller, request id) -> tool call task, for notifications/cancelled; the
+# caller is the MCP session, or the API key for requests without one
+in_flight_calls = {}
+
+# MCP sessions started by initialize on POST /mcp (see session_store.py)
+mcp_sessions = SessionStore()
+
+
+async def cancel_on_disconnect(request: Request, call: asyncio.Future):
+    """Cancel a tool call if the HTTP client goes away before it finishes."""
+    while not call.done():
+        if await request.is_disconnected():
+            call.cancel()
+            return
+        await asyncio.sleep(0.5)
+
+
+def open_item_stream(tool_name, arguments):
+    """Rows of a streaming tool as an ItemStream, or None if storage isn't available."""
+    if tool_name == "recent_twins":
+        limit = max(1, min(int(arguments.get("limit", 10)), 100))
+        return ItemStream(batches_of(twin_view.recent(limit)), lambda count: {"lastSyncedAt": twin_view.last_synced_at})
+    if not twin_query:
+        return None
     
-    # Get the JSON-RPC request
+    charge = {"total": 0.0}
+    
+    def response_hook(headers, _result):
+        charge["total"] += float(headers.get("x-ms-request-charge", 0) or 0)
+    
+    if tool_name == "export_twins":
+        order_by, descending, limit = None, False, None
+    else:
+        order_by, descending, limit = arguments.get("orderBy"), bool(arguments.get("descending", False)), arguments.get("limit", 50)
+    batches = iterate_in_thread(lambda: twin_query.iter_query(
+        arguments.get("fields"), arguments.get("filters"), order_by, descending, limit,
+        page_size=STREAM_BATCH_SIZE, response_hook=response_hook
+    ))
+    return ItemStream(batches, lambda count: {"count": count, "requestCharge": round(charge["total"], 2)})
+
+
+async def stream_tool_call(request: Request, json_data, tool_name, arguments):
+    """Run a streaming tool; large results are sent as compressed NDJSON (see result_stream.py)."""
+    timeout = tool_timeout(TOOLS_BY_NAME.get(tool_name), json_data.get("params"))
+    # The scope stays with the row iterator, so pages read while streaming keep the deadline
+    with deadline_scope(timeout) as scope:
+        stream = open_item_stream(tool_name, arguments)
+    if stream is None:
+        return {
+            "jsonrpc": "2.0",
+            "id": json_data.get("id"),
+            "error": {
+                "code": -32603,
+                "message": "Cosmos DB not available. Please check configuration."
+            }
+        }
+    return await respond_with_items(
+        json_data.get("id"), tool_name, stream, scope, timeout, request.headers.get("accept-encoding")
+    )
+
+
+async def call_tool(json_data, tool_name, arguments):
+    """Run a tool and return its JSON-RPC response."""
+    if tool_name == "hello_world":
+        result = "Hello, World! This is your MCP server running on Azure! 🌟"
+    elif tool_name == "add_numbers":
+        a = arguments["a"]
+        b = arguments["b"]
+        result = f"The sum of {a} + {b} = {a + b}"
+    elif tool_name == "batch_math":
+        try:
+            # Large arrays are decoded and computed off the event loop
+            result = json.dumps(await asyncio.to_thread(run_batch_math, arguments))
+        except BatchMathError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32602,
+                    "message": str(e)
+                }
+            }
+    elif tool_name == "getdatetime":
+        format_type = arguments.get("format", "readable")
+        now = datetime.now()
+        if format_type == "iso":
+            result_text = now.isoformat()
+        else:  # readable format
+            result_text = now.strftime("%A, %B %d, %Y at %I:%M:%S %p")
+        result = f"Current date and time: {result_text}"
+    elif tool_name == "save_twin_info":
+        # Check if Cosmos DB is available
+        if not container:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": "Cosmos DB not available. Please check configuration."
+                }
+            }
+        
+        try:
+            # Extract Twin information
+            firstName = arguments.get("firstName")
+            lastName = arguments.get("lastName") 
+            email = arguments.get("email")
+            telephoneNumber = arguments.get("telephoneNumber")
+            countryId = arguments.get("countryId")
+            
+            # Create Twin document with nested Profile structure
+            twin_document = {
+                "id": email,  # Use email as the unique ID
+                "CountryID": countryId,  # Use uppercase CountryID for partition key
+                "Profile": {
+                    "firstName": firstName,
+                    "lastName": lastName,
+                    "email": email,
+                    "telephoneNumber": telephoneNumber
+                },
+                "createdAt": datetime.now().isoformat(),
+                "lastModified": datetime.now().isoformat()
+            }
+            
+            # Save to Cosmos DB (or the local spool while it is unavailable)
+            status = await twin_writer.save(twin_document)
+            if status == "queued":
+                result = f"Queued Twin information for {firstName} {lastName} (ID: {email}) in country {countryId}; it will be saved when Cosmos DB is available again"
+            else:
+                result = f"Successfully saved Twin information for {firstName} {lastName} (ID: {email}) in country {countryId}"
+            
+        except CircuitOpenError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32002,
+                    "message": f"Failed to save Twin information: {str(e)}",
+                    "data": {"retryAfterMs": e.retry_after_ms}
+                }
+            }
+        except StorageThrottledError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32001,
+                    "message": f"Failed to save Twin information: {str(e)}",
+                    "data": {"retryAfterMs": e.retry_after_ms}
+                }
+            }
+        except Exception as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": f"Failed to save Twin information: {str(e)}"
+                }
+            }
+    elif tool_name == "get_twin_info":
+        # Check if Cosmos DB is available
+        if not container:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": "Cosmos DB not available. Please check configuration."
+                }
+            }
+        
+        email = arguments.get("email")
+        if not email:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32602,
+                    "message": "Missing required field: email"
+                }
+            }
+        
+        try:
+            # Point read, resolving the partition through the email index
+            twin = await storage.aio.run(twin_index.read_twin, container, email, arguments.get("countryId"))
+            if twin is None:
+                result = f"No Twin found with email {email}"
+            else:
+                result = json.dumps({k: v for k, v in twin.items() if not k.startswith('_')}, indent=2)
+            
+        except Exception as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": f"Failed to get Twin information: {str(e)}"
+                }
+            }
+    elif tool_name == "twin_counts_by_country":
+        counts = twin_view.country_counts(arguments.get("countryId"))
+        result = json.dumps({
+            "counts": counts,
+            "total": len(twin_view),
+            "lastSyncedAt": twin_view.last_synced_at
+        }, indent=2)
+    elif tool_name == "recent_twins":
+        limit = max(1, min(int(arguments.get("limit", 10)), 100))
+        result = json.dumps({
+            "twins": twin_view.recent(limit),
+            "lastSyncedAt": twin_view.last_synced_at
+        }, indent=2)
+    elif tool_name == "twin_stats":
+        # Check if Cosmos DB is available
+        if not twin_stats:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": "Cosmos DB not available. Please check configuration."
+                }
+            }
+        
+        try:
+            stats = await storage.aio.run(twin_stats.collect, arguments.get("bucket", "day"), bool(arguments.get("refresh", False)))
+            result = json.dumps(stats, indent=2)
+        except ValueError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32602,
+                    "message": str(e)
+                }
+            }
+        except Exception as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": f"Failed to get Twin statistics: {str(e)}"
+                }
+            }
+    elif tool_name == "hot_partitions":
+        # Check if Cosmos DB is available
+        if not storage:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": "Cosmos DB not available. Please check configuration."
+                }
+            }
+        
+        result = json.dumps(storage.partition_stats(int(arguments.get("top", 10)), arguments.get("sortBy", "ops")), indent=2)
+    elif tool_name == "query_twins":
+        # Check if Cosmos DB is available
+        if not twin_query:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": "Cosmos DB not available. Please check configuration."
+                }
+            }
+        
+        try:
+            twins = await storage.aio.run(
+                twin_query.query,
+                fields=arguments.get("fields"),
+                filters=arguments.get("filters"),
+                order_by=arguments.get("orderBy"),
+                descending=bool(arguments.get("descending", False)),
+                limit=arguments.get("limit", 50)
+            )
+            result = json.dumps(twins, indent=2)
+        except TwinQueryError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32602,
+                    "message": str(e)
+                }
+            }
+        except Exception as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32603,
+                    "message": f"Failed to query Twins: {str(e)}"
+                }
+            }
+    else:
+        return {
+            "jsonrpc": "2.0",
+            "id": json_data.get("id"),
+            "error": {
+                "code": -32601,
+                "message": f"Unknown tool: {tool_name}"
+            }
+        }
+    
+    response = {
+        "jsonrpc": "2.0",
+        "id": json_data.get("id"),
+        "result": {
+            "content": [
+                {
+                    "type": "text",
+                    "text": result
+                }
+            ]
+        }
+    }
+    return response
+
+
+async def process_message(json_data, caller, client=None, transport="http", watch=None, stream=None):
+    """Handle one JSON-RPC message from POST /mcp or /ws.
+
+    Returns the response as a dict, as already serialized JSON (cached
+    results), or None for notifications. ``caller`` scopes
+    notifications/cancelled to the caller's own calls; ``watch(call)`` may
+    start a task that cancels the call, e.g. when the client goes away.
+    ``stream(json_data, tool_name, arguments)``, if given, answers calls
+    to streaming tools (and may return a Response).
+    """
     try:
-        json_data = await request.json()
-        print(f"📨 Received MCP request: {json_data}")
+        request_log.log_request(json_data, client=client, transport=transport)
+        
+        # Notifications (no id) get no JSON-RPC response; cancellation is handled below
+        if "id" not in json_data and json_data.get("method") != "notifications/cancelled":
+            return None
         
         # Create a simple response for testing
         if json_data.get("method") == "initialize":
@@ -122,162 +747,102 @@ async def handle_mcp_post(request: Request):
             }
             return response
             
+        elif json_data.get("method") == "ping":
+            return {"jsonrpc": "2.0", "id": json_data.get("id"), "result": {}}
+            
         elif json_data.get("method") == "tools/list":
             response = {
                 "jsonrpc": "2.0", 
                 "id": json_data.get("id"),
                 "result": {
-                    "tools": [
-                        {
-                            "name": "hello_world",
-                            "description": "Says hello to the world",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {},
-                                "required": []
-                            }
-                        },
-                        {
-                            "name": "add_numbers", 
-                            "description": "Add two numbers together",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "a": {"type": "number", "description": "First number"},
-                                    "b": {"type": "number", "description": "Second number"}
-                                },
-                                "required": ["a", "b"]
-                            }
-                        },
-                        {
-                            "name": "getdatetime",
-                            "description": "Get the current date and time",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "format": {"type": "string", "description": "Format: 'iso' or 'readable'"}
-                                },
-                                "required": []
-                            }
-                        },
-                        {
-                            "name": "save_twin_info",
-                            "description": "Save Twin information to Cosmos DB",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "firstName": {"type": "string", "description": "The first name of the Twin"},
-                                    "lastName": {"type": "string", "description": "The last name of the Twin"},
-                                    "email": {"type": "string", "description": "The email address of the Twin (used as ID)"},
-                                    "telephoneNumber": {"type": "string", "description": "The telephone number of the Twin"},
-                                    "countryId": {"type": "string", "description": "The country ID for partitioning"}
-                                },
-                                "required": ["firstName", "lastName", "email", "telephoneNumber", "countryId"]
-                            }
-                        }
-                    ]
+                    "tools": [public_tool_definition(tool) for tool in TOOLS]
                 }
             }
             return response
             
+        elif json_data.get("method") == "notifications/cancelled":
+            # Cancel the caller's matching in-flight tools/call; notifications get no response body
+            request_id = (json_data.get("params") or {}).get("requestId")
+            call = in_flight_calls.get((caller, request_id))
+            if call is not None:
+                call.cancel()
+            return None
+            
         elif json_data.get("method") == "tools/call":
-            tool_name = json_data.get("params", {}).get("name")
-            arguments = json_data.get("params", {}).get("arguments", {})
+            params = json_data.get("params") if isinstance(json_data.get("params"), dict) else {}
+            tool_name = params.get("name")
+            arguments = params.get("arguments", {})
             
-            if tool_name == "hello_world":
-                result = "Hello, World! This is your MCP server running on Azure! 🌟"
-            elif tool_name == "add_numbers":
-                a = arguments.get("a", 0)
-                b = arguments.get("b", 0)
-                result = f"The sum of {a} + {b} = {a + b}"
-            elif tool_name == "getdatetime":
-                format_type = arguments.get("format", "readable")
-                now = datetime.now()
-                if format_type == "iso":
-                    result_text = now.isoformat()
-                else:  # readable format
-                    result_text = now.strftime("%A, %B %d, %Y at %I:%M:%S %p")
-                result = f"Current date and time: {result_text}"
-            elif tool_name == "save_twin_info":
-                # Check if Cosmos DB is available
-                if not container:
-                    return {
-                        "jsonrpc": "2.0",
-                        "id": json_data.get("id"),
-                        "error": {
-                            "code": -32603,
-                            "message": "Cosmos DB not available. Please check configuration."
-                        }
-                    }
-                
+            # Reject invalid arguments before the tool does any work
+            validator = TOOL_VALIDATORS.get(tool_name)
+            if validator:
                 try:
-                    # Extract Twin information
-                    firstName = arguments.get("firstName")
-                    lastName = arguments.get("lastName") 
-                    email = arguments.get("email")
-                    telephoneNumber = arguments.get("telephoneNumber")
-                    countryId = arguments.get("countryId")
-                    
-                    # Validate required fields
-                    if not all([firstName, lastName, email, telephoneNumber, countryId]):
-                        return {
-                            "jsonrpc": "2.0",
-                            "id": json_data.get("id"),
-                            "error": {
-                                "code": -32602,
-                                "message": "Missing required fields: firstName, lastName, email, telephoneNumber, countryId"
-                            }
-                        }
-                    
-                    # Create Twin document with nested Profile structure
-                    twin_document = {
-                        "id": email,  # Use email as the unique ID
-                        "CountryID": countryId,  # Use uppercase CountryID for partition key
-                        "Profile": {
-                            "firstName": firstName,
-                            "lastName": lastName,
-                            "email": email,
-                            "telephoneNumber": telephoneNumber
-                        },
-                        "createdAt": datetime.now().isoformat(),
-                        "lastModified": datetime.now().isoformat()
-                    }
-                    
-                    # Save to Cosmos DB
-                    response_doc = container.upsert_item(body=twin_document)
-                    result = f"Successfully saved Twin information for {firstName} {lastName} (ID: {email}) in country {countryId}"
-                    
-                except Exception as e:
+                    validator(arguments, "")
+                except ToolArgumentError as e:
                     return {
                         "jsonrpc": "2.0",
                         "id": json_data.get("id"),
                         "error": {
-                            "code": -32603,
-                            "message": f"Failed to save Twin information: {str(e)}"
+                            "code": -32602,
+                            "message": f"Invalid arguments for {tool_name}: {str(e)}",
+                            "data": {"path": e.path}
                         }
                     }
-            else:
+            
+            # Listing tools stream large results to clients that accept NDJSON
+            if stream and (TOOLS_BY_NAME.get(tool_name) or {}).get("stream"):
+                return await stream(json_data, tool_name, arguments)
+            if tool_name == "export_twins":
                 return {
                     "jsonrpc": "2.0",
                     "id": json_data.get("id"),
                     "error": {
-                        "code": -32601,
-                        "message": f"Unknown tool: {tool_name}"
+                        "code": -32600,
+                        "message": "export_twins streams its result; POST to /mcp with Accept: application/x-ndjson"
                     }
                 }
             
-            response = {
-                "jsonrpc": "2.0",
-                "id": json_data.get("id"),
-                "result": {
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": result
-                        }
-                    ]
+            # Pure tools: reuse the serialized result of an identical earlier call
+            cache_ttl = tool_cache_ttl(TOOLS_BY_NAME.get(tool_name))
+            if cache_ttl:
+                cached = tool_cache.get(tool_name, arguments)
+                if cached is not None:
+                    return serialize_response(json_data.get("id"), cached)
+            
+            # Run the tool under its deadline; notifications/cancelled or a
+            # client disconnect cancels it (see request_scope.py)
+            call = asyncio.ensure_future(run_with_deadline(
+                call_tool(json_data, tool_name, arguments),
+                tool_name,
+                tool_timeout(TOOLS_BY_NAME.get(tool_name), json_data.get("params"))
+            ))
+            call_key = (caller, json_data.get("id"))
+            in_flight_calls[call_key] = call
+            watcher = watch(call) if watch else None
+            try:
+                response = await call
+            except ToolTimeoutError as e:
+                return timeout_error_response(json_data.get("id"), e)
+            except asyncio.CancelledError:
+                # Re-raise if this handler itself is being cancelled
+                if asyncio.current_task().cancelling():
+                    raise
+                return {
+                    "jsonrpc": "2.0",
+                    "id": json_data.get("id"),
+                    "error": {
+                        "code": REQUEST_CANCELLED_ERROR,
+                        "message": "Request cancelled"
+                    }
                 }
-            }
+            finally:
+                if watcher:
+                    watcher.cancel()
+                if in_flight_calls.get(call_key) is call:
+                    del in_flight_calls[call_key]
+            
+            if cache_ttl and "result" in response:
+                tool_cache.put(tool_name, arguments, response["result"], cache_ttl)
             return response
             
         else:
@@ -291,10 +856,10 @@ async def handle_mcp_post(request: Request):
             }
             
     except Exception as e:
-        print(f"❌ Error processing MCP request: {e}")
+        request_log.log_error("mcp.error", e, method=json_data.get("method"), requestId=json_data.get("id"))
         return {
             "jsonrpc": "2.0",
-            "id": json_data.get("id") if 'json_data' in locals() else None,
+            "id": json_data.get("id"),
             "error": {
                 "code": -32603,
                 "message": f"Internal error: {str(e)}"
@@ -302,6 +867,117 @@ async def handle_mcp_post(request: Request):
         }
 
 
+@app.post("/mcp", tags=["MCP"])
+async def handle_mcp_post(request: Request):
+    """Handle MCP JSON-RPC requests via POST."""
+    # Validate API key
+    api_key = ensure_valid_api_key(request)
+    
+    # Get the JSON-RPC request
+    try:
+        json_data = await request.json()
+    except Exception as e:
+        request_log.log_error("mcp.error", e)
+        return {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {
+                "code": -32603,
+                "message": f"Internal error: {str(e)}"
+            }
+        }
+    
+    if not isinstance(json_data, dict):
+        return {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {"code": -32600, "message": "Invalid Request: expected a JSON object"}
+        }
+    
+    # initialize starts a session; later requests name it in the Mcp-Session-Id header
+    session = None
+    session_id = request.headers.get(SESSION_HEADER)
+    if json_data.get("method") == "initialize":
+        session = mcp_sessions.create(api_key, json_data.get("params"))
+    elif session_id:
+        session = mcp_sessions.get(session_id, api_key)
+        if session is None:
+            # 404 tells the client to initialize a new session
+            return JSONResponse(status_code=404, content={
+                "jsonrpc": "2.0",
+                "id": json_data.get("id"),
+                "error": {
+                    "code": -32600,
+                    "message": "Unknown or expired session; send initialize again"
+                }
+            })
+    elif SESSIONS_REQUIRED:
+        return JSONResponse(status_code=400, content={
+            "jsonrpc": "2.0",
+            "id": json_data.get("id"),
+            "error": {
+                "code": -32600,
+                "message": f"Missing {SESSION_HEADER} header; send initialize first"
+            }
+        })
+    
+    response = await process_message(
+        json_data, session or api_key,
+        client=request.client.host if request.client else None,
+        watch=lambda call: asyncio.create_task(cancel_on_disconnect(request, call)),
+        stream=partial(stream_tool_call, request) if accepts_ndjson(request.headers.get("accept")) else None
+    )
+    if session is not None:
+        session.record(json_data, failed=isinstance(response, dict) and "error" in response)
+    
+    if response is None:
+        http_response = Response(status_code=202)
+    elif isinstance(response, Response):
+        http_response = response
+    else:
+        # Large results (e.g. statistics) are compressed if the client accepts it
+        http_response = json_response(response if isinstance(response, str) else json.dumps(response), request.headers.get("accept-encoding"))
+    if session is not None:
+        http_response.headers[SESSION_HEADER] = session.id
+    return http_response
+
+
+@app.delete("/mcp", tags=["MCP"])
+async def handle_mcp_delete(request: Request):
+    """End the MCP session named in the Mcp-Session-Id header and cancel its running calls."""
+    api_key = ensure_valid_api_key(request)
+    session = mcp_sessions.delete(request.headers.get(SESSION_HEADER) or "", api_key)
+    if session is None:
+        return Response(status_code=404)
+    for (caller, _), call in list(in_flight_calls.items()):
+        if caller is session:
+            call.cancel()
+    return Response(status_code=204)
+
+
+async def dispatch_ws_message(json_data, session):
+    """Handle one message received on a /ws connection."""
+    if json_data.get("method") == "logging/setLevel":
+        # Log notifications need a connection to be sent on, so only /ws offers them
+        return session.set_log_level(json_data)
+    response = await process_message(json_data, session, client=session.client, transport="ws")
+    if json_data.get("method") == "initialize" and isinstance(response, dict) and "result" in response:
+        response["result"]["capabilities"]["logging"] = {}
+    return response
+
+
+@app.websocket("/ws")
+async def handle_mcp_websocket(websocket: WebSocket):
+    """Handle MCP JSON-RPC over a WebSocket: authenticated once, many requests in flight (see ws_transport.py)."""
+    try:
+        ensure_valid_api_key(websocket)
+    except HTTPException as e:
+        # Closing before accept rejects the handshake with 403
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+    await WebSocketSession(websocket, dispatch_ws_message).run()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Start FastAPI server")
     parser.add_argument("--host", type=str, default="0.0.0.0", help="Host to bind to (default: 0.0.0.0)")
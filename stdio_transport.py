@@ -0,0 +1,105 @@
+"""
+Asyncio stream transport for the stdio MCP server.
+
+stdin and stdout are connected to the event loop as pipes, so reading a
+request doesn't need a thread-pool hop and writing a response doesn't
+need a blocking syscall per message. Responses that become ready in the
+same loop iteration are coalesced into a single write.
+
+Pipe transports only work when stdin/stdout are pipes, sockets or
+character devices; ``open_stdio_streams`` returns None otherwise (e.g. a
+redirected regular file) so the caller can fall back to blocking I/O.
+When both are the same socket (a zygote session, see zygote.py) it is
+opened as a socket stream.
+"""
+
+import asyncio
+import os
+import socket
+import stat
+import sys
+from typing import Optional, Tuple
+
+# Largest single JSON-RPC message accepted on stdin
+STDIO_READ_LIMIT = int(os.getenv("STDIO_READ_LIMIT", str(16 * 1024 * 1024)))
+
+# Wait for the pipe to drain once this much output is buffered
+WRITE_HIGH_WATER = 1024 * 1024
+
+
+class CoalescingWriter:
+    """Buffers outgoing lines and writes everything queued in one loop iteration at once."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._pending = []
+        self._flush_scheduled = False
+        self.writes = 0
+        self.messages = 0
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self._pending or self.writer.is_closing():
+            return
+        data = "".join(self._pending).encode("utf-8")
+        self._pending.clear()
+        self.writer.write(data)
+        self.writes += 1
+
+    async def send(self, line: str):
+        """Queue one message (a serialized JSON-RPC response) for output."""
+        self._pending.append(line + "\n")
+        self.messages += 1
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        if self.writer.transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+            await self.writer.drain()
+
+    async def close(self):
+        self._flush()
+        await self.writer.drain()
+        self.writer.close()
+
+
+def _is_stream(file) -> bool:
+    try:
+        mode = os.fstat(file.fileno()).st_mode
+    except (OSError, ValueError, AttributeError):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+
+def _shared_socket(first, second) -> bool:
+    """True if both files are the same socket (e.g. a zygote session or a socketpair)."""
+    try:
+        first_stat, second_stat = os.fstat(first.fileno()), os.fstat(second.fileno())
+    except (OSError, ValueError, AttributeError):
+        return False
+    return stat.S_ISSOCK(first_stat.st_mode) and (first_stat.st_dev, first_stat.st_ino) == (second_stat.st_dev, second_stat.st_ino)
+
+
+async def open_stdio_streams() -> Optional[Tuple[asyncio.StreamReader, CoalescingWriter]]:
+    """Connect stdin/stdout to the running loop; returns None if they aren't pipes."""
+    if not (_is_stream(sys.stdin) and _is_stream(sys.stdout)):
+        print("stdio is not a pipe; using blocking I/O", file=sys.stderr)
+        return None
+
+    if _shared_socket(sys.stdin, sys.stdout):
+        # A write pipe transport treats the socket becoming readable as the
+        # peer closing it, so a socket serving both directions is opened as a
+        # socket stream instead
+        connection = socket.socket(fileno=os.dup(sys.stdin.fileno()))
+        reader, writer = await asyncio.open_connection(sock=connection, limit=STDIO_READ_LIMIT)
+        return reader, CoalescingWriter(writer)
+
+    loop = asyncio.get_running_loop()
+    try:
+        reader = asyncio.StreamReader(limit=STDIO_READ_LIMIT)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+    except (ValueError, OSError, NotImplementedError) as e:
+        print(f"stdio is not a pipe ({str(e)}); using blocking I/O", file=sys.stderr)
+        return None
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    return reader, CoalescingWriter(writer)
@@ -0,0 +1,26 @@
+import pytest
+
+import batch_math
+from batch_math import BatchMathError, run_batch_math
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def numpy_path(request, monkeypatch):
+    if request.param and not batch_math.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(batch_math, "NUMPY_AVAILABLE", request.param)
+
+
+@pytest.mark.parametrize("a, message", [
+    ([1, [2]], "a[1] must be a number"),
+    ([[1], [2, 3]], "a[0] must be a number"),
+    ([[1], [2]], "a[0] must be a number"),
+    ([True, 2], "a[0] must be a number"),
+])
+def test_rejects_nested_ragged_and_boolean_operands(numpy_path, a, message):
+    with pytest.raises(BatchMathError, match=message.replace("[", r"\[").replace("]", r"\]")):
+        run_batch_math({"op": "add", "a": a, "b": [1, 2]})
+
+
+def test_elementwise_add(numpy_path):
+    assert run_batch_math({"op": "add", "a": [1, 2.5], "b": [3, 4]})["result"] == [4.0, 6.5]
@@ -0,0 +1,20 @@
+import asyncio
+import json
+
+from simple_mcp_server import SimpleMCPServer
+
+
+def test_handler_exception_keeps_request_id(monkeypatch):
+    server = SimpleMCPServer()
+
+    async def failing_handler(request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(server, "handle_request", failing_handler)
+    response = json.loads(asyncio.run(server._process_request(
+        {"jsonrpc": "2.0", "id": 7, "method": "tools/list"}
+    )))
+
+    assert response["id"] == 7
+    assert response["error"]["code"] == -32603
+    assert "boom" in response["error"]["message"]
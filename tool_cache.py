@@ -0,0 +1,109 @@
+"""
+Result cache for deterministic (pure) MCP tools.
+
+A tool opts in by declaring a cache policy in its registry entry:
+
+    "cache": {"ttlSeconds": 300}
+
+Results are kept as serialized JSON in a bounded LRU keyed by a canonical
+hash of (tool name, arguments), so a hit skips both the tool's work and
+response serialization; only the JSON-RPC envelope with the caller's id is
+built around it. The "cache" entry is server-side only and is stripped
+from tools/list.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Results larger than this are not worth pinning in memory
+MAX_ENTRY_BYTES = 64 * 1024
+
+# Registry entries that configure the server and are not sent to clients
+SERVER_ONLY_KEYS = ("cache", "timeoutSeconds", "stream")
+
+
+def public_tool_definition(tool: Dict[str, Any]) -> Dict[str, Any]:
+    """The tool definition as sent to clients (without server-side policy entries)."""
+    return {key: value for key, value in tool.items() if key not in SERVER_ONLY_KEYS}
+
+
+def tool_cache_ttl(tool: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Return the cache TTL in seconds declared by a tool, or None if it isn't cacheable."""
+    if not tool or "cache" not in tool:
+        return None
+    return float(tool["cache"].get("ttlSeconds", 0)) or None
+
+
+def canonical_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """Hash of the tool name and arguments that doesn't depend on key order or whitespace."""
+    payload = json.dumps([tool_name, arguments], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def serialize_response(request_id: Any, serialized_result: str) -> str:
+    """Build a JSON-RPC response around an already serialized result."""
+    return f'{{"jsonrpc": "2.0", "id": {json.dumps(request_id)}, "result": {serialized_result}}}'
+
+
+class ToolResultCache:
+    """Bounded LRU of serialized tool results with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, serialized)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, tool_name: str, outcome: str):
+        counters = self._counters.setdefault(tool_name, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        """Return the serialized result for these arguments, or None."""
+        key = canonical_key(tool_name, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(tool_name, "hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self._count(tool_name, "misses")
+            return None
+
+    def put(self, tool_name: str, arguments: Dict[str, Any], result: Any, ttl_seconds: float) -> str:
+        """Serialize and cache a result; returns the serialized result."""
+        serialized = json.dumps(result)
+        if len(serialized) > MAX_ENTRY_BYTES or self.max_entries <= 0:
+            return serialized
+        key = canonical_key(tool_name, arguments)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_seconds, serialized)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return serialized
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count plus hits, misses and hit ratio overall and per tool."""
+        with self._lock:
+            per_tool = {
+                name: dict(counters, hitRatio=round(counters["hits"] / max(1, counters["hits"] + counters["misses"]), 3))
+                for name, counters in self._counters.items()
+            }
+            entries = len(self._entries)
+        hits = sum(counters["hits"] for counters in per_tool.values())
+        misses = sum(counters["misses"] for counters in per_tool.values())
+        return {
+            "entries": entries,
+            "maxEntries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hitRatio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "tools": per_tool,
+        }
@@ -0,0 +1,96 @@
+"""
+Concurrent execution of tool-call plans with dependencies.
+
+A plan maps step names to tool calls. Steps without dependencies start
+immediately and run concurrently (up to ``max_concurrency`` at a time),
+so a multi-tool agent step takes about as long as its slowest call
+instead of the sum of all calls. A step can list steps it depends on in
+``after``; its ``arguments`` may then be a function that receives the
+outputs of those steps:
+
+    outcomes = await run_tool_plan(client, {
+        "sum": {"tool": "add_numbers", "arguments": {"a": 25, "b": 17}},
+        "timestamp": {"tool": "getdatetime", "arguments": {"format": "readable"}},
+        "greeting": {
+            "tool": "hello_world",
+            "after": ["sum"],
+            "arguments": lambda outputs: {"name": outputs["sum"]},
+        },
+    })
+
+Each outcome holds the step's text ``output`` (or ``error``), when it
+started relative to the plan (``startOffset``) and how long it took
+(``seconds``). Steps whose dependencies failed are skipped.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+
+def _validate_plan(plan: Dict[str, Dict[str, Any]]):
+    for name, step in plan.items():
+        if "tool" not in step:
+            raise ValueError(f"Step '{name}' has no tool")
+        for dependency in step.get("after", []):
+            if dependency not in plan:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dependency}'")
+
+    # Depth-first search for cycles
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for dependency in plan[name].get("after", []):
+            visit(dependency, path + [name])
+        state[name] = "done"
+
+    for name in plan:
+        visit(name, [])
+
+
+async def run_tool_plan(client, plan: Dict[str, Dict[str, Any]], max_concurrency: int = 8,
+                        timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """Run every step of a plan on an MCPClient and return the outcome of each step."""
+    _validate_plan(plan)
+    limit = asyncio.Semaphore(max_concurrency)
+    started = time.perf_counter()
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_step(name):
+        step = plan[name]
+        dependencies = step.get("after", [])
+        if dependencies:
+            await asyncio.gather(*(tasks[dependency] for dependency in dependencies))
+            failed = [dependency for dependency in dependencies if "error" in outcomes[dependency]]
+            if failed:
+                outcomes[name] = {"tool": step["tool"], "error": f"Skipped: {', '.join(failed)} failed", "skipped": True}
+                return
+
+        arguments = step.get("arguments") or {}
+        if callable(arguments):
+            try:
+                arguments = arguments({dependency: outcomes[dependency]["output"] for dependency in dependencies})
+            except Exception as e:
+                outcomes[name] = {"tool": step["tool"], "error": f"Could not build arguments: {e}"}
+                return
+
+        async with limit:
+            step_started = time.perf_counter()
+            outcome = {"tool": step["tool"], "startOffset": round(step_started - started, 4)}
+            try:
+                outcome["output"] = await client.call_tool_text(step["tool"], arguments, timeout=timeout)
+            except Exception as e:
+                outcome["error"] = str(e)
+            outcome["seconds"] = round(time.perf_counter() - step_started, 4)
+        outcomes[name] = outcome
+
+    for name in plan:
+        tasks[name] = asyncio.create_task(run_step(name))
+    await asyncio.gather(*tasks.values())
+    return {name: outcomes[name] for name in plan}
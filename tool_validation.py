@@ -0,0 +1,199 @@
+"""
+Precompiled validation of tool arguments against each tool's inputSchema.
+
+Every schema is compiled once, when the server starts, into a tree of small
+closures, so a call only runs the checks its schema actually declares.
+Invalid arguments are rejected with the JSON path of the first offending
+value (e.g. ``filters[0].op``) before the tool does any work.
+
+Supported keywords (the subset the tool schemas use): type, properties,
+required, additionalProperties (boolean), items, enum, minLength,
+maxLength, pattern, minimum, maximum, minItems and maxItems. Annotations
+such as description and default are ignored.
+"""
+
+import re
+from typing import Any, Callable, Dict, List
+
+Validator = Callable[[Any, str], None]
+
+TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: (isinstance(value, int) and not isinstance(value, bool))
+                             or (isinstance(value, float) and value.is_integer()),
+}
+
+
+class ToolArgumentError(ValueError):
+    """Raised when tool arguments don't match the tool's inputSchema."""
+
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+
+def _child(path: str, key: str) -> str:
+    return f"{path}.{key}" if path else key
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """Compile a JSON Schema into ``validator(value, path)``, which raises ToolArgumentError."""
+    checks: List[Validator] = []
+
+    schema_type = schema.get("type")
+    if schema_type is not None:
+        types = schema_type if isinstance(schema_type, list) else [schema_type]
+        for name in types:
+            if name not in TYPE_CHECKS:
+                raise ValueError(f"Unsupported schema type '{name}'")
+        type_checks = [TYPE_CHECKS[name] for name in types]
+        expected = " or ".join(types)
+
+        def check_type(value, path):
+            if not any(check(value) for check in type_checks):
+                raise ToolArgumentError(path or "arguments", f"expected {expected}, got {_json_type(value)}")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path):
+            if value not in allowed:
+                raise ToolArgumentError(path or "arguments", f"must be one of {allowed}")
+        checks.append(check_enum)
+
+    checks.extend(_compile_string_checks(schema))
+    checks.extend(_compile_number_checks(schema))
+    checks.extend(_compile_array_checks(schema))
+    checks.extend(_compile_object_checks(schema))
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def validate(value, path=""):
+        for check in checks:
+            check(value, path)
+    return validate
+
+
+def _compile_string_checks(schema):
+    checks = []
+    min_length = schema.get("minLength")
+    max_length = schema.get("maxLength")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+
+    if min_length is not None:
+        def check_min_length(value, path):
+            if isinstance(value, str) and len(value) < min_length:
+                message = "must not be empty" if min_length == 1 else f"must be at least {min_length} characters"
+                raise ToolArgumentError(path, message)
+        checks.append(check_min_length)
+    if max_length is not None:
+        def check_max_length(value, path):
+            if isinstance(value, str) and len(value) > max_length:
+                raise ToolArgumentError(path, f"must be at most {max_length} characters")
+        checks.append(check_max_length)
+    if pattern is not None:
+        def check_pattern(value, path):
+            if isinstance(value, str) and not pattern.search(value):
+                raise ToolArgumentError(path, f"does not match pattern {pattern.pattern!r}")
+        checks.append(check_pattern)
+    return checks
+
+
+def _compile_number_checks(schema):
+    checks = []
+    minimum = schema.get("minimum")
+    maximum = schema.get("maximum")
+
+    def is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    if minimum is not None:
+        def check_minimum(value, path):
+            if is_number(value) and value < minimum:
+                raise ToolArgumentError(path, f"must be >= {minimum}")
+        checks.append(check_minimum)
+    if maximum is not None:
+        def check_maximum(value, path):
+            if is_number(value) and value > maximum:
+                raise ToolArgumentError(path, f"must be <= {maximum}")
+        checks.append(check_maximum)
+    return checks
+
+
+def _compile_array_checks(schema):
+    checks = []
+    min_items = schema.get("minItems")
+    max_items = schema.get("maxItems")
+
+    if min_items is not None:
+        def check_min_items(value, path):
+            if isinstance(value, list) and len(value) < min_items:
+                raise ToolArgumentError(path, f"must have at least {min_items} items")
+        checks.append(check_min_items)
+    if max_items is not None:
+        def check_max_items(value, path):
+            if isinstance(value, list) and len(value) > max_items:
+                raise ToolArgumentError(path, f"must have at most {max_items} items")
+        checks.append(check_max_items)
+    if schema.get("items"):
+        item_validator = compile_schema(schema["items"])
+
+        def check_items(value, path):
+            if isinstance(value, list):
+                for i, item in enumerate(value):
+                    item_validator(item, f"{path}[{i}]")
+        checks.append(check_items)
+    return checks
+
+
+def _compile_object_checks(schema):
+    checks = []
+    required = list(schema.get("required", []))
+    properties = {name: compile_schema(subschema)
+                  for name, subschema in schema.get("properties", {}).items() if subschema}
+
+    if required:
+        def check_required(value, path):
+            if isinstance(value, dict):
+                for name in required:
+                    if name not in value:
+                        raise ToolArgumentError(_child(path, name), "is required")
+        checks.append(check_required)
+    if properties:
+        def check_properties(value, path):
+            if isinstance(value, dict):
+                for name, validator in properties.items():
+                    if name in value:
+                        validator(value[name], _child(path, name))
+        checks.append(check_properties)
+    if schema.get("additionalProperties") is False:
+        known = set(schema.get("properties", {}))
+
+        def check_additional(value, path):
+            if isinstance(value, dict):
+                for name in value:
+                    if name not in known:
+                        raise ToolArgumentError(_child(path, name), "is not an allowed argument")
+        checks.append(check_additional)
+    return checks
+
+
+def _json_type(value) -> str:
+    for name in ("null", "boolean", "integer", "number", "string", "array", "object"):
+        if TYPE_CHECKS[name](value):
+            return name
+    return type(value).__name__
+
+
+def compile_tool_validators(tools) -> Dict[str, Validator]:
+    """Compile the inputSchema of every tool (a list or a name -> tool dict)."""
+    if isinstance(tools, dict):
+        tools = tools.values()
+    return {tool["name"]: compile_schema(tool.get("inputSchema") or {"type": "object"}) for tool in tools}
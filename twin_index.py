@@ -0,0 +1,197 @@
+"""
+Email -> CountryID index for Twin documents.
+
+Twin documents use the email address as their id and CountryID as the
+partition key, so a read without the country used to fall back to a
+cross-partition query. This module keeps a small lookup container
+(TwinEmailIndex, partitioned on /id) plus an in-process map and Bloom
+filter, so lookups by email become a single point read and unknown emails
+are answered without touching Cosmos DB.
+
+The filter only knows the Twins this process has seen: those loaded from
+the index plus those it wrote (or read from the change feed). A Twin
+written elsewhere may be missing from it, so a negative answer is trusted
+for TWIN_INDEX_NEGATIVE_TTL_SECONDS after loading; after that, emails not
+in the local map are point-read from the index container.
+
+Existing Twins are copied into the index once with
+``python migrate_email_index.py``.
+"""
+
+import hashlib
+import math
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from request_scope import storage_options
+
+try:
+    from azure.cosmos import PartitionKey
+    from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
+    COSMOS_AVAILABLE = True
+except ImportError:
+    COSMOS_AVAILABLE = False
+
+
+INDEX_CONTAINER_NAME = "TwinEmailIndex"
+
+# How long after loading a Bloom filter miss is answered without a point read
+NEGATIVE_TTL_SECONDS = float(os.getenv("TWIN_INDEX_NEGATIVE_TTL_SECONDS", "60"))
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter using double hashing over a blake2b digest."""
+
+    def __init__(self, expected_items: int = 100000, false_positive_rate: float = 0.001):
+        expected_items = max(1, expected_items)
+        self.size = max(64, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / expected_items * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+def get_or_create_index_container(database):
+    """Return the email index container, creating it if it doesn't exist."""
+    try:
+        # Don't set throughput for serverless accounts
+        return database.create_container(
+            id=INDEX_CONTAINER_NAME,
+            partition_key=PartitionKey(path="/id")
+        )
+    except CosmosResourceExistsError:
+        return database.get_container_client(INDEX_CONTAINER_NAME)
+
+
+class EmailPartitionIndex:
+    """Maintains the email -> CountryID mapping used to turn lookups into point reads.
+
+    The Bloom filter is only trusted for negative answers once ``load`` has
+    populated it from the index container, and for ``negative_ttl_seconds``
+    after that; otherwise (or if loading failed) a miss in the local map
+    falls through to a point read on the index container.
+    """
+
+    def __init__(self, index_container=None, expected_items: int = 100000, partitioning=None, telemetry=None,
+                 negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS):
+        self.index_container = index_container
+        # How the Twin container's partition key is derived from the CountryID (twin_partitioning.py)
+        self.partitioning = partitioning
+        # Point reads are recorded per partition (partition_telemetry.py)
+        self.telemetry = telemetry
+        self.expected_items = expected_items
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._countries: Dict[str, str] = {}
+        self._bloom = BloomFilter(expected_items)
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "bloom_negatives": 0, "index_reads": 0, "misses": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def trusts_negatives(self) -> bool:
+        return self._loaded and time.monotonic() - self._loaded_at < self.negative_ttl_seconds
+
+    def load(self):
+        """Populate the local map and Bloom filter from the index container."""
+        if self.index_container is None:
+            return
+        try:
+            entries = list(self.index_container.query_items(
+                query="SELECT c.id, c.CountryID FROM c",
+                enable_cross_partition_query=True
+            ))
+            if not entries:
+                # An empty index says nothing about which Twins exist
+                print("Twin email index is empty; run migrate_email_index.py to backfill it.", file=sys.stderr)
+                self._loaded = False
+                return
+
+            with self._lock:
+                self._bloom = BloomFilter(max(self.expected_items, len(entries) * 2))
+                self._countries = {}
+                for entry in entries:
+                    if entry.get("CountryID") is None:
+                        continue
+                    self._countries[entry["id"]] = entry["CountryID"]
+                    self._bloom.add(entry["id"])
+                self._loaded = True
+                self._loaded_at = time.monotonic()
+            print(f"Loaded {len(self._countries)} entries into the Twin email index.", file=sys.stderr)
+        except Exception as e:
+            print(f"Failed to load Twin email index: {str(e)}", file=sys.stderr)
+            self._loaded = False
+
+    def record(self, email: str, country_id: str, persist: bool = True):
+        """Record the partition of a Twin that was just written."""
+        with self._lock:
+            if self._countries.get(email) == country_id:
+                return
+            self._countries[email] = country_id
+            self._bloom.add(email)
+        if persist and self.index_container is not None:
+            self.index_container.upsert_item(body={"id": email, "CountryID": country_id})
+
+    def lookup(self, email: str) -> Optional[str]:
+        """Return the CountryID for an email, or None if the Twin doesn't exist."""
+        if self.trusts_negatives and email not in self._bloom:
+            self.stats["bloom_negatives"] += 1
+            return None
+
+        country_id = self._countries.get(email)
+        if country_id is not None:
+            self.stats["hits"] += 1
+            return country_id
+
+        if self.index_container is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["index_reads"] += 1
+        try:
+            entry = self.index_container.read_item(item=email, partition_key=email)
+        except CosmosResourceNotFoundError:
+            self.stats["misses"] += 1
+            return None
+
+        self.record(email, entry["CountryID"], persist=False)
+        return entry["CountryID"]
+
+    def read_twin(self, twin_container, email: str, country_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Point-read a Twin document by email, resolving the partition through the index."""
+        country_id = country_id or self.lookup(email)
+        if country_id is None:
+            return None
+        partition_key = self.partitioning.partition_key(country_id, email) if self.partitioning else country_id
+        options = storage_options()
+        if self.telemetry:
+            options["response_hook"] = self.telemetry.response_hook(partition_key, "read")
+        try:
+            return twin_container.read_item(item=email, partition_key=partition_key, **options)
+        except CosmosResourceNotFoundError:
+            return None
+        except Exception as e:
+            if self.telemetry:
+                self.telemetry.record_error(partition_key, "read", e)
+            raise
@@ -0,0 +1,183 @@
+"""
+Partitioning schemes for the Twin container.
+
+The original container is partitioned on ``/CountryID``, so every write
+for a large country lands in one logical partition. The synthetic scheme
+stores Twins in a second container partitioned on ``/PartitionKey``,
+whose value combines the CountryID with a hash bucket of the Twin id
+(its email), e.g. ``US#07``. A country's writes are spread over
+TWIN_PARTITION_BUCKETS logical partitions, and a point read recomputes
+the key from the email and CountryID.
+
+A per-country query can't target a single partition any more. It fans
+out to the country's bucket partitions (``fan_out_query``). Each of those
+queries still runs in a single partition, and their results are merged
+in ORDER BY order.
+
+TWIN_PARTITIONING selects the layout, which also gives a migration path:
+
+- ``country`` (default): the original container only;
+- ``dual``: reads use the original container, and writes also go to the
+  synthetic container while ``migrate_partitioning.py`` copies the
+  existing Twins;
+- ``synthetic``: reads and writes use the synthetic container.
+
+The bucket count is part of every stored key. Changing it requires
+copying the Twins again.
+"""
+
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from request_scope import check_current_scope
+
+PARTITIONING_MODES = ("country", "dual", "synthetic")
+
+SYNTHETIC_CONTAINER_NAME = os.getenv("TWIN_SYNTHETIC_CONTAINER", "TwinHumanShardedContainer")
+
+PARTITION_KEY_PROPERTY = "PartitionKey"
+
+# Partition queries started at once by a fan-out
+FAN_OUT_CONCURRENCY = int(os.getenv("TWIN_FAN_OUT_CONCURRENCY", "8"))
+
+
+class CountryPartitioning:
+    """The original layout: one logical partition per CountryID."""
+
+    name = "country"
+    path = "/CountryID"
+    synthetic = False
+
+    def partition_key(self, country_id: str, twin_id: str) -> str:
+        return country_id
+
+    def partition_key_of(self, document: Dict[str, Any]) -> str:
+        return document["CountryID"]
+
+    def country_partition_keys(self, country_id: str) -> List[str]:
+        return [country_id]
+
+    def prepare(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return document
+
+    def describe(self) -> Dict[str, Any]:
+        return {"scheme": self.name, "path": self.path}
+
+
+class SyntheticPartitioning:
+    """CountryID combined with a hash bucket of the Twin id (``US#07``)."""
+
+    name = "synthetic"
+    path = f"/{PARTITION_KEY_PROPERTY}"
+    synthetic = True
+
+    def __init__(self, buckets: int = 16):
+        if buckets < 1:
+            raise ValueError("The bucket count must be at least 1")
+        self.buckets = buckets
+
+    def bucket(self, twin_id: str) -> int:
+        # Stable across processes and Python versions, unlike hash()
+        digest = hashlib.blake2b(twin_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.buckets
+
+    def partition_key(self, country_id: str, twin_id: str) -> str:
+        return f"{country_id}#{self.bucket(twin_id):02d}"
+
+    def partition_key_of(self, document: Dict[str, Any]) -> str:
+        return document.get(PARTITION_KEY_PROPERTY) or self.partition_key(document["CountryID"], document["id"])
+
+    def country_partition_keys(self, country_id: str) -> List[str]:
+        return [f"{country_id}#{bucket:02d}" for bucket in range(self.buckets)]
+
+    def prepare(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a Twin document with its synthetic partition key set."""
+        return dict(document, **{PARTITION_KEY_PROPERTY: self.partition_key(document["CountryID"], document["id"])})
+
+    def describe(self) -> Dict[str, Any]:
+        return {"scheme": self.name, "path": self.path, "buckets": self.buckets}
+
+
+def partitioning_mode() -> str:
+    mode = os.getenv("TWIN_PARTITIONING", "country").lower()
+    if mode not in PARTITIONING_MODES:
+        raise ValueError(f"TWIN_PARTITIONING must be one of: {', '.join(PARTITIONING_MODES)}")
+    return mode
+
+
+def synthetic_partitioning_from_env() -> SyntheticPartitioning:
+    return SyntheticPartitioning(int(os.getenv("TWIN_PARTITION_BUCKETS", "16")))
+
+
+def cosmos_sort_key(value: Any = None, defined: bool = True):
+    """Sort key that follows Cosmos DB's ORDER BY across types (undefined < null < bool < number < string)."""
+    if not defined:
+        return (0, 0)
+    if value is None:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def fan_out_query(container, query: str, parameters: List[Dict[str, Any]], partition_keys: List[str],
+                  order_by: Optional[Callable[[Dict[str, Any]], Any]] = None, descending: bool = False,
+                  limit: Optional[int] = None, telemetry=None, **kwargs) -> Iterator[Dict[str, Any]]:
+    """Run a query in each of the given partitions and merge the rows.
+
+    The first page of every partition is fetched concurrently; later pages
+    are read on demand. With ``order_by`` (a sort key function) the rows
+    are merged in order, otherwise they are concatenated. ``limit`` caps
+    the merged rows; pass TOP in the query too so each partition stops early.
+    Each partition's pages are recorded in ``telemetry`` (partition_telemetry.py).
+    """
+    response_hook = kwargs.pop("response_hook", None)
+    if response_hook is not None:
+        # Called from several threads during the first fetch
+        lock = threading.Lock()
+        original_hook = response_hook
+
+        def response_hook(headers, result):
+            with lock:
+                original_hook(headers, result)
+
+    def first_page(partition_key):
+        hook = telemetry.response_hook(partition_key, "query", response_hook) if telemetry else response_hook
+        pages = container.query_items(
+            query=query, parameters=parameters, partition_key=partition_key,
+            response_hook=hook, **kwargs
+        ).by_page()
+        try:
+            return pages, list(next(pages, []))
+        except Exception as e:
+            if telemetry:
+                telemetry.record_error(partition_key, "query", e)
+            raise
+
+    def rows(pages, page):
+        while True:
+            yield from page
+            check_current_scope()
+            page = next(pages, None)
+            if page is None:
+                return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FAN_OUT_CONCURRENCY, len(partition_keys)))) as executor:
+        first_pages = list(executor.map(first_page, partition_keys))
+    streams = [rows(pages, page) for pages, page in first_pages]
+
+    if order_by is not None:
+        merged = heapq.merge(*streams, key=order_by, reverse=descending)
+    else:
+        merged = itertools.chain(*streams)
+    return itertools.islice(merged, limit)
+
@@ -0,0 +1,181 @@
+"""
+Projected, parameterized queries over the Twin container.
+
+Callers pass the fields they want and a list of filter predicates; these
+are compiled into a parameterized Cosmos DB SQL query that returns only
+the requested fields (no system properties), so payload size and RU scale
+with what is actually asked for. The compiled SQL depends only on the
+shape of the request (fields, filter fields and operators, ordering), so
+plans are cached and reused with different parameter values.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from request_scope import check_current_scope, storage_options
+from twin_partitioning import cosmos_sort_key, fan_out_query
+
+FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+# Fields returned when the caller doesn't ask for specific ones
+DEFAULT_FIELDS = ("id", "CountryID", "Profile", "createdAt", "lastModified")
+
+OPERATORS = {
+    "eq": "{field} = {param}",
+    "ne": "{field} != {param}",
+    "lt": "{field} < {param}",
+    "lte": "{field} <= {param}",
+    "gt": "{field} > {param}",
+    "gte": "{field} >= {param}",
+    "startswith": "STARTSWITH({field}, {param})",
+    "contains": "CONTAINS({field}, {param})",
+    "in": "ARRAY_CONTAINS({param}, {field})",
+    "defined": "IS_DEFINED({field}) = {param}",
+}
+
+MAX_LIMIT = 1000
+
+
+class TwinQueryError(ValueError):
+    """Raised when a projection or filter can't be compiled."""
+
+
+def _field_expression(field: str) -> str:
+    if not isinstance(field, str) or not FIELD_PATTERN.match(field):
+        raise TwinQueryError(f"Invalid field '{field}'. Use dotted property names such as 'Profile.email'")
+    # Bracket notation so fields named like SQL keywords (e.g. 'value') still work
+    return "c" + "".join(f'["{part}"]' for part in field.split("."))
+
+
+@lru_cache(maxsize=256)
+def compile_query_plan(
+    fields: Tuple[str, ...],
+    predicates: Tuple[Tuple[str, str], ...],
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limited: bool = False,
+) -> str:
+    """Compile the SQL text for a query shape. Parameters are named @p0..@pN and @limit."""
+    select = ", ".join(f"{_field_expression(field)} AS f{i}" for i, field in enumerate(fields))
+    sql = f"SELECT {'TOP @limit ' if limited else ''}{select} FROM c"
+
+    clauses = []
+    for i, (field, op) in enumerate(predicates):
+        if op not in OPERATORS:
+            raise TwinQueryError(f"Unknown operator '{op}'. Use one of: {', '.join(OPERATORS)}")
+        clauses.append(OPERATORS[op].format(field=_field_expression(field), param=f"@p{i}"))
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+
+    if order_by:
+        sql += f" ORDER BY {_field_expression(order_by)} {'DESC' if descending else 'ASC'}"
+    return sql
+
+
+def build_twin_query(
+    fields: Optional[List[str]] = None,
+    filters: Optional[List[Dict[str, Any]]] = None,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> Tuple[str, List[Dict[str, Any]], Optional[Any], Tuple[str, ...]]:
+    """Return (sql, parameters, partition_key, fields) for a Twin query.
+
+    Filters are dicts of the form {"field": "Profile.lastName", "op": "eq", "value": "Doe"}.
+    An equality filter on CountryID scopes the query to a single partition.
+    """
+    if not isinstance(fields or [], (list, tuple)) or not isinstance(filters or [], (list, tuple)):
+        raise TwinQueryError("fields and filters must be arrays")
+    fields = tuple(fields) if fields else DEFAULT_FIELDS
+    filters = filters or []
+    for field in fields + ((order_by,) if order_by is not None else ()):
+        _field_expression(field)
+
+    predicates = []
+    parameters = []
+    partition_key = None
+    for i, predicate in enumerate(filters):
+        if not isinstance(predicate, dict) or "field" not in predicate or "value" not in predicate:
+            raise TwinQueryError(f"Filter {i} must be an object with 'field', 'op' and 'value'")
+        _field_expression(predicate["field"])
+        op = predicate.get("op", "eq")
+        if op not in OPERATORS:
+            raise TwinQueryError(f"Filter {i}: unknown operator '{op}'. Use one of: {', '.join(OPERATORS)}")
+        if op == "in" and not isinstance(predicate["value"], list):
+            raise TwinQueryError(f"Filter {i}: 'in' expects a list value")
+        predicates.append((predicate["field"], op))
+        parameters.append({"name": f"@p{i}", "value": predicate["value"]})
+        if predicate["field"] == "CountryID" and op == "eq":
+            partition_key = predicate["value"]
+
+    if limit is not None:
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_LIMIT:
+            raise TwinQueryError(f"limit must be an integer between 1 and {MAX_LIMIT}")
+        parameters.append({"name": "@limit", "value": limit})
+
+    sql = compile_query_plan(fields, tuple(predicates), order_by, bool(descending), limit is not None)
+    return sql, parameters, partition_key, fields
+
+
+class TwinQueryService:
+    """Runs projected Twin queries and maps the aliased columns back to field names.
+
+    With synthetic partitioning (twin_partitioning.py) a CountryID filter
+    no longer names a single partition; the query fans out to the
+    country's bucket partitions instead. Query pages are recorded in
+    ``telemetry`` per partition (partition_telemetry.py).
+    """
+
+    def __init__(self, container, partitioning=None, telemetry=None):
+        self.container = container
+        self.partitioning = partitioning
+        self.telemetry = telemetry
+
+    def iter_query(self, fields=None, filters=None, order_by=None, descending=False, limit=None,
+                   page_size: Optional[int] = None, response_hook=None) -> Iterator[Dict[str, Any]]:
+        sql, parameters, partition_key, fields = build_twin_query(fields, filters, order_by, descending, limit)
+        kwargs = {"max_item_count": page_size, "response_hook": response_hook}
+        # Bounded by the calling tool's deadline; paging stops once it is cancelled
+        kwargs.update(storage_options())
+
+        if partition_key is not None and self.partitioning is not None and self.partitioning.synthetic:
+            yield from self._fan_out(fields, filters, order_by, descending, limit, partition_key, kwargs)
+            return
+
+        if partition_key is not None:
+            kwargs["partition_key"] = partition_key
+        else:
+            kwargs["enable_cross_partition_query"] = True
+        if self.telemetry:
+            kwargs["response_hook"] = self.telemetry.response_hook(partition_key, "query", response_hook)
+        for page in self.container.query_items(query=sql, parameters=parameters, **kwargs).by_page():
+            for row in page:
+                # Undefined fields are omitted by Cosmos DB, so they are omitted here too
+                yield {field: row[f"f{i}"] for i, field in enumerate(fields) if f"f{i}" in row}
+            check_current_scope()
+
+    def _fan_out(self, fields, filters, order_by, descending, limit, country_id, kwargs) -> Iterator[Dict[str, Any]]:
+        # Merging in order needs the ORDER BY value, so project it if it wasn't asked for
+        query_fields = fields if order_by is None or order_by in fields else fields + (order_by,)
+        sql, parameters, _, query_fields = build_twin_query(list(query_fields), filters, order_by, descending, limit)
+        sort_key = None
+        if order_by is not None:
+            order_alias = f"f{query_fields.index(order_by)}"
+            sort_key = lambda row: cosmos_sort_key(row.get(order_alias), order_alias in row)
+        rows = fan_out_query(
+            self.container, sql, parameters, self.partitioning.country_partition_keys(country_id),
+            order_by=sort_key, descending=descending, limit=limit, telemetry=self.telemetry, **kwargs
+        )
+        for row in rows:
+            yield {field: row[f"f{i}"] for i, field in enumerate(fields) if f"f{i}" in row}
+
+    def query(self, fields=None, filters=None, order_by=None, descending=False, limit=None) -> Dict[str, Any]:
+        """Run a query and return the rows together with the request charge."""
+        charge = {"total": 0.0}
+
+        def response_hook(headers, _result):
+            charge["total"] += float(headers.get("x-ms-request-charge", 0) or 0)
+
+        rows = list(self.iter_query(fields, filters, order_by, descending, limit, response_hook=response_hook))
+        return {"count": len(rows), "requestCharge": round(charge["total"], 2), "twins": rows}
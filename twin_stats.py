@@ -0,0 +1,78 @@
+"""
+Server-side aggregate statistics for the Twin container.
+
+Counts per CountryID, old (flat) vs new (Profile) document formats and a
+createdAt histogram are computed by Cosmos DB aggregate queries, so only
+the aggregated rows travel to the client. Results are cached for a short
+TTL so dashboards polling these numbers don't trigger repeated queries.
+"""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from request_scope import storage_options
+
+# Length of the createdAt ISO prefix that identifies each histogram bucket
+HISTOGRAM_BUCKETS = {
+    "year": 4,
+    "month": 7,
+    "day": 10,
+    "hour": 13,
+}
+
+
+class TwinStatsService:
+    """Runs Twin aggregate queries inside Cosmos DB and caches the results."""
+
+    def __init__(self, container, ttl_seconds: float = 30.0):
+        self.container = container
+        self.ttl_seconds = ttl_seconds
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    def _query(self, query: str):
+        # Bounded by the calling tool's deadline, if any (see request_scope.py)
+        return list(self.container.query_items(query=query, enable_cross_partition_query=True, **storage_options()))
+
+    def _count(self, where: str) -> int:
+        # Cross-partition VALUE aggregates may come back as one partial count per partition
+        return sum(self._query(f"SELECT VALUE COUNT(1) FROM c WHERE {where}"))
+
+    def counts_by_country(self) -> Dict[str, int]:
+        rows = self._query("SELECT c.CountryID AS countryId, COUNT(1) AS count FROM c GROUP BY c.CountryID")
+        return {str(row.get("countryId")): row["count"] for row in rows}
+
+    def format_counts(self) -> Dict[str, int]:
+        return {
+            "new": self._count("IS_DEFINED(c.Profile)"),
+            "old": self._count("NOT IS_DEFINED(c.Profile)"),
+        }
+
+    def created_at_histogram(self, bucket: str = "day") -> Dict[str, int]:
+        length = HISTOGRAM_BUCKETS[bucket]
+        rows = self._query(
+            f"SELECT LEFT(c.createdAt, {length}) AS bucket, COUNT(1) AS count FROM c "
+            f"WHERE IS_STRING(c.createdAt) GROUP BY LEFT(c.createdAt, {length})"
+        )
+        return dict(sorted((row["bucket"], row["count"]) for row in rows))
+
+    def collect(self, bucket: str = "day", refresh: bool = False) -> Dict[str, Any]:
+        """Return all Twin statistics, served from the cache while it is fresh."""
+        if bucket not in HISTOGRAM_BUCKETS:
+            raise ValueError(f"Unknown histogram bucket '{bucket}'. Use one of: {', '.join(HISTOGRAM_BUCKETS)}")
+
+        now = time.monotonic()
+        cached = self._cache.get(bucket)
+        if cached and not refresh and cached[0] > now:
+            return dict(cached[1], cached=True)
+
+        formats = self.format_counts()
+        stats = {
+            "total": formats["new"] + formats["old"],
+            "byCountry": self.counts_by_country(),
+            "byFormat": formats,
+            "createdAtHistogram": {"bucket": bucket, "counts": self.created_at_histogram(bucket)},
+            "generatedAt": datetime.now().isoformat(),
+        }
+        self._cache[bucket] = (now + self.ttl_seconds, stats)
+        return dict(stats, cached=False)
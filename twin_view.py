@@ -0,0 +1,197 @@
+"""
+In-process materialized view of Twin documents, fed by the Cosmos DB change feed.
+
+The view keeps per-country counts, a recency index ordered by lastModified
+and a compact summary of every Twin, so questions such as "how many twins
+per country" or "most recently modified twins" are answered from memory
+instead of a full container scan. The change feed continuation and the view
+itself are checkpointed to a local file so a restart resumes where it
+stopped.
+
+Note: the change feed in latest-version mode does not report deletes, so
+deleted Twins stay in the view until the checkpoint is discarded.
+"""
+
+import asyncio
+import bisect
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def summarize_twin(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a compact summary from either the Profile or the old flat document format."""
+    profile = document.get("Profile") or document
+    last_modified = document.get("lastModified") or document.get("createdAt")
+    if not last_modified and document.get("_ts"):
+        last_modified = datetime.fromtimestamp(document["_ts"]).isoformat()
+    return {
+        "id": document.get("id"),
+        "CountryID": document.get("CountryID"),
+        "firstName": profile.get("firstName"),
+        "lastName": profile.get("lastName"),
+        "createdAt": document.get("createdAt"),
+        "lastModified": last_modified or "",
+    }
+
+
+class TwinMaterializedView:
+    """Per-country counts, a recency index and summaries of all Twins."""
+
+    def __init__(self):
+        self._twins: Dict[str, Dict[str, Any]] = {}
+        self._country_counts: Dict[str, int] = {}
+        self._recency: List[Tuple[str, str]] = []  # sorted (lastModified, id)
+        self._lock = threading.Lock()
+        self.last_synced_at: Optional[str] = None
+
+    def apply(self, document: Dict[str, Any]):
+        """Insert or update a Twin from a change feed document."""
+        summary = summarize_twin(document)
+        twin_id = summary["id"]
+        if twin_id is None:
+            return
+        with self._lock:
+            previous = self._twins.get(twin_id)
+            if previous is not None:
+                self._remove_locked(previous)
+            self._twins[twin_id] = summary
+            country_id = summary["CountryID"]
+            self._country_counts[country_id] = self._country_counts.get(country_id, 0) + 1
+            bisect.insort(self._recency, (summary["lastModified"], twin_id))
+
+    def _remove_locked(self, summary: Dict[str, Any]):
+        country_id = summary["CountryID"]
+        remaining = self._country_counts.get(country_id, 0) - 1
+        if remaining > 0:
+            self._country_counts[country_id] = remaining
+        else:
+            self._country_counts.pop(country_id, None)
+        key = (summary["lastModified"], summary["id"])
+        position = bisect.bisect_left(self._recency, key)
+        if position < len(self._recency) and self._recency[position] == key:
+            del self._recency[position]
+
+    def __len__(self) -> int:
+        return len(self._twins)
+
+    def country_counts(self, country_id: Optional[str] = None) -> Dict[str, int]:
+        """Return Twin counts per CountryID, or for a single country."""
+        if country_id is not None:
+            return {country_id: self._country_counts.get(country_id, 0)}
+        with self._lock:
+            return dict(self._country_counts)
+
+    def recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return summaries of the most recently modified Twins, newest first."""
+        with self._lock:
+            keys = self._recency[-limit:] if limit > 0 else []
+            return [self._twins[twin_id] for _, twin_id in reversed(keys)]
+
+    def get(self, twin_id: str) -> Optional[Dict[str, Any]]:
+        return self._twins.get(twin_id)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._twins.values())
+
+    def restore(self, summaries: List[Dict[str, Any]]):
+        twins = {summary["id"]: summary for summary in summaries}
+        country_counts: Dict[str, int] = {}
+        for summary in twins.values():
+            country_counts[summary["CountryID"]] = country_counts.get(summary["CountryID"], 0) + 1
+        recency = sorted((summary["lastModified"], summary["id"]) for summary in twins.values())
+        with self._lock:
+            self._twins = twins
+            self._country_counts = country_counts
+            self._recency = recency
+
+
+class ChangeFeedConsumer:
+    """Polls the Twin container change feed and applies changes to a view."""
+
+    def __init__(
+        self,
+        container,
+        view: TwinMaterializedView,
+        checkpoint_path: str = "twin_view_checkpoint.json",
+        poll_interval: float = 5.0,
+        on_change: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.container = container
+        self.view = view
+        self.checkpoint_path = checkpoint_path
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.continuation: Optional[str] = None
+
+    def load_checkpoint(self):
+        """Restore the continuation token and view from the checkpoint file, if any."""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            self.continuation = checkpoint.get("continuation")
+            self.view.restore(checkpoint.get("twins", []))
+            self.view.last_synced_at = checkpoint.get("lastSyncedAt")
+            print(f"Restored Twin view checkpoint with {len(self.view)} twins.", file=sys.stderr)
+        except Exception as e:
+            print(f"Failed to load Twin view checkpoint, starting from the beginning: {str(e)}", file=sys.stderr)
+            self.continuation = None
+
+    def save_checkpoint(self):
+        """Atomically write the continuation token and view to the checkpoint file."""
+        if not self.checkpoint_path:
+            return
+        checkpoint = {
+            "continuation": self.continuation,
+            "lastSyncedAt": self.view.last_synced_at,
+            "twins": self.view.snapshot(),
+        }
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def poll_once(self) -> int:
+        """Drain the change feed from the current continuation. Returns the number of changes applied."""
+        # The shared client's last_response_headers may belong to another thread's request,
+        # so keep this feed's own response headers. The SDK rewrites their etag into the
+        # full change feed continuation after each page.
+        pages = []
+        options = {"response_hook": lambda headers, _result: pages.append(headers)}
+        if self.continuation:
+            feed = self.container.query_items_change_feed(continuation=self.continuation, **options)
+        else:
+            feed = self.container.query_items_change_feed(start_time="Beginning", **options)
+
+        applied = 0
+        for document in feed:
+            self.view.apply(document)
+            if self.on_change:
+                self.on_change(document)
+            applied += 1
+
+        continuation = pages[-1].get("etag") if pages else None
+        if continuation:
+            self.continuation = continuation
+        self.view.last_synced_at = datetime.now().isoformat()
+        return applied
+
+    async def run(self):
+        """Poll the change feed forever, checkpointing after every batch of changes."""
+        self.load_checkpoint()
+        while True:
+            try:
+                applied = await asyncio.to_thread(self.poll_once)
+                if applied:
+                    await asyncio.to_thread(self.save_checkpoint)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Twin change feed poll failed: {str(e)}", file=sys.stderr)
+            await asyncio.sleep(self.poll_interval)
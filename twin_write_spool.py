@@ -0,0 +1,378 @@
+"""
+Circuit breaker and durable local spool for Twin writes.
+
+If Cosmos DB is slow or down, every save would otherwise wait for the SDK
+timeout and tie up a worker. The circuit breaker fails fast once the
+recent error rate crosses a threshold. While it is open (or while older
+writes are still queued), writes can go to an append-only local spool file
+and be acknowledged as "queued"; once the backend recovers they are
+replayed in order, deduplicated by id (the latest write for a Twin wins).
+
+Follow-up work after a save (``on_saved``, the email index entry) is not
+part of the Twin write: if it fails, the Twin still counts as saved, the
+breaker is not told, and the follow-up is retried in the background.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cosmos_throttle import StorageThrottledError
+from request_scope import RequestCancelledError, current_deadline
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit is open and no spool is configured."""
+
+    def __init__(self, message: str, retry_after_ms: int = 0):
+        super().__init__(message)
+        self.retry_after_ms = retry_after_ms
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker driven by the error rate over a rolling window."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        error_rate_threshold: float = 0.5,
+        min_requests: int = 5,
+        window_seconds: float = 30.0,
+        open_seconds: float = 15.0,
+    ):
+        self.error_rate_threshold = error_rate_threshold
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._results: deque = deque()  # (timestamp, succeeded)
+        self.transitions = 0
+
+    def retry_after_ms(self) -> int:
+        """Milliseconds until an open circuit lets a probe through (0 if not open)."""
+        if self.state != self.OPEN:
+            return 0
+        return max(0, int((self.opened_at + self.open_seconds - time.monotonic()) * 1000))
+
+    def _trim(self, now: float):
+        while self._results and self._results[0][0] < now - self.window_seconds:
+            self._results.popleft()
+
+    def allow(self) -> bool:
+        """Return True if a request may go to the backend now."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            # A single probe decides whether to close again
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self._results.clear()
+            self.transitions += 1
+        self._results.append((now, True))
+        self._trim(now)
+
+    def abandon(self):
+        """Forget a request that ended without an outcome (frees the half-open probe)."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self._open(now)
+            return
+        self._results.append((now, False))
+        self._trim(now)
+        failures = sum(1 for _, succeeded in self._results if not succeeded)
+        if len(self._results) >= self.min_requests and failures / len(self._results) >= self.error_rate_threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self.opened_at = now
+        self._probe_in_flight = False
+        self.transitions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        failures = sum(1 for _, succeeded in self._results if not succeeded)
+        return {
+            "state": self.state,
+            "windowRequests": len(self._results),
+            "windowErrorRate": round(failures / len(self._results), 3) if self._results else 0.0,
+            "transitions": self.transitions,
+        }
+
+
+class TwinWriteSpool:
+    """Append-only JSON-lines file of Twin documents waiting to be written."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._pending = sum(1 for line in f if line.strip())
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def append(self, document: Dict[str, Any]):
+        """Durably append a document (flushed and fsynced before returning)."""
+        line = json.dumps(document) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending += 1
+
+    def snapshot(self) -> Tuple[List[Dict[str, Any]], int]:
+        """Return the spooled documents deduplicated by id, in order, plus the byte offset read."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return [], 0
+            with open(self.path, "rb") as f:
+                data = f.read()
+        latest: Dict[str, Dict[str, Any]] = {}
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn final line from a crash mid-append
+                continue
+            # Re-inserting moves the id to the position of its latest write
+            latest.pop(document["id"], None)
+            latest[document["id"]] = document
+        return list(latest.values()), len(data)
+
+    def commit(self, offset: int):
+        """Drop everything up to ``offset`` (keeping anything appended since the snapshot)."""
+        with self._lock:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                remainder = f.read()
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(remainder)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self._pending = sum(1 for line in remainder.splitlines() if line.strip())
+
+
+# Background attempts at on_saved after it failed inline, and the delay before the first
+ON_SAVED_RETRIES = 3
+ON_SAVED_RETRY_SECONDS = 1.0
+
+
+class ResilientTwinWriter:
+    """Writes Twins through the circuit breaker, spooling them while storage is unavailable."""
+
+    def __init__(
+        self,
+        storage,
+        breaker: Optional[CircuitBreaker] = None,
+        spool: Optional[TwinWriteSpool] = None,
+        timeout_seconds: float = 10.0,
+        on_saved: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ):
+        self.storage = storage
+        self.breaker = breaker or CircuitBreaker()
+        self.spool = spool
+        self.timeout_seconds = timeout_seconds
+        self.on_saved = on_saved
+        self._replay_task: Optional[asyncio.Task] = None
+        self._replaying = False
+        self._on_saved_retries: set = set()
+        self.totals = {"saved": 0, "queued": 0, "replayed": 0, "rejected": 0, "onSavedFailed": 0}
+
+    async def _write(self, document: Dict[str, Any]):
+        deadline = time.monotonic() + self.timeout_seconds
+        request_deadline = current_deadline()
+        if request_deadline is not None and request_deadline < deadline:
+            deadline = request_deadline
+        try:
+            await asyncio.wait_for(self.storage.upsert_twin(document, deadline=deadline), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            if deadline == request_deadline:
+                # The caller's deadline ran out, which says nothing about the backend
+                raise RequestCancelledError("Request deadline exceeded") from None
+            raise
+        if self.on_saved:
+            await self._run_on_saved(document, deadline)
+
+    async def _run_on_saved(self, document: Dict[str, Any], deadline: float):
+        """Run on_saved for a Twin that was written; failures are retried in the background, not raised."""
+        try:
+            # e.g. the email index entry; same throttle handling as the Twin write
+            await self.storage.writes.run(self.on_saved, document, deadline=deadline)
+        except asyncio.CancelledError:
+            self._retry_on_saved(document)
+            raise
+        except Exception as e:
+            self.totals["onSavedFailed"] += 1
+            print(f"Post-save update for Twin {document.get('id')} failed, retrying: {str(e) or type(e).__name__}",
+                  file=sys.stderr)
+            self._retry_on_saved(document)
+
+    def _retry_on_saved(self, document: Dict[str, Any]):
+        task = asyncio.create_task(self._retry_on_saved_loop(document))
+        # Keep a reference until it finishes
+        self._on_saved_retries.add(task)
+        task.add_done_callback(self._on_saved_retries.discard)
+
+    async def _retry_on_saved_loop(self, document: Dict[str, Any]):
+        delay = ON_SAVED_RETRY_SECONDS
+        for attempt in range(1, ON_SAVED_RETRIES + 1):
+            await asyncio.sleep(delay)
+            delay *= 2
+            try:
+                await self.storage.writes.run(self.on_saved, document, deadline=time.monotonic() + self.timeout_seconds)
+                return
+            except Exception as e:
+                error = e
+        print(f"Post-save update for Twin {document.get('id')} failed after {ON_SAVED_RETRIES} retries: "
+              f"{str(error) or type(error).__name__}", file=sys.stderr)
+
+    async def save(self, document: Dict[str, Any]) -> str:
+        """Save a Twin. Returns "saved", or "queued" if it was spooled for later replay."""
+        # Keep per-Twin ordering: while older writes are queued, new ones queue behind them
+        if self.spool and self.spool.pending:
+            return await self._enqueue(document)
+
+        if not self.breaker.allow():
+            if self.spool:
+                return await self._enqueue(document)
+            self.totals["rejected"] += 1
+            raise CircuitOpenError(
+                "Cosmos DB is unavailable (circuit open); retry later",
+                retry_after_ms=self.breaker.retry_after_ms()
+            )
+
+        try:
+            await self._write(document)
+        except StorageThrottledError:
+            # Throttling means the backend is up; the breaker only tracks outages
+            self.breaker.record_success()
+            raise
+        except (RequestCancelledError, asyncio.CancelledError):
+            # Abandoned by the caller: no verdict on the backend
+            self.breaker.abandon()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            if not self.spool:
+                raise
+            print(f"Twin write failed, spooling for replay: {str(e) or type(e).__name__}", file=sys.stderr)
+            return await self._enqueue(document)
+
+        self.breaker.record_success()
+        self.totals["saved"] += 1
+        return "saved"
+
+    async def _enqueue(self, document: Dict[str, Any]) -> str:
+        await asyncio.to_thread(self.spool.append, document)
+        self.totals["queued"] += 1
+        self.schedule_replay()
+        return "queued"
+
+    def schedule_replay(self):
+        """Start a replay of the spool in the background if one isn't already running."""
+        if self.spool and self.spool.pending and (self._replay_task is None or self._replay_task.done()):
+            self._replay_task = asyncio.create_task(self.replay())
+
+    async def replay(self) -> int:
+        """Replay spooled writes in order. Stops at the first failure; returns the number replayed."""
+        if self._replaying or not self.spool or not self.spool.pending or not self.breaker.allow():
+            return 0
+
+        self._replaying = True
+        try:
+            return await self._replay_snapshot()
+        finally:
+            self._replaying = False
+
+    async def _replay_snapshot(self) -> int:
+        documents, offset = await asyncio.to_thread(self.spool.snapshot)
+        replayed = 0
+        for document in documents:
+            try:
+                await self._write(document)
+            except Exception as e:
+                if isinstance(e, StorageThrottledError):
+                    # As in save(): throttling means the backend is up, so back off without tripping the breaker
+                    self.breaker.record_success()
+                elif isinstance(e, RequestCancelledError):
+                    self.breaker.abandon()
+                else:
+                    self.breaker.record_failure()
+                print(f"Twin spool replay stopped after {replayed} writes: {str(e) or type(e).__name__}", file=sys.stderr)
+                # Already-written documents are replayed again next time; upserts are idempotent
+                return replayed
+            self.breaker.record_success()
+            replayed += 1
+
+        await asyncio.to_thread(self.spool.commit, offset)
+        self.totals["replayed"] += replayed
+        if replayed:
+            print(f"Replayed {replayed} spooled Twin writes.", file=sys.stderr)
+        return replayed
+
+    async def run_replay_loop(self, interval: float = 10.0):
+        """Periodically drain the spool, so it empties even without new traffic."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.replay()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Twin spool replay failed: {str(e)}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.stats(),
+            "spoolEnabled": self.spool is not None,
+            "spoolPending": self.spool.pending if self.spool else 0,
+            "totals": dict(self.totals),
+        }
+
+
+def create_twin_writer(storage, on_saved=None) -> ResilientTwinWriter:
+    """Build the writer from TWIN_WRITE_* / TWIN_BREAKER_* environment settings."""
+    spool_path = os.getenv("TWIN_WRITE_SPOOL")
+    return ResilientTwinWriter(
+        storage,
+        breaker=CircuitBreaker(
+            error_rate_threshold=float(os.getenv("TWIN_BREAKER_ERROR_RATE", "0.5")),
+            min_requests=int(os.getenv("TWIN_BREAKER_MIN_REQUESTS", "5")),
+            open_seconds=float(os.getenv("TWIN_BREAKER_OPEN_SECONDS", "15")),
+        ),
+        spool=TwinWriteSpool(spool_path) if spool_path else None,
+        timeout_seconds=float(os.getenv("TWIN_WRITE_TIMEOUT_SECONDS", "10")),
+        on_saved=on_saved,
+    )
@@ -0,0 +1,240 @@
+"""
+WebSocket transport for the MCP endpoint.
+
+``POST /mcp`` pays for a round trip, authentication and header parsing on
+every request. A WebSocket at ``/ws`` is authenticated once, when it
+connects, and then carries any number of concurrent JSON-RPC requests.
+Responses are sent as each call finishes, in any order, and are matched
+to requests by id, just as over stdio.
+
+Each connection is bounded:
+
+- at most WS_MAX_IN_FLIGHT requests run at once; beyond that the server
+  stops reading from the socket, so a chatty client is slowed down
+  instead of queueing work without limit;
+- outgoing messages go through a queue of WS_SEND_QUEUE_SIZE messages.
+  Responses wait for room, while notifications are dropped (and counted)
+  when a slow client lets the queue fill up.
+
+The server can also send messages of its own. A client that sends
+``logging/setLevel`` receives ``notifications/message`` log events at
+or above that level, such as hot-partition alerts. When a connection has
+been idle for WS_PING_INTERVAL_SECONDS, the server sends an MCP ``ping``
+request, and it closes the connection if no answer arrives within
+WS_PING_TIMEOUT_SECONDS. This runs on top of the WebSocket-level pings
+uvicorn sends, so a peer that no longer handles messages is detected too.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Union
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# Requests one connection may have running at once
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "32"))
+
+# Outgoing messages buffered per connection
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+WS_PING_INTERVAL_SECONDS = float(os.getenv("WS_PING_INTERVAL_SECONDS", "30"))
+WS_PING_TIMEOUT_SECONDS = float(os.getenv("WS_PING_TIMEOUT_SECONDS", "10"))
+
+# MCP log levels, least severe first (RFC 5424)
+LOG_LEVELS = ("debug", "info", "notice", "warning", "error", "critical", "alert", "emergency")
+
+Dispatch = Callable[[Dict[str, Any], "WebSocketSession"], Awaitable[Union[Dict[str, Any], str, None]]]
+
+
+class WebSocketSession:
+    """One MCP connection over a WebSocket."""
+
+    def __init__(self, websocket: WebSocket, dispatch: Dispatch, max_in_flight: int = WS_MAX_IN_FLIGHT,
+                 send_queue_size: int = WS_SEND_QUEUE_SIZE, ping_interval: float = WS_PING_INTERVAL_SECONDS,
+                 ping_timeout: float = WS_PING_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.client = websocket.client.host if websocket.client else None
+        self.dispatch = dispatch
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.log_level: Optional[str] = None
+        self.last_received = time.monotonic()
+        self.stats = {"requests": 0, "inFlight": 0, "notificationsDropped": 0}
+        self._loop = asyncio.get_running_loop()
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._calls: Set[asyncio.Task] = set()
+        self._server_requests: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    async def run(self):
+        """Serve the connection until the client disconnects or stops answering pings."""
+        with _sessions_lock:
+            sessions.add(self)
+        writer = asyncio.create_task(self._write_loop())
+        reader = asyncio.create_task(self._read_loop())
+        pinger = asyncio.create_task(self._ping_loop())
+        try:
+            done, _ = await asyncio.wait({reader, pinger, writer}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    print(f"WebSocket connection failed: {task.exception()!r}", file=sys.stderr)
+            if pinger in done:
+                await self._close(1001, "Ping timeout")
+        finally:
+            with _sessions_lock:
+                sessions.discard(self)
+            # Calls still running have nobody left to answer to
+            for task in (reader, pinger, writer, *self._calls):
+                task.cancel()
+
+    async def _close(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _read_loop(self):
+        while True:
+            frame = await self.websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                return
+            self.last_received = time.monotonic()
+            text = frame.get("text")
+            if text is None:
+                text = (frame.get("bytes") or b"").decode("utf-8", errors="replace")
+
+            try:
+                message = json.loads(text)
+            except json.JSONDecodeError:
+                await self.send({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}})
+                continue
+            if not isinstance(message, dict):
+                await self.send({"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request: expected a JSON object"}})
+                continue
+            if "method" not in message:
+                # The client's answer to one of our requests (ping)
+                self._resolve(message)
+                continue
+
+            # Stop reading once WS_MAX_IN_FLIGHT calls are running
+            await self._slots.acquire()
+            call = asyncio.create_task(self._handle(message))
+            self._calls.add(call)
+            call.add_done_callback(self._calls.discard)
+
+    async def _handle(self, message: Dict[str, Any]):
+        self.stats["requests"] += 1
+        self.stats["inFlight"] += 1
+        try:
+            try:
+                response = await self.dispatch(message, self)
+            except Exception as e:
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": message.get("id"),
+                    "error": {"code": -32603, "message": f"Internal error: {str(e)}"}
+                }
+            if response is not None:
+                await self.send(response)
+        finally:
+            self.stats["inFlight"] -= 1
+            self._slots.release()
+
+    async def _write_loop(self):
+        while True:
+            text = await self._outbox.get()
+            try:
+                await self.websocket.send_text(text)
+            except (WebSocketDisconnect, RuntimeError, OSError):
+                return
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if time.monotonic() - self.last_received < self.ping_interval:
+                continue
+            try:
+                await self.request("ping", timeout=self.ping_timeout)
+            except asyncio.TimeoutError:
+                print("WebSocket client did not answer ping; closing", file=sys.stderr)
+                return
+
+    async def send(self, message: Union[Dict[str, Any], str]):
+        """Queue a response, waiting for room if the client is reading slowly."""
+        await self._outbox.put(message if isinstance(message, str) else json.dumps(message))
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        """Queue a notification to the client; dropped if the send queue is full. Call from the event loop."""
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        try:
+            self._outbox.put_nowait(json.dumps(message, default=str))
+        except asyncio.QueueFull:
+            self.stats["notificationsDropped"] += 1
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        """Send a request to the client and wait for its result."""
+        request_id = f"server-{next(self._ids)}"
+        future = self._loop.create_future()
+        self._server_requests[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        try:
+            await self.send(message)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._server_requests.pop(request_id, None)
+
+    def _resolve(self, message: Dict[str, Any]):
+        future = self._server_requests.pop(message.get("id"), None)
+        if future is not None and not future.done():
+            future.set_result(message.get("result"))
+
+    def set_log_level(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Handle ``logging/setLevel``: send log notifications at or above this level."""
+        level = (message.get("params") or {}).get("level")
+        if level not in LOG_LEVELS:
+            return {
+                "jsonrpc": "2.0",
+                "id": message.get("id"),
+                "error": {"code": -32602, "message": f"level must be one of: {', '.join(LOG_LEVELS)}"}
+            }
+        self.log_level = level
+        return {"jsonrpc": "2.0", "id": message.get("id"), "result": {}}
+
+    def log(self, level: str, logger: str, data: Any):
+        """Send a ``notifications/message`` if the client asked for this level. Safe to call from any thread."""
+        if self.log_level is None or LOG_LEVELS.index(level) < LOG_LEVELS.index(self.log_level):
+            return
+        self._loop.call_soon_threadsafe(self.notify, "notifications/message", {"level": level, "logger": logger, "data": data})
+
+
+# Open connections, for log notifications and /metrics
+sessions: Set[WebSocketSession] = set()
+_sessions_lock = threading.Lock()
+
+
+def broadcast_log(level: str, logger: str, data: Any):
+    """Send a log notification to every connection that subscribed to its level."""
+    with _sessions_lock:
+        targets = list(sessions)
+    for session in targets:
+        session.log(level, logger, data)
+
+
+def websocket_stats() -> Dict[str, Any]:
+    with _sessions_lock:
+        targets = list(sessions)
+    return {
+        "connections": len(targets),
+        "inFlight": sum(session.stats["inFlight"] for session in targets),
+        "notificationsDropped": sum(session.stats["notificationsDropped"] for session in targets),
+    }
@@ -0,0 +1,134 @@
+"""
+Pre-forking launcher ("zygote") for stdio MCP sessions.
+
+Starting ``python simple_mcp_server.py`` for every session pays for the
+interpreter and all imports each time. In zygote mode one parent process
+imports everything once, freezes its heap out of the garbage collector
+(so children don't dirty the shared pages) and listens on a Unix socket.
+Each connection is served by a forked child that starts with the warm,
+copy-on-write memory of the parent and talks JSON-RPC lines over the
+socket exactly as it would over stdin/stdout:
+
+    python simple_mcp_server.py --zygote /tmp/mcp.sock
+
+Children are still separate processes, so sessions stay isolated. Only
+modules are preloaded: the Cosmos DB client (threads and sockets) is never
+created in the parent and doesn't cross a fork; each session connects on
+its first storage tool call as usual.
+"""
+
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Callable, Set
+
+# Modules imported in the parent so sessions don't have to
+PRELOAD_MODULES = (
+    "batch_math",
+    "cosmos_storage",
+    "twin_index",
+    "twin_stats",
+    "twin_query",
+    "twin_write_spool",
+)
+
+# Sessions allowed at once; new connections wait in the listen backlog beyond this
+MAX_SESSIONS = int(os.getenv("ZYGOTE_MAX_SESSIONS", "256"))
+
+
+def preload():
+    """Import the storage modules (and with them the Azure SDK) and freeze the heap."""
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except Exception as e:
+            print(f"Warning: could not preload {name}: {str(e)}", file=sys.stderr)
+    gc.collect()
+    # Objects that exist now are never scanned again, so their pages stay shared
+    gc.freeze()
+
+
+def _run_child(connection: socket.socket, run_session: Callable[[], None]):
+    """In the forked child: serve one session on the connection as stdin/stdout, then exit."""
+    status = 0
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.dup2(connection.fileno(), 0)
+        os.dup2(connection.fileno(), 1)
+        connection.close()
+        run_session()
+        sys.stdout.flush()
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        # Skip the parent's atexit handlers and buffered state
+        os._exit(status)
+
+
+def serve_zygote(socket_path: str, run_session: Callable[[], None]):
+    """Listen on a Unix socket and fork a child running ``run_session`` for each connection."""
+    preload()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o077)  # Only this user may connect
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(previous_umask)
+    listener.listen(128)
+
+    children: Set[int] = set()
+
+    def reap(*_):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                children.clear()
+                return
+            if pid == 0:
+                return
+            children.discard(pid)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGCHLD, reap)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"Zygote ready on {socket_path} (pid {os.getpid()})", file=sys.stderr)
+    try:
+        while True:
+            while len(children) >= MAX_SESSIONS:
+                time.sleep(0.05)
+            connection, _ = listener.accept()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Hold SIGCHLD until the child is recorded, so a fast exit is still reaped
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGCHLD})
+            try:
+                pid = os.fork()
+                if pid == 0:
+                    signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+                    listener.close()
+                    _run_child(connection, run_session)
+                children.add(pid)
+            finally:
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGCHLD})
+            connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print(f"Zygote stopped ({len(children)} sessions still running)", file=sys.stderr)